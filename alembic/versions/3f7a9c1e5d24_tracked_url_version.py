@@ -0,0 +1,58 @@
+"""tracked url version
+
+Revision ID: 3f7a9c1e5d24
+Revises: b6f0c2e8d413
+Create Date: 2026-10-19 23:48:31.204117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f7a9c1e5d24'
+down_revision = 'b6f0c2e8d413'
+branch_labels = None
+depends_on = None
+
+
+# Номер версии списка отслеживаемых сериалов увеличивается при каждом его
+# изменении (см. SerialsUrls.read). Триггеры удаляются вместе с таблицей
+# tracked_url, поэтому миграции, которые пересоздают ее (batch_alter_table),
+# должны создавать их заново
+BUMP_VERSION = (
+    "update meta set value = value + 1 where key = 'tracked_url_version'; "
+)
+TRIGGERS = {
+    'tracked_url_version_insert': (
+        f'after insert on tracked_url begin {BUMP_VERSION}end'
+    ),
+    'tracked_url_version_delete': (
+        f'after delete on tracked_url begin {BUMP_VERSION}end'
+    ),
+    'tracked_url_version_update': (
+        f'after update on tracked_url begin {BUMP_VERSION}end'
+    ),
+}
+
+
+def upgrade():
+    op.create_table(
+        'meta',
+        sa.Column('key', sa.String(length=50), nullable=False),
+        sa.Column('value', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('key')
+    )
+    op.execute(
+        "insert into meta(key, value) values ('tracked_url_version', 0)"
+    )
+
+    for name, trigger in TRIGGERS.items():
+        op.execute(f'create trigger {name} {trigger}')
+
+
+def downgrade():
+    for name in TRIGGERS:
+        op.execute(f'drop trigger if exists {name}')
+
+    op.drop_table('meta')
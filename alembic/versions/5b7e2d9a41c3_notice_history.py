@@ -0,0 +1,31 @@
+"""notice history
+
+Revision ID: 5b7e2d9a41c3
+Revises: c13853f886c1
+Create Date: 2026-10-19 18:05:47.203114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7e2d9a41c3'
+down_revision = 'c13853f886c1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'notice_history',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.Float(), nullable=False),
+        sa.Column('data', sa.Text(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('created_at')
+    )
+
+
+def downgrade():
+    op.drop_table('notice_history')
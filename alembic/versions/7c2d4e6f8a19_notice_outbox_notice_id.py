@@ -0,0 +1,77 @@
+"""notice outbox notice id
+
+Revision ID: 7c2d4e6f8a19
+Revises: 3f7a9c1e5d24
+Create Date: 2026-10-20 10:12:44.381527
+
+"""
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2d4e6f8a19'
+down_revision = '3f7a9c1e5d24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """
+    Заменяет ключ идемпотентности (хеш названия плагина и идентификатора
+    уведомления) самим идентификатором уведомления, который передается
+    плагинам. Для уведомлений, уже стоящих в очереди, идентификатором
+    становится их ключ
+    """
+    with op.batch_alter_table('notice_outbox', schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column('notice_id', sa.String(length=40), nullable=True)
+        )
+
+    op.execute('update notice_outbox set notice_id = idempotency_key')
+
+    with op.batch_alter_table('notice_outbox', schema=None) as batch_op:
+        batch_op.alter_column(
+            'notice_id', existing_type=sa.String(length=40), nullable=False
+        )
+        batch_op.drop_column('idempotency_key')
+        batch_op.create_unique_constraint(
+            'notice_outbox_unique_constraint', ['plugin', 'notice_id']
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('notice_outbox', schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column('idempotency_key', sa.String(length=40), nullable=True)
+        )
+
+    session = orm.Session(bind=op.get_bind())
+    for id_, plugin, notice_id in session.execute(
+            'select id, plugin, notice_id from notice_outbox').fetchall():
+        session.execute(
+            'update notice_outbox set idempotency_key = :key where id = :id',
+            {
+                'id': id_,
+                'key': hashlib.sha1(
+                    f'{plugin}\n{notice_id}'.encode('utf-8')
+                ).hexdigest()
+            }
+        )
+    session.commit()
+
+    with op.batch_alter_table('notice_outbox', schema=None) as batch_op:
+        batch_op.alter_column(
+            'idempotency_key', existing_type=sa.String(length=40),
+            nullable=False
+        )
+        batch_op.drop_constraint(
+            'notice_outbox_unique_constraint', type_='unique'
+        )
+        batch_op.drop_column('notice_id')
+        batch_op.create_unique_constraint(
+            'notice_outbox_idempotency_key', ['idempotency_key']
+        )
@@ -0,0 +1,66 @@
+"""serial high water mark
+
+Revision ID: 9d3e5f1a7c20
+Revises: e4a19c7d2b56
+Create Date: 2026-10-19 21:40:12.503118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+
+# revision identifiers, used by Alembic.
+revision = '9d3e5f1a7c20'
+down_revision = 'e4a19c7d2b56'
+branch_labels = None
+depends_on = None
+
+
+def bytes_to_mask(value: bytes) -> int:
+    return int.from_bytes(value or b'', 'little')
+
+
+def upgrade():
+    """
+    Добавляет сериалу номер последнего сезона и последней серии в нем и
+    заполняет их по уже сохраненным сериям
+    """
+    with op.batch_alter_table('serial', schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column('last_season', sa.Integer(), nullable=True)
+        )
+        batch_op.add_column(
+            sa.Column('last_episode', sa.Integer(), nullable=True)
+        )
+
+    session = orm.Session(bind=op.get_bind())
+
+    marks = {}
+    for id_serial, season_number, first_episode, episodes in session.execute(
+            'select id_serial, season_number, first_episode, episodes '
+            'from season'):
+        episodes = bytes_to_mask(episodes)
+        if not episodes:
+            continue
+
+        mark = (season_number, first_episode + episodes.bit_length() - 1)
+        if id_serial not in marks or marks[id_serial] < mark:
+            marks[id_serial] = mark
+
+    for id_serial, (last_season, last_episode) in marks.items():
+        session.execute(
+            'update serial set last_season = :last_season, '
+            'last_episode = :last_episode where id = :id',
+            {
+                'id': id_serial, 'last_season': last_season,
+                'last_episode': last_episode
+            }
+        )
+    session.commit()
+
+
+def downgrade():
+    with op.batch_alter_table('serial', schema=None) as batch_op:
+        batch_op.drop_column('last_episode')
+        batch_op.drop_column('last_season')
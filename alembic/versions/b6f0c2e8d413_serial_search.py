@@ -0,0 +1,71 @@
+"""serial search
+
+Revision ID: b6f0c2e8d413
+Revises: 9d3e5f1a7c20
+Create Date: 2026-10-19 23:05:47.119630
+
+"""
+from alembic import op
+from sqlalchemy.exc import OperationalError
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6f0c2e8d413'
+down_revision = '9d3e5f1a7c20'
+branch_labels = None
+depends_on = None
+
+
+# Буква ё в названиях и в строке поиска заменяется на е, так как их часто
+# используют одну вместо другой (см. DbStorage.search_serials)
+NORMALIZED_NAME = "replace(replace({}.name, 'ё', 'е'), 'Ё', 'Е')"
+
+# Триггеры удаляются вместе с таблицей serial, поэтому миграции, которые
+# пересоздают ее (batch_alter_table), должны создавать их заново
+TRIGGERS = {
+    'serial_search_insert': (
+        'after insert on serial begin '
+        'insert into serial_search(rowid, name) '
+        f'values (new.id, {NORMALIZED_NAME.format("new")}); '
+        'end'
+    ),
+    'serial_search_delete': (
+        'after delete on serial begin '
+        'delete from serial_search where rowid = old.id; '
+        'end'
+    ),
+    'serial_search_update': (
+        'after update of name on serial begin '
+        f'update serial_search set name = {NORMALIZED_NAME.format("new")} '
+        'where rowid = new.id; '
+        'end'
+    ),
+}
+
+
+def upgrade():
+    """
+    Создает полнотекстовый индекс (FTS5) названий сериалов. Если SQLite
+    собран без FTS5, индекс не создается и поиск выполняется без него
+    """
+    try:
+        op.execute(
+            "create virtual table serial_search using fts5(name, prefix='2 3')"
+        )
+    except OperationalError:
+        return
+
+    for name, trigger in TRIGGERS.items():
+        op.execute(f'create trigger {name} {trigger}')
+
+    op.execute(
+        'insert into serial_search(rowid, name) '
+        f'select id, {NORMALIZED_NAME.format("serial")} from serial'
+    )
+
+
+def downgrade():
+    for name in TRIGGERS:
+        op.execute(f'drop trigger if exists {name}')
+
+    op.execute('drop table if exists serial_search')
@@ -0,0 +1,41 @@
+"""notice outbox
+
+Revision ID: c13853f886c1
+Revises: f08138207526
+Create Date: 2026-10-19 16:40:12.518304
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c13853f886c1'
+down_revision = 'f08138207526'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'notice_outbox',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('plugin', sa.String(length=50), nullable=False),
+        sa.Column('idempotency_key', sa.String(length=40), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.Float(), nullable=False),
+        sa.Column('next_attempt_at', sa.Float(), nullable=False),
+        sa.Column('delivered_at', sa.Float(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('idempotency_key')
+    )
+    op.create_index(
+        'ix_notice_outbox_plugin', 'notice_outbox', ['plugin'], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index('ix_notice_outbox_plugin', table_name='notice_outbox')
+    op.drop_table('notice_outbox')
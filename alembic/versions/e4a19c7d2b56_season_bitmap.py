@@ -0,0 +1,118 @@
+"""season bitmap
+
+Revision ID: e4a19c7d2b56
+Revises: 5b7e2d9a41c3
+Create Date: 2026-10-19 19:12:30.841527
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a19c7d2b56'
+down_revision = '5b7e2d9a41c3'
+branch_labels = None
+depends_on = None
+
+
+SEASON_TABLE_ARGS = (
+    'season',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('id_serial', sa.Integer(), nullable=False),
+    sa.Column('season_number', sa.Integer(), nullable=False),
+    sa.Column('first_episode', sa.Integer(), nullable=False),
+    sa.Column('episodes', sa.LargeBinary(), nullable=False),
+    sa.Column('looked', sa.LargeBinary(), nullable=False),
+    sa.ForeignKeyConstraint(['id_serial'], ['serial.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('id_serial', 'season_number')
+)
+
+SERIES_TABLE_ARGS = (
+    'series',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('id_serial', sa.Integer(), nullable=True),
+    sa.Column('series_number', sa.Integer(), nullable=True),
+    sa.Column('season_number', sa.Integer(), nullable=True),
+    sa.Column('looked', sa.Boolean(), nullable=True),
+    sa.ForeignKeyConstraint(['id_serial'], ['serial.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+)
+
+
+def mask_to_bytes(mask: int) -> bytes:
+    return mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+
+
+def bytes_to_mask(value: bytes) -> int:
+    return int.from_bytes(value or b'', 'little')
+
+
+def upgrade():
+    """
+    Собирает серии каждого сезона (строки таблицы series) в одну строку
+    таблицы season с битовыми масками вышедших и просмотренных серий. Серии
+    удаленных сериалов (без id_serial) не переносятся
+    """
+    session = orm.Session(bind=op.get_bind())
+
+    seasons = {}
+    for id_serial, season_number, series_number, looked in session.execute(
+            'select id_serial, season_number, series_number, looked '
+            'from series where id_serial in (select id from serial) and '
+            'season_number is not null and series_number is not null'):
+        seasons.setdefault((id_serial, season_number), []).append(
+            (series_number, looked)
+        )
+
+    rows = []
+    for (id_serial, season_number), series in seasons.items():
+        first_episode = min(i[0] for i in series)
+        episodes = looked = 0
+        for series_number, series_looked in series:
+            bit = 1 << (series_number - first_episode)
+            episodes |= bit
+            if series_looked:
+                looked |= bit
+
+        rows.append({
+            'id_serial': id_serial,
+            'season_number': season_number,
+            'first_episode': first_episode,
+            'episodes': mask_to_bytes(episodes),
+            'looked': mask_to_bytes(looked),
+        })
+
+    season_table = op.create_table(*SEASON_TABLE_ARGS)
+    op.bulk_insert(season_table, rows)
+    session.commit()
+
+    op.drop_table('series')
+
+
+def downgrade():
+    session = orm.Session(bind=op.get_bind())
+
+    rows = []
+    for id_serial, season_number, first_episode, episodes, looked in (
+            session.execute(
+                'select id_serial, season_number, first_episode, episodes, '
+                'looked from season order by id')):
+        episodes = bytes_to_mask(episodes)
+        looked = bytes_to_mask(looked)
+        for i in range(episodes.bit_length()):
+            if episodes >> i & 1:
+                rows.append({
+                    'id_serial': id_serial,
+                    'season_number': season_number,
+                    'series_number': first_episode + i,
+                    'looked': bool(looked >> i & 1),
+                })
+
+    series_table = op.create_table(*SERIES_TABLE_ARGS)
+    op.bulk_insert(series_table, rows)
+    session.commit()
+
+    op.drop_table('season')
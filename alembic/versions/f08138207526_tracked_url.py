@@ -0,0 +1,80 @@
+"""tracked url
+
+Revision ID: f08138207526
+Revises: 2dcf316f847e
+Create Date: 2026-10-19 12:10:41.263118
+
+"""
+import configparser
+from os.path import join, exists
+
+from alembic import op
+import sqlalchemy as sa
+
+import configs as app_conf
+
+
+# revision identifiers, used by Alembic.
+revision = 'f08138207526'
+down_revision = '2dcf316f847e'
+branch_labels = None
+depends_on = None
+
+
+def read_sites_conf(path):
+    """
+    Читает отслеживаемые сериалы из sites.conf, в котором они хранились до
+    появления таблицы tracked_url
+    """
+    cfg_parser = configparser.ConfigParser()
+    cfg_parser.read(path, encoding='utf8')
+
+    rows = []
+    names = set()
+    urls = set()
+    for site in cfg_parser.sections():
+        encoding = cfg_parser[site].get('encoding', '')
+        for line in cfg_parser[site].get('urls', '').split('\n'):
+            if ';' not in line:
+                continue
+
+            name, url = (i.strip() for i in line.split(';', 1))
+            if name in names or url in urls:
+                continue
+
+            names.add(name)
+            urls.add(url)
+            rows.append({
+                'site': site, 'name': name, 'url': url, 'encoding': encoding,
+                'enabled': True
+            })
+
+    return rows
+
+
+def upgrade():
+    tracked_url_table = op.create_table(
+        'tracked_url',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('site', sa.String(length=50), nullable=False),
+        sa.Column('name', sa.String(length=150), nullable=False),
+        sa.Column('url', sa.String(length=500), nullable=False),
+        sa.Column('encoding', sa.String(length=50), nullable=False),
+        sa.Column('enabled', sa.Boolean(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name'),
+        sa.UniqueConstraint('url')
+    )
+    op.create_index(
+        'ix_tracked_url_site', 'tracked_url', ['site'], unique=False
+    )
+
+    # Переносим в таблицу сериалы, которые отслеживались через sites.conf
+    sites_conf_path = join(app_conf.resources_dir, 'sites.conf')
+    if exists(sites_conf_path):
+        op.bulk_insert(tracked_url_table, read_sites_conf(sites_conf_path))
+
+
+def downgrade():
+    op.drop_index('ix_tracked_url_site', table_name='tracked_url')
+    op.drop_table('tracked_url')
@@ -0,0 +1,98 @@
+"""
+Страницы сериалов, повторяющие разметку filin, filmix и seasonvar в той части,
+которую используют парсеры из parsers/services.py
+"""
+from enums import SupportedSites
+
+SITES = tuple(i.value for i in SupportedSites)
+
+# Кодировки, в которых сайты отдают страницы
+ENCODINGS = {
+    SupportedSites.FILIN.value: 'cp1251',
+    SupportedSites.FILMIX.value: 'utf-8',
+    SupportedSites.SEASONVAR.value: 'utf-8',
+}
+
+_FILLER = (
+    '<div class="comment"><span class="author">user</span>'
+    '<p>Комментарий к серии, который парсеру не нужен</p></div>\n'
+)
+
+
+def _filin(name, season, episodes):
+    return (
+        f'<div class="block"><div class="mainf"><noindex>'
+        f'<a href="#">{name} (1-{season} сезон)</a></noindex></div></div>'
+        f'<div class="ssc"><table><tr><td><strong>{episodes} серия</strong>'
+        f'</td></tr></table></div>'
+    )
+
+
+def _filmix(name, season, episodes):
+    return (
+        f'<h1>{name}</h1>'
+        f'<div class="added-info">Добавлена {episodes} серия ({season} '
+        f'сезон)</div>'
+    )
+
+
+def _seasonvar(name, season, episodes):
+    previous = ''.join(
+        f'<h2><a href="#">{name} {i} сезон</a></h2>'
+        for i in range(1, season)
+    )
+    return (
+        f'<div class="svtabr_wrap show seasonlist">{previous}'
+        f'<h2><a href="#">{name} {season} сезон<span> ({episodes} серия)'
+        f'</span></a></h2></div>'
+    )
+
+
+_TEMPLATES = {
+    SupportedSites.FILIN.value: _filin,
+    SupportedSites.FILMIX.value: _filmix,
+    SupportedSites.SEASONVAR.value: _seasonvar,
+}
+
+
+def get_site(number: int) -> str:
+    """
+    Распределяет сериалы по сайтам поровну
+    """
+    return SITES[number % len(SITES)]
+
+
+def get_serial_name(number: int) -> str:
+    return f'Сериал {number}'
+
+
+def get_episode(number: int, revision: int = 0) -> int:
+    """
+    Номер последней серии сериала. С каждой ревизией выходит новая серия
+    """
+    return number % 20 + 1 + revision
+
+
+def build_page(site: str, number: int, revision: int = 0,
+               size: int = 0) -> bytes:
+    """
+    Создает страницу сериала
+    :param site: сайт, разметка которого используется
+    :param number: номер сериала
+    :param revision: ревизия страницы (увеличивает номер последней серии)
+    :param size: минимальный размер страницы в байтах. Страница дополняется
+    данными, которые парсеру не нужны, после блока с информацией о сериях
+    """
+    episode = get_episode(number, revision)
+    body = _TEMPLATES[site](get_serial_name(number), 2, episode)
+    head = (
+        f'<html><head><meta charset="{ENCODINGS[site]}">'
+        f'<title>{get_serial_name(number)}</title></head><body>'
+    )
+    tail = '</body></html>'
+
+    filler_count = max(0, size - len(head) - len(body) - len(tail))
+    filler_count = -(-filler_count // len(_FILLER))
+
+    page = head + body + _FILLER * filler_count + tail
+    return page.encode(ENCODINGS[site])
@@ -0,0 +1,429 @@
+"""
+Нагрузочные тесты загрузчиков, парсера и обновления БД.
+
+Каждый сценарий запускается в отдельном процессе с временной домашней
+дирректорией (своя БД и настройки), поэтому пиковое потребление памяти
+(peak_rss_kb) относится только к этому сценарию. Загрузчики скачивают
+страницы с локального сервера из benchmarks/server.py.
+
+Сценарии:
+    async_downloader, thread_downloader - загрузка страниц всех сериалов
+    parse - разбор скачанных страниц (parse_serial_page)
+    db - обновление БД (DbStorage.upgrade_db, который выполняет DbManager),
+         в каждом запуске у всех сериалов выходит новая серия, после чего
+         замеряется чтение всех сериалов (get_serials_ms) и размер БД
+
+Для каждого сценария выводятся пропускная способность (сериалов в секунду),
+p50/p99 времени одного запуска (run_ms), для загрузчиков - времени загрузки
+одной страницы (request_ms) и для parse - времени разбора одной
+страницы (item_ms).
+
+Пример запуска:
+    python benchmarks/run.py --sizes 100,1000 --scenarios parse,db
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from os.path import join, dirname, abspath
+
+ROOT_DIR = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+SCENARIOS = ('async_downloader', 'thread_downloader', 'parse', 'db')
+DEFAULT_SIZES = '100,1000,10000'
+
+
+def percentile(values: list, percent: float) -> float:
+    values = sorted(values)
+    index = round((len(values) - 1) * percent / 100)
+    return values[index]
+
+
+def summarize(values: list) -> dict:
+    """
+    Статистика по времени выполнения (в мс)
+    """
+    return {
+        'p50': round(percentile(values, 50), 3),
+        'p99': round(percentile(values, 99), 3),
+        'mean': round(statistics.mean(values), 3),
+    }
+
+
+def throughput(size: int, run_ms: list) -> float:
+    """
+    Количество сериалов, обрабатываемых за секунду
+    """
+    return round(size / (statistics.mean(run_ms) / 1000), 1)
+
+
+def get_peak_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        # Модуль resource недоступен в Windows
+        return None
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В macOS значение возвращается в байтах, в linux в килобайтах
+    return peak_rss // 1024 if sys.platform == 'darwin' else peak_rss
+
+
+def write_sites_conf(path, size, page_url):
+    """
+    Создает sites.conf со списком из size сериалов
+    """
+    from benchmarks.fixtures import (
+        SITES, ENCODINGS, get_site, get_serial_name
+    )
+
+    urls = {site: [] for site in SITES}
+    for number in range(size):
+        site = get_site(number)
+        urls[site].append(
+            f'{get_serial_name(number)};{page_url(site, number)}'
+        )
+
+    with open(path, 'w', encoding='utf8') as out:
+        for site in SITES:
+            out.write(f'[{site}]\n')
+            out.write('urls = ' + '\n\t'.join(urls[site]) + '\n')
+            out.write(f'encoding = {ENCODINGS[site]}\n\n')
+
+
+def prepare_environment(size, page_url):
+    """
+    Создает БД и настройки программы в resources_dir и добавляет в список
+    отслеживаемых size сериалов
+    :return: настройки программы и список отслеживаемых сериалов
+    """
+    import configs
+    from config_readers import ConfigsProgram
+    from db.tracked_urls import SerialsUrls
+    from db.utils import apply_migrations
+
+    apply_migrations(configs.base_dir)
+
+    sites_conf_path = join(configs.resources_dir, 'benchmark-sites.conf')
+    write_sites_conf(sites_conf_path, size, page_url)
+    serials_urls = SerialsUrls()
+    serials_urls.import_sites_conf(sites_conf_path)
+
+    conf_program = ConfigsProgram(configs.resources_dir)
+    return conf_program, serials_urls
+
+
+def run_downloader(name, args) -> dict:
+    import asyncio
+
+    import dependency_injector.containers as cnt
+    import dependency_injector.providers as prv
+    from PyQt5 import QtCore
+    from quamash import QEventLoop
+
+    from benchmarks.server import FixtureServer
+    from downloaders import base_downloader, get_downloader
+    from enums import UpgradeState
+    from instrumentation import instrumentation
+
+    server = FixtureServer(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        page_size=int(args.page_size_kb * 1024), error_rate=args.error_rate,
+        reset_rate=args.reset_rate
+    ).start()
+
+    settings, tracked_urls = prepare_environment(args.size, server.page_url)
+    settings.write({
+        'downloader': {
+            'use_proxy': 'false',
+            'check_internet_access_url': server.url,
+            'stream_read': str(args.stream_read).lower(),
+        },
+        'async_downloader': {
+            # Время загрузки ограничивается только размером теста
+            'timeout': '60',
+            'concurrent_requests_count': str(args.concurrency),
+        },
+        'thread_downloader': {
+            'timeout': '60',
+            'thread_count': str(args.threads),
+        },
+    })
+    settings.read()
+
+    class BenchmarkDIServices(cnt.DeclarativeContainer):
+        conf_program = prv.Object(settings)
+        serials_urls = prv.Object(tracked_urls)
+
+    base_downloader.DIServices.override(BenchmarkDIServices)
+
+    app = QtCore.QCoreApplication([])
+    loop = QEventLoop(app)
+    asyncio.set_event_loop(loop)
+
+    # Время загрузки каждой страницы записывают сами загрузчики (см.
+    # RefreshTiming.add_url), подписчик лишь собирает его после каждого запуска
+    request_ms = []
+
+    def collect_request_ms(timing):
+        request_ms.extend(i['latency_ms'] for i in timing.urls)
+
+    instrumentation.add_hook(collect_request_ms)
+
+    downloader = get_downloader(name)()
+    run_ms = []
+    errors = 0
+    with loop:
+        for _ in range(args.repeat):
+            downloader.clear()
+            future = loop.create_future()
+
+            def download_complete(*result):
+                if not future.done():
+                    future.set_result(result)
+
+            downloader.s_download_complete.connect(download_complete)
+            instrumentation.begin(settings['metrics'], 'benchmark')
+            start = time.perf_counter()
+            downloader.start_download()
+            status, error_msgs, urls_errors, downloaded_pages = (
+                loop.run_until_complete(future)
+            )
+            run_ms.append((time.perf_counter() - start) * 1000)
+            instrumentation.finish(status)
+            downloader.s_download_complete.disconnect(download_complete)
+
+            if status == UpgradeState.ERROR:
+                raise RuntimeError('\n'.join(error_msgs))
+            errors += len(urls_errors)
+
+    instrumentation.remove_hook(collect_request_ms)
+    server.stop()
+    return {
+        'run_ms': summarize(run_ms),
+        'request_ms': summarize(request_ms),
+        'throughput_per_s': throughput(args.size, run_ms),
+        'url_errors': errors,
+        'requests': server.requests_count,
+    }
+
+
+def run_parse(args) -> dict:
+    from benchmarks.fixtures import (
+        ENCODINGS, get_site, get_serial_name, build_page
+    )
+    from parsers.services import parse_serial_page
+
+    page_size = int(args.page_size_kb * 1024)
+    downloaded_pages = {}
+    for number in range(args.size):
+        site = get_site(number)
+        downloaded_pages.setdefault(site, []).append([
+            get_serial_name(number), f'http://{site}/{number}',
+            build_page(site, number, size=page_size), ENCODINGS[site]
+        ])
+
+    run_ms = []
+    errors = 0
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        _, parse_errors = parse_serial_page(downloaded_pages)
+        run_ms.append((time.perf_counter() - start) * 1000)
+        errors = len(parse_errors)
+
+    item_ms = []
+    for site, pages in downloaded_pages.items():
+        for page in pages:
+            start = time.perf_counter()
+            parse_serial_page({site: [page]})
+            item_ms.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'run_ms': summarize(run_ms),
+        'item_ms': summarize(item_ms),
+        'throughput_per_s': throughput(args.size, run_ms),
+        'parse_errors': errors,
+    }
+
+
+def run_db(args) -> dict:
+    import configs
+    from benchmarks.fixtures import get_site, get_serial_name, get_episode
+    from db import create_db_session
+    from db.storage import DbStorage
+    from db.utils import apply_migrations
+    from enums import UpgradeState
+
+    apply_migrations(configs.base_dir)
+    storage = DbStorage()
+
+    run_ms = []
+    first_run_ms = None
+    # Первый запуск добавляет сериалы в БД, последующие добавляют новые серии
+    for revision in range(args.repeat + 1):
+        serials_data = {}
+        for number in range(args.size):
+            serials_data.setdefault(get_site(number), {})[
+                get_serial_name(number)
+            ] = (
+                f'http://{get_site(number)}/{number}',
+                {'Серия': [get_episode(number, revision)], 'Сезон': 2}
+            )
+
+        storage.db_session = create_db_session()
+        start = time.perf_counter()
+        status, error_msgs, _ = storage.upgrade_db(serials_data)
+        duration = (time.perf_counter() - start) * 1000
+        storage.db_session.close()
+
+        if status != UpgradeState.OK:
+            raise RuntimeError('\n'.join(error_msgs))
+
+        if revision == 0:
+            first_run_ms = round(duration, 3)
+        else:
+            run_ms.append(duration)
+
+    get_serials_ms = []
+    for _ in range(args.repeat):
+        storage.db_session = create_db_session()
+        start = time.perf_counter()
+        storage.get_serials()
+        get_serials_ms.append((time.perf_counter() - start) * 1000)
+        storage.db_session.close()
+
+    return {
+        'first_run_ms': first_run_ms,
+        'run_ms': summarize(run_ms),
+        'throughput_per_s': throughput(args.size, run_ms),
+        'get_serials_ms': summarize(get_serials_ms),
+        'db_size_kb': os.path.getsize(configs.db_path) // 1024,
+    }
+
+
+def run_child(args):
+    """
+    Выполняет сценарий в текущем процессе и выводит результат в stdout
+    """
+    if args.child in ('async_downloader', 'thread_downloader'):
+        result = run_downloader(args.child, args)
+    elif args.child == 'parse':
+        result = run_parse(args)
+    else:
+        result = run_db(args)
+
+    result.update({
+        'scenario': args.child,
+        'size': args.size,
+        'peak_rss_kb': get_peak_rss_kb(),
+    })
+    print(json.dumps(result))
+
+
+def run_scenario(scenario, size, args) -> dict:
+    with tempfile.TemporaryDirectory() as home:
+        env = dict(os.environ)
+        env.update({'HOME': home, 'MODE': 'prod'})
+
+        command = [
+            sys.executable, abspath(__file__), '--child', scenario,
+            '--size', str(size), '--repeat', str(args.repeat),
+            '--latency-ms', str(args.latency_ms),
+            '--jitter-ms', str(args.jitter_ms),
+            '--page-size-kb', str(args.page_size_kb),
+            '--error-rate', str(args.error_rate),
+            '--reset-rate', str(args.reset_rate),
+            '--concurrency', str(args.concurrency),
+            '--threads', str(args.threads),
+        ]
+        if args.stream_read:
+            command.append('--stream-read')
+
+        try:
+            process = subprocess.run(
+                command, env=env, cwd=ROOT_DIR, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE, universal_newlines=True,
+                timeout=args.timeout
+            )
+        except subprocess.TimeoutExpired:
+            return {
+                'scenario': scenario, 'size': size,
+                'error': f'Превышено время выполнения ({args.timeout} с)'
+            }
+
+    if process.returncode != 0:
+        return {
+            'scenario': scenario, 'size': size,
+            'error': process.stderr.strip().split('\n')[-1]
+        }
+
+    return json.loads(process.stdout.strip().split('\n')[-1])
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--scenarios', default=','.join(SCENARIOS),
+        help='сценарии через запятую'
+    )
+    parser.add_argument(
+        '--sizes', default=DEFAULT_SIZES,
+        help='количество сериалов через запятую'
+    )
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--page-size-kb', type=float, default=32)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--reset-rate', type=float, default=0.0)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--threads', type=int, default=10)
+    parser.add_argument('--stream-read', action='store_true')
+    parser.add_argument(
+        '--timeout', type=float, default=1800,
+        help='максимальное время выполнения одного сценария в секундах'
+    )
+    parser.add_argument('--output', help='файл для сохранения результата')
+    parser.add_argument('--child', choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.child:
+        run_child(args)
+        return
+
+    results = []
+    for size in map(int, args.sizes.split(',')):
+        for scenario in args.scenarios.split(','):
+            result = run_scenario(scenario, size, args)
+            print(json.dumps(result), file=sys.stderr)
+            results.append(result)
+
+    report = json.dumps({
+        'options': {
+            i: getattr(args, i) for i in (
+                'repeat', 'latency_ms', 'jitter_ms', 'page_size_kb',
+                'error_rate', 'reset_rate', 'concurrency', 'threads',
+                'stream_read'
+            )
+        },
+        'results': results,
+    }, indent=2, ensure_ascii=False)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf8') as out:
+            out.write(report)
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
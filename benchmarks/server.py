@@ -0,0 +1,168 @@
+"""
+Локальный HTTP сервер, отдающий страницы сериалов из benchmarks/fixtures.py.
+Позволяет задать задержку ответа, размер страниц, долю ответов с ошибкой и
+долю оборванных соединений.
+
+Страница сериала доступна по адресу /{site}/{number}, где site - название
+сайта, а number - номер сериала. По адресу / отдается короткий ответ (для
+проверки доступа в интернет).
+
+Пример запуска:
+    python benchmarks/server.py --port 8765 --latency-ms 50 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import random
+import sys
+import threading
+from os.path import dirname, abspath
+
+from aiohttp import web
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from benchmarks.fixtures import ENCODINGS, build_page
+
+
+class FixtureServer:
+    """
+    Сервер со страницами сериалов, который работает в отдельном потоке со
+    своим циклом событий
+    """
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=0, jitter_ms=0,
+                 page_size=0, error_rate=0.0, reset_rate=0.0, seed=0):
+        """
+        :param port: порт, 0 - выбрать свободный порт
+        :param latency_ms: задержка перед отправкой ответа
+        :param jitter_ms: случайное отклонение задержки
+        :param page_size: минимальный размер страницы в байтах
+        :param error_rate: доля запросов, на которые возвращается ошибка 500
+        :param reset_rate: доля запросов, для которых соединение закрывается
+        без ответа
+        :param seed: начальное значение генератора случайных чисел
+        """
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.page_size = page_size
+        self.error_rate = error_rate
+        self.reset_rate = reset_rate
+        self.revision = 0
+        self.requests_count = 0
+
+        self._random = random.Random(seed)
+        self._pages = {}
+        self._loop: asyncio.AbstractEventLoop = None
+        self._runner: web.AppRunner = None
+        self._thread: threading.Thread = None
+        self._started = threading.Event()
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.host}:{self.port}/'
+
+    def page_url(self, site: str, number: int) -> str:
+        return f'{self.url}{site}/{number}'
+
+    def set_revision(self, revision: int):
+        """
+        Меняет ревизию страниц, чтобы на них появились новые серии
+        """
+        self.revision = revision
+        self._pages.clear()
+
+    def _get_page(self, site, number) -> bytes:
+        key = (site, number)
+        if key not in self._pages:
+            self._pages[key] = build_page(
+                site, number, self.revision, self.page_size
+            )
+        return self._pages[key]
+
+    async def index(self, request):
+        return web.Response(text='ok')
+
+    async def serial_page(self, request):
+        self.requests_count += 1
+        site = request.match_info['site']
+        if site not in ENCODINGS:
+            raise web.HTTPNotFound()
+
+        delay = self.latency_ms + self._random.uniform(0, self.jitter_ms)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+
+        if self._random.random() < self.reset_rate:
+            request.transport.close()
+            return web.Response()
+
+        if self._random.random() < self.error_rate:
+            raise web.HTTPInternalServerError()
+
+        return web.Response(
+            body=self._get_page(site, int(request.match_info['number'])),
+            content_type='text/html', charset=ENCODINGS[site]
+        )
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/', self.index)
+        app.router.add_get(r'/{site}/{number:\d+}', self.serial_page)
+        return app
+
+    async def _start(self):
+        self._runner = web.AppRunner(self.create_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._start())
+        self._started.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(self._runner.cleanup())
+        self._loop.close()
+
+    def start(self) -> 'FixtureServer':
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--page-size-kb', type=float, default=32)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--reset-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FixtureServer(
+        args.host, args.port, args.latency_ms, args.jitter_ms,
+        int(args.page_size_kb * 1024), args.error_rate, args.reset_rate
+    )
+    web.run_app(
+        server.create_app(), host=args.host, port=args.port, access_log=None
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Замер времени запуска приложения с графическим интерфейсом.
+
+Приложение запускается несколько раз в отдельном процессе с чистой домашней
+дирректорией (новые БД и конфиги). Процесс запускает приложение так же, как
+serial_notifier.py, выводит в stdout время отрисовки главного окна
+(window_painted) и время готовности фоновых обработчиков (services_ready) и
+завершает работу. Результат выводится в stdout в формате JSON.
+
+Пример запуска:
+    python benchmarks/startup.py --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from os.path import dirname, abspath
+
+ROOT_DIR = dirname(dirname(abspath(__file__)))
+STAGES = ('window_painted', 'services_ready')
+
+
+def run_child():
+    """
+    Запускает приложение с графическим интерфейсом и выводит время
+    наступления этапов запуска
+    """
+    sys.path.insert(0, ROOT_DIR)
+    from gui import app
+
+    def report(stage):
+        print(f'{stage} {time.time()}', flush=True)
+
+    window = app.DIServices.main_window()
+    window.s_window_painted.connect(lambda: report('window_painted'))
+    window.s_services_ready.connect(lambda: report('services_ready'))
+    window.s_services_ready.connect(app.DIServices.app().exit)
+    app.run()
+
+
+def run_once(timeout: float) -> dict:
+    """
+    Запускает приложение один раз
+    :return: время (в мс) от запуска процесса до наступления каждого этапа
+    """
+    with tempfile.TemporaryDirectory() as home:
+        env = dict(os.environ)
+        env.update({'HOME': home, 'MODE': 'prod'})
+
+        start = time.time()
+        process = subprocess.run(
+            [sys.executable, abspath(__file__), '--child'], env=env,
+            cwd=ROOT_DIR, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            timeout=timeout, universal_newlines=True
+        )
+
+    timings = {}
+    for line in process.stdout.splitlines():
+        stage, _, timestamp = line.partition(' ')
+        if stage in STAGES:
+            timings[stage] = (float(timestamp) - start) * 1000
+
+    if set(timings) != set(STAGES):
+        raise RuntimeError(
+            f'Приложение завершилось с кодом {process.returncode} не сообщив '
+            f'время запуска:\n{process.stderr}'
+        )
+
+    return timings
+
+
+def percentile(values: list, percent: int) -> float:
+    values = sorted(values)
+    index = round((len(values) - 1) * percent / 100)
+    return values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child()
+        return
+
+    results = {stage: [] for stage in STAGES}
+    for _ in range(args.runs):
+        for stage, value in run_once(args.timeout).items():
+            results[stage].append(value)
+
+    report = {
+        stage: {
+            'runs': len(values),
+            'min_ms': round(min(values), 1),
+            'median_ms': round(statistics.median(values), 1),
+            'p90_ms': round(percentile(values, 90), 1),
+            'max_ms': round(max(values), 1),
+        }
+        for stage, values in results.items()
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
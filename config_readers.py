@@ -1,17 +1,19 @@
-import re
+import os
+import time
 import codecs
+import hashlib
 import logging
 import configparser
 from os.path import join, exists
-from urllib.parse import urlsplit
-
-from enums import SupportedSites
 
 
 class BaseConfigReader:
     """
     Базовый класс для всех парсеров конфигурационных файлов
     """
+    # Точность mtime файловой системы (в секундах)
+    mtime_resolution = 2
+
     def __init__(self, base_dir, conf_name):
         self._logger = logging.getLogger('serial-notifier')
         self._cfg_parser = configparser.ConfigParser()
@@ -23,6 +25,11 @@ class BaseConfigReader:
         self._path = join(base_dir, conf_name)
         self._default_settings = {}
 
+        # Состояние файла на момент последнего чтения: (mtime, размер) и хеш
+        # содержимого. Позволяют не парсить конфиг повторно, если он не менялся
+        self._file_signature = None
+        self._file_hash = None
+
     def init(self):
         """
         Проверяет наличие конфига и если его нет, создает конфиг с
@@ -31,12 +38,58 @@ class BaseConfigReader:
         if not exists(self._path):
             self.write(self._default_settings)
 
-    def read(self):
-        self._data.clear()
+    def _read_if_modified(self):
+        """
+        Читает конфиг, если он изменился с момента последнего чтения
+        :return: содержимое конфига или None, если конфиг не изменился
+        """
+        try:
+            stat = os.stat(self._path)
+        except FileNotFoundError:
+            # Как и configparser, считаем отсутствующий конфиг пустым
+            self._reset_file_state()
+            return ''
+
+        signature = (stat.st_mtime_ns, stat.st_size)
 
+        # Файл, измененный только что, может быть изменен повторно без
+        # изменения mtime, поэтому для него всегда сверяется хеш
+        if (signature == self._file_signature and
+                time.time() - stat.st_mtime > self.mtime_resolution):
+            return None
+
+        with open(self._path, 'rb') as f:
+            content = f.read()
+
+        self._file_signature = signature
+        file_hash = hashlib.md5(content).hexdigest()
+        if file_hash == self._file_hash:
+            return None
+
+        self._file_hash = file_hash
+        return content.decode('utf8')
+
+    def _reset_file_state(self):
+        self._file_signature = None
+        self._file_hash = None
+
+    def read(self):
+        """
+        Читает конфиг. Если файл не изменился с момента последнего чтения, то
+        ранее разобранные данные не сбрасываются
+        :return: 'not_modified', если конфиг не изменился, 'error' в случае
+        ошибки и None, если конфиг был прочитан
+        """
         try:
-            self._cfg_parser.read(self._path, encoding='utf8')
+            content = self._read_if_modified()
+            if content is None:
+                return 'not_modified'
+
+            self._data.clear()
+            self._cfg_parser.read_string(content, source=self._path)
         except Exception:
+            self._data.clear()
+            self._reset_file_state()
             self._logger.critical(
                 f'Ошибка при парсинге конфигурационного файла '
                 f'"{self._conf_name}"', exc_info=True
@@ -56,6 +109,8 @@ class BaseConfigReader:
         with open(self._path, 'w') as out:
             self._cfg_parser.write(out)
 
+        self._reset_file_state()
+
     def get_config_data(self):
         return self._data
 
@@ -84,106 +139,6 @@ class BaseConfigReader:
         return repr(self._data)
 
 
-class SerialsUrls(BaseConfigReader):
-    def __init__(self, base_dir, conf_name='sites.conf'):
-        super().__init__(base_dir, conf_name)
-
-        self.url_sep = ';'
-        self._default_settings = {
-            SupportedSites.FILIN.value: {'urls': '', 'encoding': 'cp1251'},
-            SupportedSites.FILMIX.value: {'urls': '', 'encoding': ''},
-            SupportedSites.SEASONVAR.value: {'urls': '', 'encoding': ''},
-        }
-        self.init()
-        self.read()
-
-    def read(self):
-        error = super().read()
-        if error:
-            return
-
-        data = {}
-        for section, options in self._data.items():
-            data[section] = {}
-            data[section]['urls'] = {}
-            for value in options['urls'].split('\n'):
-                if value != '':
-                    tv_serial_name, tv_serial_url = value.split(self.url_sep)
-                    data[section]['urls'][tv_serial_name] = tv_serial_url
-            data[section]['encoding'] = options.get('encoding', '')
-
-        self._data = data
-
-    def tv_serial_with_same_name_exists(self, tv_serial_name) -> bool:
-        for section_options in self._data.values():
-            if tv_serial_name in section_options.get('urls', {}):
-                return True
-        return False
-
-    def add(self, tv_serial_name, tv_serial_url):
-        """
-        Добавляет новый сериал в список отслеживаемых
-        :param tv_serial_name: название сериала
-        :param tv_serial_url: url сериала
-        """
-        parsed_url = urlsplit(tv_serial_url)
-        try:
-            base_url = parsed_url.netloc.split('.')[0]
-            site = SupportedSites(base_url)
-        except ValueError:
-            msg = 'Введеный сайт не поддерживается приложением'
-            self._logger.error(msg + f' ({tv_serial_url})')
-            raise ValueError(msg)
-
-        urls = self._cfg_parser[site.value]['urls']
-
-        if self.tv_serial_with_same_name_exists(tv_serial_name):
-            raise ValueError('Сериал с таким именем уже существует')
-
-        if parsed_url.path in urls:
-            raise ValueError(
-                'Данный сериал уже отслеживается, но под другим именем'
-            )
-
-        sep = '' if len(urls) == 0 else '\n'
-        self._cfg_parser[site.value]['urls'] += (
-            f'{sep}{tv_serial_name}{self.url_sep}{tv_serial_url}'
-        )
-
-        self.write()
-        self.read()
-
-    def rename(self, old_name, new_name):
-        if self.tv_serial_with_same_name_exists(new_name):
-            raise ValueError('Сериал с таким именем уже существует')
-
-        for section_name, section in self._cfg_parser.items():
-            urls = section.get('urls', None)
-            if urls is not None:
-                section['urls'] = re.sub(
-                    f'(^|\s*)({old_name})({self.url_sep})',
-                    rf'\g<1>{new_name}\g<3>',
-                    urls,
-                    flags=re.UNICODE | re.MULTILINE
-                )
-
-        self.write()
-        self.read()
-
-    def remove(self, serial_name):
-        """
-        Удаляет сериал из списка отслеживаемых
-        :param serial_name: название сериала
-        """
-        for section_name, section in self._cfg_parser.items():
-            for option, value in section.items():
-                self._cfg_parser[section_name][option] = re.sub(
-                    f'{serial_name}{self.url_sep}.*\n?', '', value
-                )
-        self.write()
-        self.read()
-
-
 class ConfigsProgram(BaseConfigReader):
     def __init__(self, base_dir, conf_name='setting.conf'):
         super().__init__(base_dir, conf_name)
@@ -198,7 +153,12 @@ class ConfigsProgram(BaseConfigReader):
                 'use_proxy': True,
                 'pac_file': 'https://antizapret.prostovpn.org/proxy.pac',
                 'target_downloader': 'async_downloader',
-                'check_internet_access_url': 'http://ya.ru'
+                'check_internet_access_url': 'http://ya.ru',
+                # Потоковое чтение страниц с прерыванием загрузки после
+                # получения нужной парсеру части страницы
+                'stream_read': 'false',
+                'stream_chunk_size': '16',
+                'max_body_size': '5'
             },
             'async_downloader': {
                 'timeout': '2',
@@ -210,6 +170,57 @@ class ConfigsProgram(BaseConfigReader):
             },
             'gopac': {
                 'console_encoding': ''
+            },
+            # Запись времени выполнения этапов обновления в JSONL файл
+            'metrics': {
+                'enable': 'false',
+                # Путь к файлу (относительно дирректории с настройками)
+                'path': 'metrics.jsonl',
+                'max_size': '5',
+                'backup_count': '3',
+                # Локальный HTTP сервер с показателями в формате Prometheus
+                'prometheus_enable': 'false',
+                'prometheus_host': '127.0.0.1',
+                'prometheus_port': '9464'
+            },
+            # Профилирование обновлений (см. profiling.py)
+            'profiling': {
+                # Количество профилируемых обновлений после запуска программы
+                # или изменения параметра
+                'cycles': '0',
+                # Количество обновлений, профилируемых по сигналу SIGUSR1
+                'signal_cycles': '1',
+                # Интервал снятия стеков потоков в миллисекундах
+                'sampling_interval': '5'
+            },
+            # Очередь уведомлений потокобезопасных и асинхронных плагинов
+            'notice_outbox': {
+                # Максимальное количество уведомлений, отправляемых пачкой
+                'batch_size': '50',
+                # Задержка перед первой повторной отправкой и максимальная
+                # задержка в секундах
+                'retry_delay': '30',
+                'max_retry_delay': '3600',
+                # Через сколько дней удаляются уведомления из очереди
+                'max_age': '7'
+            },
+            # Объединение уведомлений нескольких обновлений в одно
+            'notice_digest': {
+                # Время в минутах, в течение которого найденные серии
+                # накапливаются и отправляются одним уведомлением (0 -
+                # уведомление отправляется сразу после обновления). Дайджест
+                # отправляется раньше, если пользователь открыл окно
+                'window': '0'
+            },
+            # Доска уведомлений в главном окне
+            'notice_board': {
+                # Количество уведомлений, загружаемых из истории за раз
+                'page_size': '20',
+                # Максимальное количество новых уведомлений на доске, более
+                # старые загружаются из истории при прокрутке
+                'max_notices': '100',
+                # Количество уведомлений, хранимых в истории
+                'history_size': '1000'
             }
         }
         self.converter = {
@@ -218,7 +229,12 @@ class ConfigsProgram(BaseConfigReader):
                 'refresh_interval': lambda i: float(i) * 60000,
             },
             'downloader': {
-                'use_proxy': self._str_to_bool
+                'use_proxy': self._str_to_bool,
+                'stream_read': self._str_to_bool,
+                # конвертируем килобайты в байты
+                'stream_chunk_size': lambda i: int(float(i) * 1024),
+                # конвертируем мегабайты в байты
+                'max_body_size': lambda i: int(float(i) * 1024 * 1024)
             },
             'async_downloader': {
                 # конвертируем минуты в секунды
@@ -232,6 +248,37 @@ class ConfigsProgram(BaseConfigReader):
             },
             'gopac': {
                 'console_encoding': self._lookup_encoding
+            },
+            'metrics': {
+                'enable': self._str_to_bool,
+                'path': lambda i: i,
+                # конвертируем мегабайты в байты
+                'max_size': lambda i: int(float(i) * 1024 * 1024),
+                'backup_count': lambda i: int(i),
+                'prometheus_enable': self._str_to_bool,
+                'prometheus_host': lambda i: i,
+                'prometheus_port': lambda i: int(i)
+            },
+            'profiling': {
+                'cycles': lambda i: int(i),
+                'signal_cycles': lambda i: int(i),
+                'sampling_interval': lambda i: float(i)
+            },
+            'notice_outbox': {
+                'batch_size': lambda i: int(i),
+                'retry_delay': lambda i: float(i),
+                'max_retry_delay': lambda i: float(i),
+                # конвертируем дни в секунды
+                'max_age': lambda i: float(i) * 24 * 60 * 60
+            },
+            'notice_digest': {
+                # конвертируем минуты в секунды
+                'window': lambda i: float(i) * 60
+            },
+            'notice_board': {
+                'page_size': lambda i: int(i),
+                'max_notices': lambda i: int(i),
+                'history_size': lambda i: int(i)
             }
         }
         self.init()
@@ -256,13 +303,17 @@ class ConfigsProgram(BaseConfigReader):
         return value
 
     def read(self):
-        error = super().read()
-        if error:
+        # Конфиг не изменился или его не удалось прочитать
+        if super().read():
             return
 
         for section, options in self.converter.items():
             for option, func in options.items():
-                option_value = self._data[section][option]
+                # Параметры, появившиеся в новых версиях, могут отсутствовать
+                # в уже существующем конфиге
+                option_value = self._data.setdefault(section, {}).get(
+                    option, self._default_settings[section][option]
+                )
                 try:
                     self._data[section][option] = func(option_value)
                 except Exception:
@@ -272,8 +323,8 @@ class ConfigsProgram(BaseConfigReader):
                         f'Будет применено значение по умолчанию.',
                         exc_info=True
                     )
-                    self._data[section][option] = (
-                        self._default_settings[section][option]
+                    self._data[section][option] = func(
+                        str(self._default_settings[section][option])
                     )
 
 
@@ -282,6 +333,3 @@ if __name__ == '__main__':
 
     cp = ConfigsProgram(base_dir)
     print(cp)
-
-    su = SerialsUrls(base_dir)
-    print(su)
@@ -16,7 +16,8 @@ def get_resources_dir():
 
 base_dir = abspath(dirname(__file__))
 resources_dir = get_resources_dir()
-db_url = 'sqlite:///{}'.format(join(resources_dir, 'data-notifier.db'))
+db_path = join(resources_dir, 'data-notifier.db')
+db_url = 'sqlite:///{}'.format(db_path)
 log_path = join(resources_dir, 'log.txt')
 
 app_name = 'Serial Notifier'
@@ -1,36 +1,66 @@
 import logging
+import time
 import traceback
+from queue import Queue, Empty
 
 from PyQt5 import QtCore
 from PyQt5.QtCore import Qt
-from sqlalchemy import and_
 
 from enums import UpgradeState
-from .models import Serial, Series
 from db import create_db_session
+from db.storage import DbStorage
+from instrumentation import instrumentation
+from profiling import profiler
 
 
 class DbManager(QtCore.QThread):
     """
     Выполняет запросы к БД в отдельном потоке, для того, чтобы не
-    блокировать GUI
+    блокировать GUI. Задания выполняются по очереди в порядке поступления
     """
     s_serials_extracted = QtCore.pyqtSignal(object, name='serials_extracted')
+    s_notices_extracted = QtCore.pyqtSignal(
+        object, object, name='notices_extracted'
+    )
+    s_serials_found = QtCore.pyqtSignal(str, list, name='serials_found')
     s_status_update = QtCore.pyqtSignal(
         UpgradeState, list, dict, name='status_update'
     )
 
     def __init__(self, s_send_db_task):
         super(DbManager, self).__init__()
-        self.target = object
         self._logger = logging.getLogger('serial-notifier')
         self.s_send_db_task = s_send_db_task
 
+        # Очередь заданий: (функция, время постановки в очередь)
+        self._tasks = Queue()
         self.db_session = None
+        self.storage = DbStorage()
 
-        self.s_send_db_task.connect(self.fill_target, Qt.QueuedConnection)
+        self.s_send_db_task.connect(self.add_task, Qt.QueuedConnection)
+        # Задание могло быть добавлено, пока поток завершал работу
+        self.finished.connect(self._start_if_needed, Qt.QueuedConnection)
 
     def run(self):
+        with profiler.thread_profile('DbManager'):
+            self._run_tasks()
+
+    def _run_tasks(self):
+        while True:
+            try:
+                func, enqueued_at = self._tasks.get_nowait()
+            except Empty:
+                return
+
+            started = time.perf_counter() if enqueued_at else 0
+            self._run_task(func)
+            if enqueued_at:
+                instrumentation.db_task_done(
+                    self._tasks.qsize(), started - enqueued_at,
+                    time.perf_counter() - started
+                )
+
+    def _run_task(self, func):
         try:
             self.db_session = create_db_session()
         except Exception:
@@ -39,221 +69,72 @@ class DbManager(QtCore.QThread):
             )
             return
 
+        self.storage.db_session = self.db_session
         try:
-            self.target()
+            func()
         except Exception:
             self.db_session.rollback()
             self._logger.error(traceback.format_exc())
         finally:
             self.db_session.close()
 
-    def fill_target(self, func):
-        self.target = func
-        self.start()
-
-    def get_serials(self):
+    def add_task(self, func):
         """
-        Извлекает из базы все сериалы и все данные о них
+        Добавляет задание в очередь и запускает поток, если он не запущен
+        :param func: функция, выполняющая запросы к БД
         """
-        all_serials = self.db_session.query(Serial).all()
+        self._tasks.put((
+            func,
+            time.perf_counter() if instrumentation.db_tasks_observed else 0
+        ))
+        self._start_if_needed()
 
-        result = [self._parse_serial(serial) for serial in all_serials]
-        self.s_serials_extracted.emit(result)
+    def _start_if_needed(self):
+        if not self._tasks.empty() and not self.isRunning():
+            self.start()
 
-    def _parse_serial(self, current_serial):
+    def get_serials(self):
         """
-        Приводит данные о сериале полученные из базы данных в вид необходимый
-        для дальнейшей работы вид.
-        :argument current_serial: Serial сериал данные которого будут
-        разбираться
+        Извлекает из базы все сериалы и все данные о них
         """
-        result = {'name': current_serial.name}
-
-        not_viewed_season = self.db_session.query(
-            Series.season_number.distinct()
-        ).filter(
-            Series.id_serial == current_serial.id, Series.looked.is_(False)
-        ).all()
-
-        result['not_looked_season'] = [i[0] for i in not_viewed_season]
-        result['serial_looked'] = not bool(result['not_looked_season'])
-
-        # Собираем серии в сезоны
-        seasons = {}
-        for j in current_serial.all_series:
-            seasons.setdefault(j.season_number, []).append((j.series_number,
-                                                            j.looked))
-            result['seasons'] = seasons
-
-        return result
+        self.s_serials_extracted.emit(self.storage.get_serials())
 
     def change_status(self, data, status, level):
         """
         Ставит у сериала пометку, что серия/серии просмотрены
         """
-        status = True if status == 'True' else False
-
-        if level == 0:
-            series = self.db_session.query(Series).filter(
-                Serial.name == data['name'], Series.id_serial == Serial.id
-            ).all()
-        elif level == 1:
-            series = self.db_session.query(Series).filter(
-                Serial.name == data['name'], Series.id_serial == Serial.id,
-                Series.season_number == data['season']
-            ).all()
-        elif level == 2:
-            series = self.db_session.query(Series).filter(
-                Serial.name == data['name'], Series.id_serial == Serial.id,
-                Series.season_number == data['season'],
-                Series.series_number == data['series']
-            ).all()
-
-        for i in series:
-            i.looked = status
-
-        try:
-            self.db_session.commit()
-        except Exception:
-            self.db_session.rollback()
-            self._logger.error(
-                f'Не удалось изменит статус.\n{traceback.format_exc()}'
-            )
+        self.storage.change_status(data, status, level)
 
     def upgrade_db(self, serials_data: dict):
         """
         Находит новые данные и загружает их в БД
-
         :param serials_data Данные о сериалах
-        Пример:
-        {'filin.tv': {'Незабываемое': {'Серия': (13,), 'Сезон': 4}}}
         """
-        new_data = {}
+        self.s_status_update.emit(*self.storage.upgrade_db(serials_data))
 
-        for site_name, serials_data in serials_data.items():
-            serials_in_db = tuple(
-                i[0] for i in self.db_session.query(Serial.name).all()
-            )
-            for serial_name, data in serials_data.items():
-                url, data = data
-                if serial_name in serials_in_db:
-                    # Обновляем в базе инфомрацию о сериале
-                    updated_data = self.update_serial(serial_name, data)
-                    if updated_data:
-                        new_data.setdefault(site_name, {})[serial_name] = (
-                            url, updated_data
-                        )
-                else:
-                    # Добавляем в базу информацию о новом сериале
-                    self.add_new_serial(serial_name, data)
-                    new_data.setdefault(site_name, {})[serial_name] = (
-                        url, data
-                    )
-        try:
-            self.db_session.commit()
-            self.s_status_update.emit(UpgradeState.OK, [], new_data)
-        except Exception:
-            self.db_session.rollback()
-            self.s_status_update.emit(
-                UpgradeState.ERROR,
-                ['Не удалось обновить данные в БД'], new_data
+    def rename_serial(self, current_name: str, new_name: str):
+        self.storage.rename_serial(current_name, new_name)
 
-            )
-            self._logger.exception('Не удалось обновить данные в БД.')
+    def remove_serial(self, serial_name: str):
+        self.storage.remove_serial(serial_name)
 
-    def update_serial(self, serial_name, serial_data):
+    def search_serials(self, query: str):
         """
-        Проверяет, что добавляемых о сериале данных нет в БД и если данных
-        действительно нет, то добавляет их
-
-        :param serial_name Название сериала
-        :param serial_data Данные сериала (текущий сезон, новые серии и т д)
+        Ищет сериалы по названию и отправляет id найденных сериалов вместе со
+        строкой поиска
         """
-        current_serial = self.db_session.query(Serial).filter(
-            Serial.name == serial_name,
-        ).first()
-
-        kwargs = {
-            'id_serial': current_serial.id,
-            'season_number': serial_data['Сезон']
-        }
+        self.s_serials_found.emit(query, self.storage.search_serials(query))
 
-        new_data = self._check_updates(serial_name, serial_data['Сезон'],
-                                       serial_data['Серия'])
-
-        if new_data:
-            current_serial.all_series.extend(
-                [Series(series_number=i, **kwargs) for i in new_data['Серия']]
-            )
-            return new_data
-        else:
-            return None
-
-    def add_new_serial(self, serial_name, serial_data):
+    def get_notices(self, before: float, limit: int):
         """
-        Добавляет в базу сериал, которого там ещё нет
-        :param serial_name Название сериала
-        :param serial_data Данные сериала (текущий сезон, серии и т д)
+        Извлекает из истории страницу уведомлений доски уведомлений
         """
-        current_serial = Serial(name=serial_name)
-
-        kwargs = {
-            'id_serial': current_serial.id,
-            'season_number': serial_data['Сезон']
-        }
-
-        current_serial.all_series.extend(
-            [Series(series_number=i, **kwargs) for i in serial_data['Серия']]
+        self.s_notices_extracted.emit(
+            before, self.storage.get_notices(before, limit)
         )
 
-        self.db_session.add(current_serial)
+    def add_notice(self, created_at: float, data: dict, history_size: int):
+        self.storage.add_notice(created_at, data, history_size)
 
-    def rename_serial(self, current_name: str, new_name: str):
-        serial = self.db_session.query(Serial).filter(
-            Serial.name == current_name
-        ).one()
-        serial.name = new_name
-
-        try:
-            self.db_session.commit()
-        except Exception:
-            self.db_session.rollback()
-            self._logger.exception(
-                f'Не удалось переименовать сериал "{current_name}"'
-            )
-
-    def remove_serial(self, serial_name: str):
-        # todo сделать ещё один сигнал через который буду кидать инфу о том
-        #  прошла операция успешно или нет
-        serial = self.db_session.query(Serial).filter(
-            Serial.name == serial_name
-        ).one()
-
-        try:
-            self.db_session.delete(serial)
-            self.db_session.commit()
-        except Exception:
-            self.db_session.rollback()
-            self._logger.exception(
-                f'Не удалось удалить сериал "{serial_name}"'
-            )
-
-    def _check_updates(self, serial_name: str, season: str, series: list):
-        """
-        Проверяет появились новые серии или нет. Если есть новые серии, то
-        возврщаются те, которых нет в базе, если ничего нового не появилось
-        возращается None
-        """
-        res = self.db_session.query(Series.series_number).filter(
-            and_(
-                Serial.name == serial_name,
-                Serial.id == Series.id_serial,
-                Series.season_number == season,
-                Series.series_number.in_(series)
-            )
-        ).all()
-        res = tuple(set(series).difference({i[0] for i in res}))
-        if res:
-            return {'Сезон': season, 'Серия': res}
-        else:
-            return
+    def remove_notice(self, created_at: float):
+        self.storage.remove_notice(created_at)
@@ -1,4 +1,7 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, Boolean
+from sqlalchemy import (
+    Column, ForeignKey, Integer, String, Boolean, Float, Text, LargeBinary,
+    UniqueConstraint
+)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -10,9 +13,39 @@ class Serial(Base):
     __tablename__ = 'serial'
     id = Column(Integer, primary_key=True)
     name = Column(String(150), unique=True)
-    # backref добавляет в объект Series атрибут serial, который ссылается на
+    # backref добавляет в объект Season атрибут serial, который ссылается на
     # родительский объект
-    all_series = relationship('Series', backref='serial')
+    seasons = relationship(
+        'Season', backref='serial', order_by='Season.season_number',
+        cascade='all, delete-orphan'
+    )
+    # Отметка самой новой серии: номер последнего сезона и последней серии в
+    # нем. Если сайт сообщает о серии не новее отметки, серии сериала при
+    # обновлении не сравниваются
+    last_season = Column(Integer)
+    last_episode = Column(Integer)
+
+    @property
+    def high_water_mark(self) -> tuple:
+        """
+        :return: (номер сезона, номер серии) или None, если серий нет
+        """
+        if self.last_season is None:
+            return None
+        return self.last_season, self.last_episode
+
+    def update_high_water_mark(self, season_number: int, numbers):
+        """
+        Сдвигает отметку самой новой серии, если среди серий есть более новая
+        :param season_number: номер сезона
+        :param numbers: номера вышедших серий сезона
+        """
+        if not numbers:
+            return
+
+        mark = (season_number, max(numbers))
+        if self.high_water_mark is None or self.high_water_mark < mark:
+            self.last_season, self.last_episode = mark
 
     def __repr__(self):
         return 'Сериал <{}>'.format(self.name)
@@ -21,20 +54,202 @@ class Serial(Base):
         return 'Сериал <{}>'.format(self.name)
 
 
-class Series(Base):
-    __tablename__ = 'series'
+def mask_to_bytes(mask: int) -> bytes:
+    return mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+
+
+def bytes_to_mask(value: bytes) -> int:
+    return int.from_bytes(value or b'', 'little')
+
+
+def mask_to_numbers(mask: int, first_episode: int) -> list:
+    """
+    :return: номера серий, которым соответствуют установленные биты маски,
+    по возрастанию
+    """
+    return [
+        first_episode + i for i in range(mask.bit_length()) if mask >> i & 1
+    ]
+
+
+class Season(Base):
+    """
+    Серии одного сезона сериала. Вышедшие и просмотренные серии хранятся
+    битовыми масками: бит i соответствует серии first_episode + i. Поэтому
+    на сезон приходится одна строка, а отметка о просмотре всего сезона -
+    это изменение одной строки
+    """
+    __tablename__ = 'season'
+    __table_args__ = (UniqueConstraint('id_serial', 'season_number'),)
+    id = Column(Integer, primary_key=True)
+    id_serial = Column(
+        Integer, ForeignKey('serial.id', ondelete='CASCADE'), nullable=False
+    )
+    season_number = Column(Integer, nullable=False)
+    first_episode = Column(Integer, nullable=False)
+    # Вышедшие серии
+    episodes = Column(LargeBinary, nullable=False, default=b'')
+    # Просмотренные серии
+    looked = Column(LargeBinary, nullable=False, default=b'')
+
+    def get_episodes(self) -> list:
+        """
+        :return: номера вышедших серий по возрастанию
+        """
+        return self._mask_to_numbers(bytes_to_mask(self.episodes))
+
+    def get_looked(self) -> set:
+        """
+        :return: номера просмотренных серий
+        """
+        return set(self._mask_to_numbers(bytes_to_mask(self.looked)))
+
+    @property
+    def all_looked(self) -> bool:
+        episodes = bytes_to_mask(self.episodes)
+        return bytes_to_mask(self.looked) & episodes == episodes
+
+    def _mask_to_numbers(self, mask: int) -> list:
+        return mask_to_numbers(mask, self.first_episode)
+
+    def _numbers_to_mask(self, numbers) -> int:
+        mask = 0
+        for number in numbers:
+            if number >= self.first_episode:
+                mask |= 1 << (number - self.first_episode)
+        return mask
+
+    def add_episodes(self, numbers) -> list:
+        """
+        Добавляет вышедшие серии
+        :param numbers: номера серий
+        :return: номера серий, которых еще не было в сезоне, по возрастанию
+        """
+        numbers = sorted(set(numbers))
+        if not numbers:
+            return []
+
+        episodes = bytes_to_mask(self.episodes)
+        looked = bytes_to_mask(self.looked)
+        if self.first_episode is None:
+            self.first_episode = numbers[0]
+        elif numbers[0] < self.first_episode:
+            # Маски сдвигаются так, чтобы первый бит соответствовал новой
+            # первой серии
+            shift = self.first_episode - numbers[0]
+            episodes <<= shift
+            looked <<= shift
+            self.first_episode = numbers[0]
+
+        new_numbers = [
+            i for i in numbers if not episodes >> (i - self.first_episode) & 1
+        ]
+        self.episodes = mask_to_bytes(
+            episodes | self._numbers_to_mask(new_numbers)
+        )
+        self.looked = mask_to_bytes(looked)
+        return new_numbers
+
+    def set_looked(self, status: bool, numbers=None):
+        """
+        Отмечает серии просмотренными или не просмотренными
+        :param numbers: номера серий, None - все серии сезона
+        """
+        episodes = bytes_to_mask(self.episodes)
+        mask = episodes
+        if numbers is not None:
+            mask &= self._numbers_to_mask(numbers)
+
+        looked = bytes_to_mask(self.looked)
+        looked = looked | mask if status else looked & ~mask
+        self.looked = mask_to_bytes(looked)
+
+    def __repr__(self):
+        return '{} (сезон {})'.format(self.serial.name, self.season_number)
+
+    def __str__(self):
+        return '{} (сезон {})'.format(self.serial.name, self.season_number)
+
+
+class TrackedUrl(Base):
+    """
+    Отслеживаемая страница сериала
+    """
+    __tablename__ = 'tracked_url'
+    id = Column(Integer, primary_key=True)
+    site = Column(String(50), nullable=False, index=True)
+    name = Column(String(150), nullable=False, unique=True)
+    url = Column(String(500), nullable=False, unique=True)
+    # Кодировка страницы, пустая строка - кодировка берется из ответа сервера
+    encoding = Column(String(50), nullable=False, default='')
+    enabled = Column(Boolean(), nullable=False, default=True)
+
+    def __repr__(self):
+        return 'Страница сериала <{}: {}>'.format(self.name, self.url)
+
+    def __str__(self):
+        return 'Страница сериала <{}: {}>'.format(self.name, self.url)
+
+
+class NoticeOutbox(Base):
+    """
+    Уведомление, ожидающее отправки плагином
+    """
+    __tablename__ = 'notice_outbox'
+    __table_args__ = (
+        UniqueConstraint(
+            'plugin', 'notice_id', name='notice_outbox_unique_constraint'
+        ),
+    )
     id = Column(Integer, primary_key=True)
-    id_serial = Column(Integer, ForeignKey('serial.id', ondelete='CASCADE'))
-    series_number = Column(Integer)
-    season_number = Column(Integer)
-    looked = Column(Boolean(), default=False)
+    plugin = Column(String(50), nullable=False, index=True)
+    # Идентификатор уведомления (см. OutboxStorage.get_notice_id), передается
+    # плагину при каждой попытке отправки
+    notice_id = Column(String(40), nullable=False)
+    # Данные уведомления в формате JSON
+    payload = Column(Text, nullable=False)
+    # Время в формате unix time
+    created_at = Column(Float, nullable=False)
+    next_attempt_at = Column(Float, nullable=False)
+    delivered_at = Column(Float)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text)
+
+    def __repr__(self):
+        return 'Уведомление <{}: {}>'.format(self.plugin, self.id)
+
+    def __str__(self):
+        return 'Уведомление <{}: {}>'.format(self.plugin, self.id)
+
+
+class NoticeHistory(Base):
+    """
+    Уведомление, показанное на доске уведомлений
+    """
+    __tablename__ = 'notice_history'
+    id = Column(Integer, primary_key=True)
+    # Время в формате unix time, идентифицирует уведомление на доске
+    created_at = Column(Float, nullable=False, unique=True)
+    # Данные о новых сериях в формате JSON
+    data = Column(Text, nullable=False)
+
+    def __repr__(self):
+        return 'Уведомление на доске <{}>'.format(self.created_at)
+
+    def __str__(self):
+        return 'Уведомление на доске <{}>'.format(self.created_at)
+
+
+class Meta(Base):
+    """
+    Служебные значения БД
+    """
+    __tablename__ = 'meta'
+    key = Column(String(50), primary_key=True)
+    value = Column(Integer, nullable=False)
 
     def __repr__(self):
-        return '{} (сезон {}, серия {})'.format(self.serial.name,
-                                                self.season_number,
-                                                self.series_number)
+        return 'Значение <{}: {}>'.format(self.key, self.value)
 
     def __str__(self):
-        return '{} (сезон {}, серия {})'.format(self.serial.name,
-                                                self.season_number,
-                                                self.series_number)
+        return 'Значение <{}: {}>'.format(self.key, self.value)
@@ -0,0 +1,151 @@
+"""
+Очередь уведомлений, ожидающих отправки плагинами (таблица notice_outbox)
+"""
+import hashlib
+import json
+import time
+from contextlib import contextmanager
+
+from sqlalchemy.orm.session import Session
+
+from db import create_db_session
+from db.models import NoticeOutbox
+
+
+class OutboxStorage:
+    """
+    Запросы к таблице notice_outbox. Методы выполняются в отдельном потоке
+    (см. notice_outbox.OutboxDispatcher), каждый в своей сессии
+    """
+    @contextmanager
+    def _session(self) -> Session:
+        db_session = create_db_session()
+        try:
+            yield db_session
+            db_session.commit()
+        except Exception:
+            db_session.rollback()
+            raise
+        finally:
+            db_session.close()
+
+    @staticmethod
+    def get_notice_id(created_at: float, payload: str) -> str:
+        """
+        Идентификатор уведомления: хеш времени его создания и данных. Не
+        меняется при повторных попытках отправки, поэтому по нему получатель
+        может отбросить уже полученное уведомление
+        """
+        return hashlib.sha1(
+            f'{created_at!r}\n{payload}'.encode('utf-8')
+        ).hexdigest()
+
+    def enqueue(self, plugins: list, payload: dict) -> str:
+        """
+        Ставит уведомление в очередь каждого из плагинов
+        :param plugins: названия плагинов
+        :param payload: данные уведомления
+        :return: идентификатор уведомления
+        """
+        payload = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+        now = time.time()
+        notice_id = self.get_notice_id(now, payload)
+
+        with self._session() as db_session:
+            db_session.add_all([
+                NoticeOutbox(
+                    plugin=plugin, notice_id=notice_id, payload=payload,
+                    created_at=now, next_attempt_at=now, attempts=0
+                ) for plugin in plugins
+            ])
+
+        return notice_id
+
+    def get_due(self, plugin: str, limit: int) -> list:
+        """
+        :return: уведомления плагина, время отправки которых наступило, в
+        порядке добавления: [(id, идентификатор уведомления, данные
+        уведомления, количество попыток)]
+        """
+        with self._session() as db_session:
+            rows = db_session.query(
+                NoticeOutbox.id, NoticeOutbox.notice_id, NoticeOutbox.payload,
+                NoticeOutbox.attempts
+            ).filter(
+                NoticeOutbox.plugin == plugin,
+                NoticeOutbox.delivered_at.is_(None),
+                NoticeOutbox.next_attempt_at <= time.time()
+            ).order_by(NoticeOutbox.id).limit(limit).all()
+
+        return [(id_, notice_id, json.loads(payload), attempts)
+                for id_, notice_id, payload, attempts in rows]
+
+    def ack(self, ids: list):
+        """
+        Отмечает уведомления доставленными
+        """
+        with self._session() as db_session:
+            db_session.query(NoticeOutbox).filter(
+                NoticeOutbox.id.in_(ids)
+            ).update(
+                {NoticeOutbox.delivered_at: time.time()},
+                synchronize_session=False
+            )
+
+    def fail(self, ids: list, error: str, retry_delay: float,
+             max_retry_delay: float):
+        """
+        Откладывает отправку уведомлений. Задержка удваивается после каждой
+        неудачной попытки
+        """
+        now = time.time()
+        with self._session() as db_session:
+            for row in db_session.query(NoticeOutbox).filter(
+                    NoticeOutbox.id.in_(ids)):
+                row.next_attempt_at = now + min(
+                    max_retry_delay, retry_delay * 2 ** row.attempts
+                )
+                row.attempts += 1
+                row.last_error = error
+
+    def get_pending_plugins(self) -> set:
+        """
+        :return: названия плагинов, у которых есть недоставленные уведомления
+        """
+        with self._session() as db_session:
+            return {
+                i[0] for i in db_session.query(
+                    NoticeOutbox.plugin.distinct()
+                ).filter(NoticeOutbox.delivered_at.is_(None))
+            }
+
+    def get_next_attempt_at(self, plugin: str) -> float:
+        """
+        :return: время ближайшей попытки отправки уведомления плагином или
+        None, если очередь плагина пуста
+        """
+        with self._session() as db_session:
+            return db_session.query(
+                NoticeOutbox.next_attempt_at
+            ).filter(
+                NoticeOutbox.plugin == plugin,
+                NoticeOutbox.delivered_at.is_(None)
+            ).order_by(NoticeOutbox.next_attempt_at).limit(1).scalar()
+
+    def purge(self, max_age: float) -> int:
+        """
+        Удаляет доставленные уведомления и уведомления, которые не удалось
+        доставить, старше max_age секунд
+        :return: количество удаленных недоставленных уведомлений
+        """
+        created_before = time.time() - max_age
+        with self._session() as db_session:
+            undelivered = db_session.query(NoticeOutbox).filter(
+                NoticeOutbox.created_at < created_before,
+                NoticeOutbox.delivered_at.is_(None)
+            ).delete(synchronize_session=False)
+            db_session.query(NoticeOutbox).filter(
+                NoticeOutbox.created_at < created_before
+            ).delete(synchronize_session=False)
+
+        return undelivered
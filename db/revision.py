@@ -0,0 +1,5 @@
+# Ревизия последней миграции alembic. Позволяет при запуске приложения
+# проверить актуальность БД без загрузки alembic. Обновляется скриптом
+# tools/update_head_revision.py, который нужно запускать после добавления
+# новой миграции (также вызывается при сборке пакета)
+HEAD_REVISION = '7c2d4e6f8a19'
@@ -0,0 +1,439 @@
+import json
+import logging
+import os
+import re
+import traceback
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.session import Session
+
+from enums import UpgradeState
+from .models import (
+    Serial, Season, NoticeHistory, bytes_to_mask, mask_to_numbers
+)
+
+# Переменная окружения, включающая сверку индекса известных серий с БД после
+# каждого изменения (для тестов)
+CHECK_INDEX_ENV = 'SERIAL_NOTIFIER_CHECK_INDEX'
+
+
+class DbStorage:
+    """
+    Запросы к БД, не зависящие от Qt. Используется DbManager`ом и
+    консольными режимами работы приложения
+    """
+    def __init__(self, check_index: bool = None):
+        """
+        :param check_index: сверять индекс известных серий с БД после
+        каждого изменения, по умолчанию включается переменной окружения
+        SERIAL_NOTIFIER_CHECK_INDEX
+        """
+        self._logger = logging.getLogger('serial-notifier')
+
+        # Сессия устанавливается перед выполнением каждого задания
+        self.db_session: Session = None
+
+        # Индекс известных серий: название сериала -> {номер сезона: номера
+        # серий}. Загружается при первом обращении и изменяется вместе с БД,
+        # поэтому при обновлении новые серии находятся без запросов к БД.
+        # None - индекс не загружен
+        self._known_episodes: dict = None
+        # Отметки самой новой серии (Serial.high_water_mark) сериалов, у
+        # которых есть серии. Загружаются и изменяются вместе с индексом
+        self._high_water_marks: dict = None
+        if check_index is None:
+            check_index = bool(os.environ.get(CHECK_INDEX_ENV))
+        self.check_index = check_index
+
+    def get_serials(self):
+        """
+        Извлекает из базы все сериалы и все данные о них
+        """
+        # Сезоны всех сериалов загружаются одним запросом
+        all_serials = self.db_session.query(Serial).options(
+            selectinload(Serial.seasons)
+        ).all()
+
+        serials = [self._parse_serial(serial) for serial in all_serials]
+        if self._known_episodes is None:
+            # Индекс строится по уже загруженным сериалам
+            self._known_episodes = {
+                serial['name']: {
+                    number: {i[0] for i in episodes}
+                    for number, episodes in serial.get('seasons', {}).items()
+                }
+                for serial in serials
+            }
+            self._high_water_marks = {
+                serial.name: serial.high_water_mark for serial in all_serials
+                if serial.high_water_mark is not None
+            }
+
+        return serials
+
+    def _load_known_episodes(self) -> tuple:
+        """
+        Извлекает из базы номера вышедших серий всех сериалов
+        :return: {название сериала: {номер сезона: номера серий}} и
+        {название сериала: отметка самой новой серии}
+        """
+        known_episodes = {}
+        high_water_marks = {}
+        rows = self.db_session.query(
+            Serial.name, Serial.last_season, Serial.last_episode,
+            Season.season_number, Season.first_episode, Season.episodes
+        ).outerjoin(Serial.seasons)
+
+        for (name, last_season, last_episode, season_number, first_episode,
+             episodes) in rows:
+            seasons = known_episodes.setdefault(name, {})
+            if last_season is not None:
+                high_water_marks[name] = (last_season, last_episode)
+            if season_number is not None:
+                seasons[season_number] = set(
+                    mask_to_numbers(bytes_to_mask(episodes), first_episode)
+                )
+
+        return known_episodes, high_water_marks
+
+    def _get_known_episodes(self) -> dict:
+        if self._known_episodes is None:
+            self._known_episodes, self._high_water_marks = (
+                self._load_known_episodes()
+            )
+        return self._known_episodes
+
+    def _check_known_episodes(self):
+        """
+        Сверяет индекс известных серий с БД, если включен режим проверки
+        :raises RuntimeError: индекс не совпадает с БД
+        """
+        if not self.check_index or self._known_episodes is None:
+            return
+
+        known_episodes, high_water_marks = self._load_known_episodes()
+        names = sorted(
+            name
+            for name in known_episodes.keys() | self._known_episodes.keys()
+            if known_episodes.get(name) != self._known_episodes.get(name) or
+            high_water_marks.get(name) != self._high_water_marks.get(name)
+        )
+        if names:
+            raise RuntimeError(
+                f'Индекс известных серий не совпадает с БД: {", ".join(names)}'
+            )
+
+    def _parse_serial(self, current_serial):
+        """
+        Приводит данные о сериале полученные из базы данных в вид необходимый
+        для дальнейшей работы вид.
+        :argument current_serial: Serial сериал данные которого будут
+        разбираться
+        """
+        result = {'id': current_serial.id, 'name': current_serial.name}
+
+        # Собираем серии в сезоны
+        seasons = {}
+        not_looked_season = []
+        for season in current_serial.seasons:
+            looked = season.get_looked()
+            seasons[season.season_number] = [
+                (i, i in looked) for i in season.get_episodes()
+            ]
+            if not season.all_looked:
+                not_looked_season.append(season.season_number)
+
+        result['not_looked_season'] = not_looked_season
+        result['serial_looked'] = not bool(not_looked_season)
+        if seasons:
+            result['seasons'] = seasons
+
+        return result
+
+    def change_status(self, data, status, level):
+        """
+        Ставит у сериала пометку, что серия/серии просмотрены
+        """
+        status = True if status == 'True' else False
+
+        seasons = self.db_session.query(Season).join(Serial).filter(
+            Serial.name == data['name']
+        )
+        if level in (1, 2):
+            seasons = seasons.filter(
+                Season.season_number == int(data['season'])
+            )
+        episodes = [int(data['series'])] if level == 2 else None
+
+        for season in seasons:
+            season.set_looked(status, episodes)
+
+        try:
+            self.db_session.commit()
+        except Exception:
+            self.db_session.rollback()
+            self._logger.error(
+                f'Не удалось изменит статус.\n{traceback.format_exc()}'
+            )
+
+    def upgrade_db(self, serials_data: dict) -> tuple:
+        """
+        Находит новые данные и загружает их в БД
+
+        :param serials_data Данные о сериалах
+        Пример:
+        {'filin.tv': {'Незабываемое': {'Серия': (13,), 'Сезон': 4}}}
+        :return: статус обновления, список ошибок и новые серии
+        """
+        new_data = {}
+        known_episodes = self._get_known_episodes()
+
+        try:
+            for site_name, serials_data in serials_data.items():
+                for serial_name, data in serials_data.items():
+                    url, data = data
+                    if serial_name in known_episodes:
+                        # Обновляем в базе инфомрацию о сериале
+                        updated_data = self.update_serial(serial_name, data)
+                        if updated_data:
+                            new_data.setdefault(site_name, {})[
+                                serial_name
+                            ] = (url, updated_data)
+                    else:
+                        # Добавляем в базу информацию о новом сериале
+                        self.add_new_serial(serial_name, data)
+                        new_data.setdefault(site_name, {})[serial_name] = (
+                            url, data
+                        )
+
+            self.db_session.commit()
+        except Exception:
+            self.db_session.rollback()
+            # В индекс могли попасть серии, которые не были сохранены
+            self._known_episodes = self._high_water_marks = None
+            self._logger.exception('Не удалось обновить данные в БД.')
+            return (
+                UpgradeState.ERROR, ['Не удалось обновить данные в БД'],
+                new_data
+            )
+
+        self._check_known_episodes()
+        return UpgradeState.OK, [], new_data
+
+    def update_serial(self, serial_name, serial_data):
+        """
+        Проверяет, что добавляемых о сериале данных нет в БД и если данных
+        действительно нет, то добавляет их
+
+        :param serial_name Название сериала
+        :param serial_data Данные сериала (текущий сезон, новые серии и т д)
+        """
+        known_seasons = self._get_known_episodes()[serial_name]
+        mark = self._high_water_marks.get(serial_name)
+        if mark is not None and serial_data['Серия'] and (
+                serial_data['Сезон'], max(serial_data['Серия'])) <= mark:
+            # Сайт сообщает о серии не новее уже известной. Более старые
+            # серии, пропущенные ранее, в этом случае не ищутся
+            return None
+
+        known = known_seasons.get(serial_data['Сезон'], set())
+        if known.issuperset(serial_data['Серия']):
+            # Все серии уже есть в БД
+            return None
+
+        current_serial = self.db_session.query(Serial).filter(
+            Serial.name == serial_name,
+        ).first()
+
+        season = self.db_session.query(Season).filter(
+            Season.id_serial == current_serial.id,
+            Season.season_number == serial_data['Сезон']
+        ).first()
+        if season is None:
+            if not serial_data['Серия']:
+                return None
+            season = Season(season_number=serial_data['Сезон'])
+            current_serial.seasons.append(season)
+
+        new_series = season.add_episodes(serial_data['Серия'])
+        current_serial.update_high_water_mark(
+            serial_data['Сезон'], serial_data['Серия']
+        )
+        known_seasons[serial_data['Сезон']] = set(season.get_episodes())
+        self._high_water_marks[serial_name] = current_serial.high_water_mark
+        if new_series:
+            return {'Сезон': serial_data['Сезон'], 'Серия': tuple(new_series)}
+        else:
+            return None
+
+    def add_new_serial(self, serial_name, serial_data):
+        """
+        Добавляет в базу сериал, которого там ещё нет
+        :param serial_name Название сериала
+        :param serial_data Данные сериала (текущий сезон, серии и т д)
+        """
+        current_serial = Serial(name=serial_name)
+
+        if serial_data['Серия']:
+            season = Season(season_number=serial_data['Сезон'])
+            season.add_episodes(serial_data['Серия'])
+            current_serial.seasons.append(season)
+            current_serial.update_high_water_mark(
+                serial_data['Сезон'], serial_data['Серия']
+            )
+
+        self.db_session.add(current_serial)
+        self._get_known_episodes()[serial_name] = {
+            season.season_number: set(season.get_episodes())
+            for season in current_serial.seasons
+        }
+        if current_serial.high_water_mark is not None:
+            self._high_water_marks[serial_name] = (
+                current_serial.high_water_mark
+            )
+
+    def rename_serial(self, current_name: str, new_name: str):
+        serial = self.db_session.query(Serial).filter(
+            Serial.name == current_name
+        ).one()
+        serial.name = new_name
+
+        try:
+            self.db_session.commit()
+        except Exception:
+            self.db_session.rollback()
+            self._logger.exception(
+                f'Не удалось переименовать сериал "{current_name}"'
+            )
+            return
+
+        if self._known_episodes is not None:
+            self._known_episodes[new_name] = self._known_episodes.pop(
+                current_name, {}
+            )
+            if current_name in self._high_water_marks:
+                self._high_water_marks[new_name] = (
+                    self._high_water_marks.pop(current_name)
+                )
+            self._check_known_episodes()
+
+    def remove_serial(self, serial_name: str):
+        # todo сделать ещё один сигнал через который буду кидать инфу о том
+        #  прошла операция успешно или нет
+        serial = self.db_session.query(Serial).filter(
+            Serial.name == serial_name
+        ).one()
+
+        try:
+            self.db_session.delete(serial)
+            self.db_session.commit()
+        except Exception:
+            self.db_session.rollback()
+            self._logger.exception(
+                f'Не удалось удалить сериал "{serial_name}"'
+            )
+            return
+
+        if self._known_episodes is not None:
+            self._known_episodes.pop(serial_name, None)
+            self._high_water_marks.pop(serial_name, None)
+            self._check_known_episodes()
+
+    def search_serials(self, query: str, limit: int = None) -> list:
+        """
+        Ищет сериалы по названию. Сначала ищутся названия, в которых есть
+        слова, начинающиеся с каждого слова запроса (в любом порядке), если
+        таких нет - названия, содержащие запрос целиком. Буквы ё и е не
+        различаются
+        :param query: строка поиска
+        :param limit: максимальное количество найденных сериалов
+        :return: id найденных сериалов, более подходящие первыми
+        """
+        query = query.strip().casefold().replace('ё', 'е')
+        words = re.findall(r'\w+', query)
+        serial_ids = []
+        if words:
+            try:
+                serial_ids = [
+                    row[0] for row in self.db_session.execute(
+                        text(
+                            'select rowid from serial_search '
+                            'where serial_search match :match '
+                            'order by rank limit :limit'
+                        ),
+                        {
+                            'match': ' '.join(f'"{i}"*' for i in words),
+                            'limit': -1 if limit is None else limit
+                        }
+                    )
+                ]
+            except OperationalError:
+                # Индекса нет, если SQLite собран без FTS5
+                self.db_session.rollback()
+
+        if serial_ids:
+            return serial_ids
+
+        serial_ids = [
+            serial_id for serial_id, name in self.db_session.query(
+                Serial.id, Serial.name
+            ).order_by(Serial.name)
+            if query in name.casefold().replace('ё', 'е')
+        ]
+        return serial_ids[:limit]
+
+    def get_notices(self, before: float = None, limit: int = 20) -> list:
+        """
+        Извлекает уведомления доски уведомлений от новых к старым
+        :param before: извлекаются уведомления, созданные раньше этого
+        времени (None - самые новые)
+        :param limit: количество уведомлений
+        :return: [(время создания, данные о новых сериях)]
+        """
+        query = self.db_session.query(
+            NoticeHistory.created_at, NoticeHistory.data
+        )
+        if before is not None:
+            query = query.filter(NoticeHistory.created_at < before)
+
+        notices = query.order_by(
+            NoticeHistory.created_at.desc()
+        ).limit(limit).all()
+        return [(created_at, json.loads(data)) for created_at, data in notices]
+
+    def add_notice(self, created_at: float, data: dict, history_size: int):
+        """
+        Сохраняет уведомление доски уведомлений
+        :param history_size: максимальное количество хранимых уведомлений,
+        более старые удаляются
+        """
+        self.db_session.add(NoticeHistory(
+            created_at=created_at, data=json.dumps(data, ensure_ascii=False)
+        ))
+
+        oldest = self.db_session.query(NoticeHistory.created_at).order_by(
+            NoticeHistory.created_at.desc()
+        ).offset(history_size - 1).limit(1).scalar()
+        if oldest is not None:
+            self.db_session.query(NoticeHistory).filter(
+                NoticeHistory.created_at < oldest
+            ).delete(synchronize_session=False)
+
+        try:
+            self.db_session.commit()
+        except Exception:
+            self.db_session.rollback()
+            self._logger.exception('Не удалось сохранить уведомление')
+
+    def remove_notice(self, created_at: float):
+        self.db_session.query(NoticeHistory).filter(
+            NoticeHistory.created_at == created_at
+        ).delete(synchronize_session=False)
+
+        try:
+            self.db_session.commit()
+        except Exception:
+            self.db_session.rollback()
+            self._logger.exception('Не удалось удалить уведомление')
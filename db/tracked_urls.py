@@ -0,0 +1,282 @@
+"""
+Список отслеживаемых сериалов, который хранится в таблице tracked_url
+"""
+import configparser
+import logging
+import sqlite3
+from contextlib import contextmanager
+from os.path import exists
+from urllib.parse import urlsplit
+
+from sqlalchemy.orm.session import Session
+
+from configs import db_path
+from db import create_db_session
+from db.models import TrackedUrl
+from enums import SupportedSites
+
+# Кодировка страниц сайта, используемая если для сериала она не указана
+DEFAULT_ENCODINGS = {
+    SupportedSites.FILIN.value: 'cp1251',
+    SupportedSites.FILMIX.value: '',
+    SupportedSites.SEASONVAR.value: '',
+}
+
+
+class SerialsUrls:
+    """
+    Отслеживаемые сериалы. Предоставляет данные в том же формате, в котором
+    они раньше читались из sites.conf:
+    {site: {'urls': {name: url}, 'encodings': {name: encoding},
+            'encoding': encoding}}
+
+    Перед созданием объекта к БД должны быть применены миграции
+    (db.utils.apply_migrations)
+    """
+    # Разделитель названия сериала и url в sites.conf
+    url_sep = ';'
+
+    def __init__(self):
+        self._logger = logging.getLogger('serial-notifier')
+        self._data = {}
+
+        # Отдельное соединение используется только для чтения версии списка
+        # сериалов, которую триггеры таблицы tracked_url увеличивают при
+        # каждом ее изменении (в том числе другими процессами)
+        self._version_connection: sqlite3.Connection = None
+        self._data_version = None
+
+        self.read()
+
+    @contextmanager
+    def _session(self) -> Session:
+        db_session = create_db_session()
+        try:
+            yield db_session
+            db_session.commit()
+        except Exception:
+            db_session.rollback()
+            raise
+        finally:
+            db_session.close()
+
+    def _get_data_version(self) -> int:
+        """
+        :return: версия списка сериалов или None, если в БД ее нет
+        """
+        if self._version_connection is None:
+            # sqlite3 создает пустой файл БД, а схему БД должны создавать
+            # миграции (apply_migrations), поэтому до их применения версия
+            # не читается
+            if not exists(db_path):
+                return None
+            self._version_connection = sqlite3.connect(
+                db_path, check_same_thread=False
+            )
+        row = self._version_connection.execute(
+            "select value from meta where key = 'tracked_url_version'"
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    def read(self):
+        """
+        Загружает список сериалов из БД, если он изменился с момента
+        последнего чтения
+        :return: 'not_modified', если список не изменился
+        """
+        data_version = self._get_data_version()
+        if data_version is not None and data_version == self._data_version:
+            return 'not_modified'
+
+        with self._session() as db_session:
+            rows = db_session.query(
+                TrackedUrl.site, TrackedUrl.name, TrackedUrl.url,
+                TrackedUrl.encoding
+            ).filter(TrackedUrl.enabled.is_(True)).all()
+
+        data = {
+            site: {'urls': {}, 'encodings': {}, 'encoding': encoding}
+            for site, encoding in DEFAULT_ENCODINGS.items()
+        }
+        for site, name, url, encoding in rows:
+            site_data = data.setdefault(
+                site, {'urls': {}, 'encodings': {}, 'encoding': ''}
+            )
+            site_data['urls'][name] = url
+            if encoding:
+                site_data['encodings'][name] = encoding
+
+        self._data = data
+        self._data_version = data_version
+
+    @staticmethod
+    def get_site(tv_serial_url) -> SupportedSites:
+        try:
+            base_url = urlsplit(tv_serial_url).netloc.split('.')[0]
+            return SupportedSites(base_url)
+        except ValueError:
+            raise ValueError('Введеный сайт не поддерживается приложением')
+
+    def tv_serial_with_same_name_exists(self, tv_serial_name) -> bool:
+        with self._session() as db_session:
+            return db_session.query(
+                db_session.query(TrackedUrl).filter(
+                    TrackedUrl.name == tv_serial_name
+                ).exists()
+            ).scalar()
+
+    def add(self, tv_serial_name, tv_serial_url, encoding=None):
+        """
+        Добавляет новый сериал в список отслеживаемых
+        :param tv_serial_name: название сериала
+        :param tv_serial_url: url сериала
+        :param encoding: кодировка страницы, по умолчанию кодировка сайта
+        """
+        try:
+            site = self.get_site(tv_serial_url)
+        except ValueError as err:
+            self._logger.error(f'{err} ({tv_serial_url})')
+            raise
+
+        with self._session() as db_session:
+            duplicate = db_session.query(TrackedUrl.name).filter(
+                (TrackedUrl.name == tv_serial_name) |
+                (TrackedUrl.url == tv_serial_url)
+            ).first()
+            if duplicate is not None and duplicate.name == tv_serial_name:
+                raise ValueError('Сериал с таким именем уже существует')
+            elif duplicate is not None:
+                raise ValueError(
+                    'Данный сериал уже отслеживается, но под другим именем'
+                )
+
+            db_session.add(TrackedUrl(
+                site=site.value, name=tv_serial_name, url=tv_serial_url,
+                encoding=(
+                    DEFAULT_ENCODINGS[site.value] if encoding is None
+                    else encoding
+                ),
+                enabled=True
+            ))
+
+        self.read()
+
+    def rename(self, old_name, new_name):
+        with self._session() as db_session:
+            if db_session.query(TrackedUrl.id).filter(
+                    TrackedUrl.name == new_name).first() is not None:
+                raise ValueError('Сериал с таким именем уже существует')
+
+            db_session.query(TrackedUrl).filter(
+                TrackedUrl.name == old_name
+            ).update({TrackedUrl.name: new_name}, synchronize_session=False)
+
+        self.read()
+
+    def remove(self, serial_name):
+        """
+        Удаляет сериал из списка отслеживаемых
+        :param serial_name: название сериала
+        """
+        with self._session() as db_session:
+            db_session.query(TrackedUrl).filter(
+                TrackedUrl.name == serial_name
+            ).delete(synchronize_session=False)
+
+        self.read()
+
+    def import_sites_conf(self, path) -> int:
+        """
+        Добавляет сериалы из файла в формате sites.conf. Сериалы, у которых
+        название или url совпадает с уже отслеживаемыми, пропускаются
+        :param path: путь к файлу
+        :return: количество добавленных сериалов
+        """
+        cfg_parser = configparser.ConfigParser()
+        if not cfg_parser.read(path, encoding='utf8'):
+            raise FileNotFoundError(f'Файл {path} не найден')
+
+        added = 0
+        with self._session() as db_session:
+            names = {i for i, in db_session.query(TrackedUrl.name)}
+            urls = {i for i, in db_session.query(TrackedUrl.url)}
+
+            for section in cfg_parser.sections():
+                try:
+                    site = SupportedSites(section)
+                except ValueError:
+                    self._logger.warning(
+                        f'Сайт {section} не поддерживается приложением'
+                    )
+                    continue
+
+                encoding = cfg_parser[section].get(
+                    'encoding', DEFAULT_ENCODINGS[site.value]
+                )
+                for line in cfg_parser[section].get('urls', '').split('\n'):
+                    if self.url_sep not in line:
+                        continue
+
+                    name, url = (
+                        i.strip() for i in line.split(self.url_sep, 1)
+                    )
+                    if name in names or url in urls:
+                        continue
+
+                    names.add(name)
+                    urls.add(url)
+                    db_session.add(TrackedUrl(
+                        site=site.value, name=name, url=url,
+                        encoding=encoding, enabled=True
+                    ))
+                    added += 1
+
+        self.read()
+        return added
+
+    def export_sites_conf(self, path) -> int:
+        """
+        Сохраняет отслеживаемые сериалы в файл в формате sites.conf
+        :param path: путь к файлу
+        :return: количество сохраненных сериалов
+        """
+        self.read()
+
+        cfg_parser = configparser.ConfigParser()
+        for site, site_data in self._data.items():
+            cfg_parser[site] = {
+                'urls': '\n'.join(
+                    f'{name}{self.url_sep}{url}'
+                    for name, url in sorted(site_data['urls'].items())
+                ),
+                'encoding': site_data['encoding']
+            }
+
+        with open(path, 'w', encoding='utf8') as out:
+            cfg_parser.write(out)
+
+        return sum(len(i['urls']) for i in self._data.values())
+
+    def get_config_data(self):
+        return self._data
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def keys(self):
+        return self._data.keys()
+
+    def values(self):
+        return self._data.values()
+
+    def items(self):
+        return self._data.items()
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __str__(self):
+        return str(self._data)
+
+    def __repr__(self):
+        return repr(self._data)
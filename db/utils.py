@@ -1,31 +1,64 @@
 import logging
-import os
-
-from alembic.config import main as alembic_commands
+import sqlite3
+from contextlib import closing
+from os.path import join, exists
 
+from configs import db_path
+from db.revision import HEAD_REVISION
 from loggers import root_logger_cleaner
 
 
+def get_db_revision(path: str):
+    """
+    Возвращает ревизию миграций, примененных к БД
+    :param path: путь к файлу БД
+    :return: номер ревизии или None, если БД еще не создана или к ней не
+    применялись миграции
+    """
+    if not exists(path):
+        return None
+
+    with closing(sqlite3.connect(path)) as connection:
+        try:
+            row = connection.execute(
+                'SELECT version_num FROM alembic_version'
+            ).fetchone()
+        except sqlite3.DatabaseError:
+            return None
+
+    return row[0] if row else None
+
+
 def apply_migrations(root_dir):
     """
-    Применяет к текущей БД все миграции
+    Применяет к текущей БД все миграции. Если БД уже находится на последней
+    ревизии (HEAD_REVISION), то alembic не загружается
     :param root_dir: корневая дирректория проекта (дирректория в которой
     располагается папка alembic, содержащая миграции)
     """
-    cwd = os.getcwd()
-    os.chdir(root_dir)
+    if get_db_revision(db_path) == HEAD_REVISION:
+        return
+
+    from alembic import command
+    from alembic.config import Config
+
+    # Пути задаются абсолютными, поэтому миграции не зависят от текущей
+    # рабочей дирректории процесса
+    alembic_config = Config(join(root_dir, 'alembic.ini'))
+    alembic_config.set_main_option(
+        'script_location', join(root_dir, 'alembic')
+    )
+
     logger_cleaner = root_logger_cleaner()
     next(logger_cleaner)
 
     try:
-        alembic_commands(argv=('--raiseerr', 'upgrade', 'head',))
+        command.upgrade(alembic_config, 'head')
     except Exception as err:
         next(logger_cleaner)
         logging.getLogger('serial-notifier').error(
             f'Возникла ошибка при попытке применить миграции: {err}'
         )
         raise
-    finally:
-        os.chdir(cwd)
 
     next(logger_cleaner)
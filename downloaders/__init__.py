@@ -1,7 +1,21 @@
-from .async_downloader import AsyncDownloader
-from .thread_downloader import ThreadDownloader
+from importlib import import_module
 
+# Модули загрузчиков импортируются только при обращении к ним, чтобы
+# консольные режимы работы приложения не загружали Qt
 downloader = {
-    'async_downloader': AsyncDownloader,
-    'thread_downloader': ThreadDownloader,
+    'async_downloader': 'downloaders.async_downloader.AsyncDownloader',
+    'thread_downloader': 'downloaders.thread_downloader.ThreadDownloader',
 }
+
+
+def get_downloader(name: str, default: str = 'thread_downloader'):
+    """
+    Возвращает класс загрузчика по его названию из setting.conf
+    :param name: название загрузчика
+    :param default: название загрузчика, который используется, если
+    загрузчика с указанным названием не существует
+    """
+    module_name, class_name = downloader.get(
+        name, downloader[default]
+    ).rsplit('.', 1)
+    return getattr(import_module(module_name), class_name)
@@ -1,14 +1,11 @@
 import asyncio
-from urllib.parse import urlsplit
 
-import aiohttp
-import async_timeout
 from PyQt5 import QtCore
-from gopac import gopac
-from gopac.exceptions import ErrorDecodeOutput, GoPacException
 
-from config_readers import SerialsUrls, ConfigsProgram
+from config_readers import ConfigsProgram
+from db.tracked_urls import SerialsUrls
 from downloaders.base_downloader import BaseDownloader
+from downloaders.fetcher import AsyncFetcher
 from enums import UpgradeState
 
 
@@ -19,127 +16,24 @@ class AsyncDownloader(BaseDownloader):
     def __init__(self):
         super().__init__()
 
-        self.console_encoding = self._conf_program['gopac']['console_encoding']
-        self._use_proxy = self._conf_program['downloader']['use_proxy']
-
-        self._semaphore: asyncio.BoundedSemaphore = None
-        self._gather_tasks = None
-
-    async def _get_proxy(self, url, site_name, serial_name):
-        if not self._use_proxy or not self._downloaded_pac_file:
-            return
+        self._fetcher = AsyncFetcher(
+            self._conf_program, self._urls_errors, self._downloaded_pages
+        )
 
-        domain = "{0.scheme}://{0.netloc}/".format(urlsplit(url))
+    async def _wrapper_for_tasks(self):
         try:
-            proxy = await asyncio.get_event_loop().run_in_executor(
-                None, gopac.find_proxy, self._downloaded_pac_file, domain,
-                self.console_encoding
+            status, error_msgs = await self._fetcher.download(
+                self._target_urls
             )
-        except (ValueError, ErrorDecodeOutput, GoPacException):
-            message = f'Не удалось получить прокси для: {url}'
-            self._urls_errors.setdefault(
-                f'{site_name}_{serial_name}', list()
-            ).append(message)
-            self._logger.error(message, exc_info=True)
-            return None
-        else:
-            return proxy.get('http', None)
-
-    def clear_proxy_cache(self):
-        if not self._use_proxy:
-            return
-
-        gopac.find_proxy.cache_clear()
-
-    async def _fetch(self, session, site_name, serial_name, url):
-        proxy = await self._get_proxy(url, site_name, serial_name)
-        for i in range(2):
-            try:
-                async with self._semaphore, session.get(
-                        url, proxy=proxy, allow_redirects=True) as response:
-                    page = await response.text()
-                    self._downloaded_pages[site_name].append(
-                        [serial_name, url, page]
-                    )
-                    return
-            except asyncio.CancelledError:
-                # Пробрасываем ошибку дальше, потому что она сообщает об отмене
-                # пользователем загрузки данных
-                raise
-            except ValueError:
-                self.clear_proxy_cache()
-                message = f'URL {url} имеет неправильный формат'
-                self._urls_errors.setdefault(
-                    f'{site_name}_{serial_name}', list()
-                ).append(message)
-                self._logger.exception(message)
-            except aiohttp.ClientConnectionError:
-                self.clear_proxy_cache()
-                message = f'Невозможно установить соединение с {url}'
-                self._urls_errors.setdefault(
-                    f'{site_name}_{serial_name}', list()
-                ).append(message)
-                self._logger.exception(message)
-            except Exception:
-                message = (
-                    f'Возникла непредвиденная ошибка при подключении к {url}'
-                )
-                self.clear_proxy_cache()
-                self._urls_errors.setdefault(
-                    f'{site_name}_{serial_name}', list()
-                ).append(message)
-                self._logger.exception(message)
-
-    async def _wrapper_for_tasks(self):
-        tasks = []
-
-        connector = aiohttp.TCPConnector(verify_ssl=False)
-        async with aiohttp.ClientSession(connector=connector) as session:
-            for site_name, site_data in self._target_urls.items():
-                if len(site_data['urls']) == 0:
-                    continue
-
-                self._downloaded_pages[site_name] = []
-                for i in site_data['urls'].items():
-                    tasks.append(self._fetch(session, site_name, *i))
-
-            if not tasks:
-                self.s_download_complete.emit(
-                    UpgradeState.CANCELLED,
-                    ['sites.conf пуст, нет сериалов для отслеживания'],
-                    self._urls_errors, self._downloaded_pages
-                )
-                return
-
-            try:
-                with async_timeout.timeout(
-                        self._conf_program['async_downloader']['timeout'],
-                        loop=session.loop):
-                    self._gather_tasks = asyncio.gather(*tasks)
-                    await self._gather_tasks
-            except asyncio.TimeoutError:
-                message = ('Первышено время обновления. Получены данные только'
-                           ' с части сайтов')
-                self.s_download_complete.emit(
-                    UpgradeState.WARNING, [message], self._urls_errors,
-                    self._downloaded_pages
-                )
-                self._logger.warning(message)
-                return
-            except asyncio.CancelledError:
-                self.s_download_complete.emit(
-                    UpgradeState.CANCELLED,
-                    ['Обновленние отменено пользователем'], {}, {}
-                )
-                return
-
+        except asyncio.CancelledError:
             self.s_download_complete.emit(
-                UpgradeState.OK, [], self._urls_errors, self._downloaded_pages
+                UpgradeState.CANCELLED,
+                ['Обновленние отменено пользователем'], {}, {}
             )
+            return
 
-    def _before_start(self):
-        self._semaphore = asyncio.BoundedSemaphore(
-            self._conf_program['async_downloader']['concurrent_requests_count']
+        self.s_download_complete.emit(
+            status, error_msgs, self._urls_errors, self._downloaded_pages
         )
 
     def _start(self, internet_available: bool, downloaded_pac_file: str):
@@ -151,9 +45,11 @@ class AsyncDownloader(BaseDownloader):
             return
 
         self._downloaded_pac_file = downloaded_pac_file
+        self._fetcher.downloaded_pac_file = downloaded_pac_file
         self._logger.info(
             'Проксирвание запросов {}'.format(
-                'ВКЛЮЧЕНО' if self._use_proxy else 'ВЫКЛЮЧЕНО'
+                'ВКЛЮЧЕНО' if self._conf_program['downloader']['use_proxy']
+                else 'ВЫКЛЮЧЕНО'
             )
         )
 
@@ -161,18 +57,14 @@ class AsyncDownloader(BaseDownloader):
 
     def cancel_download(self):
         self._downloader_initializer.cancel()
-        if self._gather_tasks is not None:
-            self._gather_tasks.cancel()
-        else:
+        if not self._fetcher.cancel():
             self.s_download_complete.emit(
                 UpgradeState.CANCELLED,
                 ['Обновленние отменено пользователем'], {}, {}
             )
 
     def clear(self):
-        self._downloaded_pages.clear()
-        self._urls_errors.clear()
-        self._gather_tasks = None
+        self._fetcher.clear()
 
 
 if __name__ == '__main__':
@@ -185,7 +77,7 @@ if __name__ == '__main__':
 
     class TestDIServices(cnt.DeclarativeContainer):
         conf_program = prv.Singleton(ConfigsProgram, base_dir=base_dir)
-        serials_urls = prv.Singleton(SerialsUrls, base_dir=base_dir)
+        serials_urls = prv.Singleton(SerialsUrls)
 
     base_downloader.DIServices.override(TestDIServices)
 
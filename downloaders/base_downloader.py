@@ -9,8 +9,10 @@ import dependency_injector.providers as prv
 from PyQt5 import QtCore
 from sip import wrappertype
 
-from config_readers import SerialsUrls, ConfigsProgram
+from config_readers import ConfigsProgram
+from db.tracked_urls import SerialsUrls
 from enums import UpgradeState
+from instrumentation import instrumentation, STAGE_INIT, STAGE_FETCH
 
 
 class DIServices(cnt.DeclarativeContainer):
@@ -44,9 +46,17 @@ class BaseDownloader(QtCore.QObject, metaclass=BaseDownloaderMetaClass):
         self._logger = logging.getLogger('serial-notifier')
 
         self._downloader_initializer.s_init_complete.connect(
-            self._start, QtCore.Qt.QueuedConnection
+            self._init_complete, QtCore.Qt.QueuedConnection
         )
 
+    def _init_complete(self, internet_available: bool,
+                       downloaded_pac_file: str):
+        timing = instrumentation.current
+        if timing is not None:
+            timing.next_stage(STAGE_INIT, STAGE_FETCH)
+
+        self._start(internet_available, downloaded_pac_file)
+
     def start_download(self):
         """
         Запускает загрузку информации о новых сериях
@@ -150,3 +160,4 @@ class DownloadCancel(Exception):
     Исключение сообщающие, что загрузку необходимо отменить
     """
     pass
+
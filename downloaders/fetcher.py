@@ -0,0 +1,287 @@
+import asyncio
+import logging
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+import async_timeout
+import gopac
+import gopac.exceptions
+
+from config_readers import ConfigsProgram
+from downloaders.utils import (
+    BodySizeExceeded, EndMarkerScanner, content_length_exceeds
+)
+from enums import UpgradeState
+from instrumentation import instrumentation
+from parsers.services import end_markers
+
+
+class AsyncFetcher:
+    """
+    Загрузчик web страниц основанный на коррутинах и не зависящий от Qt.
+    Используется AsyncDownloader`ом и консольными режимами работы приложения
+    """
+    def __init__(self, conf_program: ConfigsProgram, urls_errors: dict = None,
+                 downloaded_pages: dict = None):
+        self._conf_program = conf_program
+        self._logger = logging.getLogger('serial-notifier')
+
+        self.urls_errors = {} if urls_errors is None else urls_errors
+        self.downloaded_pages = (
+            {} if downloaded_pages is None else downloaded_pages
+        )
+        self.downloaded_pac_file = ''
+
+        self._target_urls = {}
+        self._semaphore: asyncio.BoundedSemaphore = None
+        self._gather_tasks = None
+
+        self.console_encoding = ''
+        self._use_proxy = False
+        self._stream_read = False
+        self._stream_chunk_size = 0
+        self._max_body_size = 0
+
+    def _configure(self):
+        """
+        Применяет текущие настройки программы. Вызывается перед каждой
+        загрузкой, чтобы изменения в setting.conf подхватывались без
+        перезапуска
+        """
+        downloader_conf = self._conf_program['downloader']
+        self.console_encoding = self._conf_program['gopac']['console_encoding']
+        self._use_proxy = downloader_conf['use_proxy']
+        self._stream_read = downloader_conf['stream_read']
+        self._stream_chunk_size = downloader_conf['stream_chunk_size']
+        self._max_body_size = downloader_conf['max_body_size']
+        self._semaphore = asyncio.BoundedSemaphore(
+            self._conf_program['async_downloader']['concurrent_requests_count']
+        )
+
+    async def check_internet_access(self) -> bool:
+        """
+        Проверяет доступность интернета
+        """
+        url = self._conf_program['downloader']['check_internet_access_url']
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with async_timeout.timeout(15):
+                    async with session.get(url) as response:
+                        await response.release()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._logger.error('Отстуствует доступ в интернет')
+            return False
+
+        return True
+
+    async def download_pac_file(self) -> str:
+        """
+        Скачивает pac файл, если включено проксирование запросов
+        :return: путь к скачанному pac файлу
+        """
+        self.downloaded_pac_file = ''
+        if not self._conf_program['downloader']['use_proxy']:
+            return self.downloaded_pac_file
+
+        try:
+            self.downloaded_pac_file = await asyncio.get_event_loop(
+            ).run_in_executor(
+                None, gopac.download_pac_file,
+                self._conf_program['downloader']['pac_file']
+            )
+        except asyncio.CancelledError:
+            raise
+        except gopac.exceptions.SavePacFileException:
+            self._logger.error(
+                'Возникла ошибка при сохранении pac файла', exc_info=True
+            )
+        except Exception:
+            self._logger.error(
+                'Ошибка при получении pac файла', exc_info=True
+            )
+
+        return self.downloaded_pac_file
+
+    async def _get_proxy(self, url, site_name, serial_name):
+        if not self._use_proxy or not self.downloaded_pac_file:
+            return
+
+        domain = "{0.scheme}://{0.netloc}/".format(urlsplit(url))
+        try:
+            proxy = await asyncio.get_event_loop().run_in_executor(
+                None, gopac.find_proxy, self.downloaded_pac_file, domain,
+                self.console_encoding
+            )
+        except (ValueError, gopac.exceptions.ErrorDecodeOutput,
+                gopac.exceptions.GoPacException):
+            message = f'Не удалось получить прокси для: {url}'
+            self.urls_errors.setdefault(
+                f'{site_name}_{serial_name}', list()
+            ).append(message)
+            self._logger.error(message, exc_info=True)
+            return None
+        else:
+            return proxy.get('http', None)
+
+    def clear_proxy_cache(self):
+        if not self._use_proxy:
+            return
+
+        gopac.find_proxy.cache_clear()
+
+    async def _read_body(self, response, site_name) -> bytes:
+        """
+        Читает тело ответа по частям, прерывая загрузку, если размер тела
+        превышает max_body_size. В режиме потокового чтения соединение
+        закрывается сразу после получения области страницы, которая нужна
+        парсеру
+        """
+        if content_length_exceeds(response.headers, self._max_body_size):
+            response.close()
+            raise BodySizeExceeded()
+
+        marker = end_markers.get(site_name) if self._stream_read else None
+        scanner = EndMarkerScanner(marker) if marker else None
+        body = bytearray()
+
+        async for chunk in response.content.iter_chunked(
+                self._stream_chunk_size):
+            body.extend(chunk)
+            if len(body) > self._max_body_size:
+                response.close()
+                raise BodySizeExceeded()
+
+            if scanner is not None and scanner.feed(body):
+                response.close()
+                break
+
+        return bytes(body)
+
+    async def _fetch(self, session, site_name, serial_name, url):
+        timing = instrumentation.current
+        proxy = await self._get_proxy(url, site_name, serial_name)
+        for i in range(2):
+            page = None
+            started = 0
+            try:
+                async with self._semaphore:
+                    # Время ожидания семафора в задержку не входит
+                    if timing is not None:
+                        started = time.perf_counter()
+
+                    async with session.get(
+                            url, proxy=proxy,
+                            allow_redirects=True) as response:
+                        # Декодирование страницы выполняет lxml, поэтому
+                        # сохраняем сырые байты и кодировку (сериала, сайта
+                        # или из заголовка)
+                        page = await self._read_body(response, site_name)
+                        site_data = self._target_urls[site_name]
+                        encoding = (
+                            site_data['encodings'].get(serial_name) or
+                            site_data['encoding'] or response.charset or ''
+                        )
+                        self.downloaded_pages[site_name].append(
+                            [serial_name, url, page, encoding]
+                        )
+                        return
+            except asyncio.CancelledError:
+                # Пробрасываем ошибку дальше, потому что она сообщает об отмене
+                # пользователем загрузки данных
+                raise
+            except BodySizeExceeded:
+                message = f'Размер страницы {url} превышает допустимый'
+                self.urls_errors.setdefault(
+                    f'{site_name}_{serial_name}', list()
+                ).append(message)
+                self._logger.error(message)
+                return
+            except ValueError:
+                self.clear_proxy_cache()
+                message = f'URL {url} имеет неправильный формат'
+                self.urls_errors.setdefault(
+                    f'{site_name}_{serial_name}', list()
+                ).append(message)
+                self._logger.exception(message)
+            except aiohttp.ClientConnectionError:
+                self.clear_proxy_cache()
+                message = f'Невозможно установить соединение с {url}'
+                self.urls_errors.setdefault(
+                    f'{site_name}_{serial_name}', list()
+                ).append(message)
+                self._logger.exception(message)
+            except Exception:
+                message = (
+                    f'Возникла непредвиденная ошибка при подключении к {url}'
+                )
+                self.clear_proxy_cache()
+                self.urls_errors.setdefault(
+                    f'{site_name}_{serial_name}', list()
+                ).append(message)
+                self._logger.exception(message)
+            finally:
+                if timing is not None and started:
+                    timing.add_url(
+                        site_name, serial_name, time.perf_counter() - started,
+                        len(page or b''), error=page is None
+                    )
+
+    async def download(self, target_urls: dict) -> tuple:
+        """
+        Скачивает страницы всех отслеживаемых сериалов. Отмена загрузки
+        пользователем пробрасывается наружу в виде asyncio.CancelledError
+        :param target_urls: отслеживаемые сериалы в формате SerialsUrls
+        :return: статус загрузки и список сообщений об ошибках
+        """
+        self._configure()
+        self._target_urls = target_urls
+        tasks = []
+
+        connector = aiohttp.TCPConnector(verify_ssl=False)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            for site_name, site_data in self._target_urls.items():
+                if len(site_data['urls']) == 0:
+                    continue
+
+                self.downloaded_pages[site_name] = []
+                for i in site_data['urls'].items():
+                    tasks.append(self._fetch(session, site_name, *i))
+
+            if not tasks:
+                return (
+                    UpgradeState.CANCELLED,
+                    ['Нет сериалов для отслеживания']
+                )
+
+            try:
+                with async_timeout.timeout(
+                        self._conf_program['async_downloader']['timeout'],
+                        loop=session.loop):
+                    self._gather_tasks = asyncio.gather(*tasks)
+                    await self._gather_tasks
+            except asyncio.TimeoutError:
+                message = ('Первышено время обновления. Получены данные только'
+                           ' с части сайтов')
+                self._logger.warning(message)
+                return UpgradeState.WARNING, [message]
+
+        return UpgradeState.OK, []
+
+    def cancel(self) -> bool:
+        """
+        Отменяет загрузку страниц
+        :return: True, если загрузка страниц уже была запущена
+        """
+        if self._gather_tasks is None:
+            return False
+
+        self._gather_tasks.cancel()
+        return True
+
+    def clear(self):
+        self.downloaded_pages.clear()
+        self.urls_errors.clear()
+        self._gather_tasks = None
@@ -1,5 +1,6 @@
 import logging
 import threading
+import time
 from copy import deepcopy
 from threading import Lock
 from urllib.parse import urlsplit
@@ -9,9 +10,16 @@ import requests
 from PyQt5 import QtCore
 from gopac.exceptions import GoPacException, ErrorDecodeOutput
 
-from config_readers import ConfigsProgram, SerialsUrls
+from config_readers import ConfigsProgram
+from db.tracked_urls import SerialsUrls
 from downloaders.base_downloader import BaseDownloader, DownloadCancel
+from downloaders.utils import (
+    BodySizeExceeded, EndMarkerScanner, content_length_exceeds, get_charset
+)
 from enums import UpgradeState
+from instrumentation import instrumentation
+from parsers.services import end_markers
+from profiling import profiler
 
 
 class ThreadDownloader(BaseDownloader):
@@ -19,7 +27,7 @@ class ThreadDownloader(BaseDownloader):
     Асинхронных загрузчик данных с web страниц основанный на потоках
     """
     s_serial_downloaded = QtCore.pyqtSignal(
-        str, str, str, str, list, name='s_serial_downloaded'
+        str, str, object, str, str, list, name='s_serial_downloaded'
     )
     s_worker_complete = QtCore.pyqtSignal(name='s_worker_complete')
 
@@ -63,7 +71,7 @@ class ThreadDownloader(BaseDownloader):
         if self._count_urls == 0:
             self.s_download_complete.emit(
                 UpgradeState.CANCELLED,
-                ['sites.conf пуст, нет сериалов для отслеживания'], {}, {}
+                ['Нет сериалов для отслеживания'], {}, {}
             )
             return
 
@@ -96,12 +104,13 @@ class ThreadDownloader(BaseDownloader):
             self._conf_program['thread_downloader']['timeout']
         )
 
-    def _serial_downloaded(self, site_name: str, serial_name: str, html: str,
-                           url: str, url_errors: list):
+    def _serial_downloaded(self, site_name: str, serial_name: str,
+                           html: bytes, encoding: str, url: str,
+                           url_errors: list):
 
         if html:
             self._downloaded_pages.setdefault(site_name, []).append(
-                [serial_name, url, html]
+                [serial_name, url, html, encoding]
             )
         if url_errors:
             self._urls_errors.setdefault(
@@ -168,6 +177,11 @@ class Worker(QtCore.QThread):
             'check_internet_access_url'
         ]
         self._use_proxy: bool = conf_program['downloader']['use_proxy']
+        self._stream_read: bool = conf_program['downloader']['stream_read']
+        self._stream_chunk_size: int = conf_program['downloader'][
+            'stream_chunk_size'
+        ]
+        self._max_body_size: int = conf_program['downloader']['max_body_size']
         self._downloaded_pac_file: str = downloaded_pac_file
         self._lock: Lock = lock
         self.s_serial_downloaded = s_serial_downloaded
@@ -207,8 +221,11 @@ class Worker(QtCore.QThread):
 
         try:
             self.set_proxy_for_session(url, url_errors)
+            # Тело ответа всегда читается по частям (см. read_body), чтобы
+            # ограничить его размер
             return self._session.get(
-                url, hooks={'response': self.terminate_download}
+                url, hooks={'response': self.terminate_download},
+                stream=True
             )
         except DownloadCancel:
             raise
@@ -225,7 +242,40 @@ class Worker(QtCore.QThread):
             url_errors.add(message)
             self.fetch(url, url_errors, recursion_deep + 1)
 
+    def read_body(self, response: requests.Response, site_name: str) -> bytes:
+        """
+        Читает тело ответа по частям, прерывая загрузку, если размер тела
+        превышает max_body_size. В режиме потокового чтения соединение
+        закрывается сразу после получения области страницы, которая нужна
+        парсеру
+        """
+        marker = end_markers.get(site_name) if self._stream_read else None
+        scanner = EndMarkerScanner(marker) if marker else None
+        body = bytearray()
+
+        try:
+            if content_length_exceeds(response.headers, self._max_body_size):
+                raise BodySizeExceeded()
+
+            for chunk in response.iter_content(self._stream_chunk_size):
+                self.terminate_download()
+
+                body.extend(chunk)
+                if len(body) > self._max_body_size:
+                    raise BodySizeExceeded()
+
+                if scanner is not None and scanner.feed(body):
+                    break
+        finally:
+            response.close()
+
+        return bytes(body)
+
     def run(self):
+        with profiler.thread_profile('Worker'):
+            self._download()
+
+    def _download(self):
         while True:
             with self._lock:
                 try:
@@ -237,31 +287,62 @@ class Worker(QtCore.QThread):
                     serial_name, url = self._target_urls[
                         site_name
                     ]['urls'].popitem()
-                    encoding = self._target_urls[site_name]['encoding']
+                    encoding = (
+                        self._target_urls[site_name]['encodings'].get(
+                            serial_name
+                        ) or self._target_urls[site_name]['encoding']
+                    )
                 except KeyError:
                     del self._target_urls[site_name]
                     continue
 
             url_errors = set()
+            content = b''
+            timing = instrumentation.current
+            started = time.perf_counter() if timing is not None else 0
             try:
                 html = self.fetch(url, url_errors)
+                if html is not None:
+                    content = self.read_body(html, site_name)
             except DownloadCancel:
                 self._logger.debug(
                     f'Работа Worker {threading.current_thread().name} отменена'
                 )
                 return
+            except BodySizeExceeded:
+                html = None
+                message = f'Размер страницы {url} превышает допустимый'
+                self._logger.error(message)
+                url_errors.add(message)
+            except Exception:
+                html = None
+                message = f'Ошибка при чтении страницы: {url}'
+                self._logger.error(message, exc_info=True)
+                url_errors.add(message)
+
+            if timing is not None:
+                timing.add_url(
+                    site_name, serial_name, time.perf_counter() - started,
+                    len(content), error=html is None
+                )
 
             if html is None:
                 self.s_serial_downloaded.emit(
-                    site_name, serial_name, '', url, list(url_errors)
+                    site_name, serial_name, b'', '', url, list(url_errors)
                 )
                 continue
-            if encoding:
-                html.encoding = encoding
+
+            # Страница передается парсеру в виде байтов, декодирование
+            # выполняет lxml. Если кодировка не указана для сериала, то
+            # берется кодировка из заголовка Content-Type (без угадывания
+            # кодировки через chardet, как это делает html.text)
+            if not encoding:
+                encoding = get_charset(html.headers.get('content-type', ''))
 
             if not self.f_cancel_download:
                 self.s_serial_downloaded.emit(
-                    site_name, serial_name, html.text, url, list(url_errors)
+                    site_name, serial_name, content, encoding, url,
+                    list(url_errors)
                 )
 
         if not self.f_cancel_download:
@@ -288,7 +369,7 @@ if __name__ == '__main__':
 
     class TestDIServices(cnt.DeclarativeContainer):
         conf_program = prv.Singleton(ConfigsProgram, base_dir=base_dir)
-        serials_urls = prv.Singleton(SerialsUrls, base_dir=base_dir)
+        serials_urls = prv.Singleton(SerialsUrls)
 
     base_downloader.DIServices.override(TestDIServices)
 
@@ -0,0 +1,70 @@
+"""
+Вспомогательные инструменты для загрузчиков, не зависящие от Qt
+"""
+from email.message import Message
+
+
+class BodySizeExceeded(Exception):
+    """
+    Исключение сообщающее, что размер страницы превысил допустимый
+    """
+    pass
+
+
+class EndMarkerScanner:
+    """
+    Ищет в поступающем по частям теле страницы маркер конца области, которая
+    нужна парсеру. Маркер состоит из нескольких последовательностей байтов,
+    которые должны встретиться по порядку. Уже просмотренная часть тела
+    повторно не сканируется
+    """
+    def __init__(self, marker: tuple):
+        self._marker = marker
+        self._index = 0
+        self._position = 0
+
+    def feed(self, body: bytearray) -> bool:
+        """
+        Продолжает поиск маркера в теле страницы
+        :param body: полученная на данный момент часть тела страницы
+        :return: True, если маркер найден целиком
+        """
+        while self._index < len(self._marker):
+            part = self._marker[self._index]
+            found = body.find(part, self._position)
+            if found == -1:
+                # Часть маркера могла попасть на границу кусков страницы
+                self._position = max(
+                    self._position, len(body) - len(part) + 1
+                )
+                return False
+
+            self._position = found + len(part)
+            self._index += 1
+
+        return True
+
+
+def content_length_exceeds(headers, max_size: int) -> bool:
+    """
+    Проверяет размер тела ответа по заголовку Content-Length, не скачивая
+    его
+    :param headers: заголовки ответа
+    :param max_size: максимальный размер тела в байтах
+    :return: True, если сервер сообщил размер больше допустимого
+    """
+    try:
+        return int(headers.get('Content-Length', '')) > max_size
+    except ValueError:
+        return False
+
+
+def get_charset(content_type: str) -> str:
+    """
+    Извлекает кодировку из значения заголовка Content-Type
+    :param content_type: значение заголовка Content-Type
+    :return: кодировка или пустая строка, если она не указана
+    """
+    message = Message()
+    message['content-type'] = content_type
+    return message.get_content_charset() or ''
@@ -0,0 +1,171 @@
+"""
+Запуск приложения в режиме с графическим интерфейсом
+"""
+import asyncio
+import sys
+from os.path import join
+
+import dependency_injector.containers as cnt
+import dependency_injector.providers as prv
+from PyQt5 import QtWidgets, QtGui
+from quamash import QEventLoop
+
+import configs
+import loggers
+import notice_plugins
+from config_readers import ConfigsProgram
+from configs import base_dir, resources_dir, log_path
+from gui import mainwindow, widgets, windows
+from gui.mainwindow import MainWindow, SerialTree, SystemTrayIcon
+from gui.widgets import SearchLineEdit, BoardNotices
+from notice_digest import NoticeDigest
+from profiling import profiler
+
+def create_upgrades_scheduler():
+    # Планировщик тянет за собой загрузчики и парсеры (aiohttp, lxml,
+    # requests, gopac), поэтому модули импортируются только при его создании
+    import schedulers
+    from downloaders import base_downloader
+
+    schedulers.DIServices.override(DIServices)
+    base_downloader.DIServices.override(DIServices)
+
+    return schedulers.UpgradesScheduler()
+
+
+def create_db_manager(s_send_db_task):
+    from db.managers import DbManager
+
+    return DbManager(s_send_db_task)
+
+
+def create_serials_urls():
+    from db.tracked_urls import SerialsUrls
+    from db.utils import apply_migrations
+
+    # Список может понадобиться раньше, чем init_services применит миграции.
+    # Если БД уже на последней ревизии, то миграции не загружаются
+    apply_migrations(configs.base_dir)
+    return SerialsUrls()
+
+
+# Задача запуска сервера с показателями, результат задачи - запущенный
+# сервер (MetricsServer) или None (ссылка не дает удалить задачу до ее
+# завершения)
+metrics_server_task = None
+
+
+def create_notice_outbox():
+    from notice_outbox import OutboxDispatcher
+
+    return OutboxDispatcher()
+
+
+def init_services():
+    """
+    Выполняет инициализацию, которая не нужна для отображения окна:
+    загрузку плагинов, применение миграций, запуск отправки уведомлений из
+    очереди и сервера с показателями
+    """
+    global metrics_server_task
+    from db.utils import apply_migrations
+    from metrics_server import start_metrics_server
+
+    notice_plugins.NoticePluginsContainer.load_notice_plugins()
+    apply_migrations(configs.base_dir)
+    # Отправка уведомлений, оставшихся в очереди после прошлого запуска
+    DIServices.notice_outbox().start()
+
+    # Сервер работает в цикле событий quamash, как и AsyncDownloader
+    metrics_server_task = asyncio.ensure_future(
+        start_metrics_server(DIServices.conf_program()['metrics'])
+    )
+
+
+def stop_metrics_server(loop: asyncio.AbstractEventLoop):
+    """
+    Останавливает сервер с показателями, если он был запущен
+    """
+    if metrics_server_task is None:
+        return
+
+    # Сервер мог не успеть запуститься до завершения цикла событий
+    metrics_server = loop.run_until_complete(metrics_server_task)
+    if metrics_server is not None:
+        loop.run_until_complete(metrics_server.stop())
+
+
+class DIServices(cnt.DeclarativeContainer):
+    app = prv.Object(QtWidgets.QApplication(sys.argv))
+    main_window = prv.Singleton(MainWindow)
+    tray_icon = prv.Singleton(SystemTrayIcon, parent=main_window())
+    serial_tree = prv.Singleton(SerialTree, parent=main_window())
+    search_field = prv.Singleton(SearchLineEdit, parent=main_window())
+    board_notices = prv.Singleton(BoardNotices, search_field)
+    add_new_tv_series_windows = prv.Singleton(
+        windows.AddNewTvSeriesWindows, parent=main_window()
+    )
+    rename_tv_series_windows = prv.Singleton(
+        windows.RenameTvSeriesWindows, parent=main_window(),
+        serial_tree=serial_tree()
+    )
+    unhandled_exception_message_box = prv.Object(
+        windows.UnhandledExceptionMessageBox()
+    )
+
+    init_services = prv.Object(init_services)
+    upgrades_scheduler = prv.Singleton(create_upgrades_scheduler)
+    db_manager = prv.Singleton(
+        create_db_manager, main_window().s_send_db_task
+    )
+
+    conf_program = prv.Singleton(ConfigsProgram, base_dir=resources_dir)
+    serials_urls = prv.Singleton(create_serials_urls)
+    notice_outbox = prv.Singleton(create_notice_outbox)
+    notice_digest = prv.Singleton(NoticeDigest)
+
+
+# Внедрение зависимостей
+mainwindow.DIServices.override(DIServices)
+widgets.DIServices.override(DIServices)
+windows.DIServices.override(DIServices)
+notice_plugins.DIServices.override(DIServices)
+loggers.DIServices.override(DIServices)
+
+
+def run():
+    """
+    Запускает приложение с графическим интерфейсом
+    """
+    app: QtWidgets.QApplication = DIServices.app()
+    app.icon = QtGui.QIcon(join(base_dir, 'icons/app-icon-512x512.png'))
+    app.setWindowIcon(app.icon)
+    loop = QEventLoop(app)
+    loop.set_exception_handler(loggers.asyncio_unhandled_exception_hook)
+    asyncio.set_event_loop(loop)
+
+    loggers.init_logger(log_path)
+    profiler.install_signal_handler(DIServices.conf_program())
+
+    window = DIServices.main_window()
+    window.init()
+    window.show()
+
+    # Делаем окно активным
+    window.raise_()
+    window.activateWindow()
+
+    with loop:
+        loop.run_forever()
+        stop_metrics_server(loop)
+        # Накопленные в дайджесте уведомления ставятся в очередь до выхода,
+        # чтобы они были отправлены при следующем запуске
+        notices_sent = DIServices.notice_digest().flush()
+        if notices_sent is not None:
+            loop.run_until_complete(
+                asyncio.gather(notices_sent, return_exceptions=True)
+            )
+        loop.run_until_complete(DIServices.notice_outbox().stop())
+        loop.run_until_complete(
+            notice_plugins.NoticePluginsContainer.close_plugins()
+        )
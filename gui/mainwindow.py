@@ -1,5 +1,6 @@
 import sys
 from os.path import join
+from typing import TYPE_CHECKING
 
 import dependency_injector.containers as cnt
 import dependency_injector.providers as prv
@@ -8,11 +9,18 @@ from PyQt5.QtCore import QCoreApplication, QModelIndex
 from PyQt5.QtWidgets import QMessageBox
 
 from notice_plugins import NoticePluginsContainer, UpdateCounterAction
-from schedulers import UpgradesScheduler
-from db.managers import DbManager
 from gui.widgets import SearchLineEdit, SortFilterProxyModel, BoardNotices
 from configs import base_dir, app_name, app_version, is_native_macos_mode
 from enums import UpgradeState
+from instrumentation import instrumentation, STAGE_NOTIFY
+from profiling import profiler
+
+if TYPE_CHECKING:
+    # Модули тянут за собой SQLAlchemy, aiohttp и lxml, поэтому они
+    # загружаются только после отображения главного окна
+    from schedulers import UpgradesScheduler
+    from db.managers import DbManager
+    from notice_digest import NoticeDigest
 
 
 class DIServices(cnt.DeclarativeContainer):
@@ -25,6 +33,8 @@ class DIServices(cnt.DeclarativeContainer):
 
     upgrades_scheduler = prv.Provider()
     db_manager = prv.Provider()
+    init_services = prv.Provider()
+    notice_digest = prv.Provider()
 
     serials_urls = prv.Provider()
 
@@ -355,6 +365,11 @@ class SerialTree(QtWidgets.QWidget):
         """
         Создает контекстное меню по щелчку
         """
+        # Переименование, удаление и смена статуса сериала работают с БД,
+        # поэтому недоступны, пока не будут созданы фоновые обработчики
+        if self.main_window.db_manager is None:
+            return
+
         indexes = self.view.selectedIndexes()
         level = -1
 
@@ -390,6 +405,7 @@ class SerialTree(QtWidgets.QWidget):
         загрузить в виджет
         """
         root = QtGui.QStandardItem(element['name'])
+        root.setData(element['id'], SortFilterProxyModel.SerialIdRole)
         root.setEditable(False)
         root.setIcon(self.looked_status[str(element['serial_looked'])])
         self.model.appendRow(root)
@@ -415,6 +431,15 @@ class MainWindow(QtWidgets.QMainWindow):
     # Служит для отправки заданий в DbManager
     s_send_db_task = QtCore.pyqtSignal(object, name='send_task')
 
+    # Сообщает, что главное окно было отрисовано первый раз
+    s_window_painted = QtCore.pyqtSignal(name='window_painted')
+
+    # Сообщает, что фоновые обработчики инициализированы
+    s_services_ready = QtCore.pyqtSignal(name='services_ready')
+
+    # Количество сериалов добавляемых в дерево за одну итерацию цикла событий
+    tree_fill_batch_size = 100
+
     def __init__(self):
         super(MainWindow, self).__init__()
         self.setWindowTitle(app_name)
@@ -435,18 +460,34 @@ class MainWindow(QtWidgets.QMainWindow):
         self.filter_by_status = QtWidgets.QComboBox()
 
         # Различные асинхронные обработчики
-        self.db_manager: DbManager = None
-        self.upgrades_scheduler: UpgradesScheduler = None
+        self.db_manager: 'DbManager' = None
+        self.upgrades_scheduler: 'UpgradesScheduler' = None
+        self.notice_digest: 'NoticeDigest' = None
+
+        self.a_add_new_tv_series: QtWidgets.QAction = None
+
+        self._painted = False
+        # Номер текущего заполнения дерева сериалов, позволяет прервать
+        # заполнение, если пришел более свежий список сериалов
+        self._tree_fill_generation = 0
+
+        self.s_window_painted.connect(
+            self.init_services, QtCore.Qt.QueuedConnection
+        )
 
     def init(self):
         """
-        Получение нужных виджетов через DI и инициализация
+        Получение нужных виджетов через DI и инициализация. Фоновые
+        обработчики (БД, загрузчики, плагины) инициализируются позже в
+        init_services, после того как окно будет отрисовано
         """
         self.init_menu_bar()
 
         self.tray_icon = DIServices.tray_icon()
         self.tray_icon.a_update.triggered.connect(self.run_upgrade)
         self.tray_icon.a_update_cancel.triggered.connect(self.cancel_upgrade)
+        # Обновление недоступно, пока не будут созданы фоновые обработчики
+        self.tray_icon.a_update.setDisabled(True)
 
         self.search_field = DIServices.search_field()
         self.search_field.textChanged.connect(self.change_filter_str)
@@ -459,19 +500,6 @@ class MainWindow(QtWidgets.QMainWindow):
         self.board_notices = DIServices.board_notices()
         self.main_layout.addWidget(self.board_notices, 0, 2, 3, 2)
 
-        self.db_manager = DIServices.db_manager()
-        self.db_manager.s_serials_extracted.connect(
-            self.update_list_serial, QtCore.Qt.QueuedConnection
-        )
-
-        self.upgrades_scheduler = DIServices.upgrades_scheduler()
-        self.upgrades_scheduler.s_upgrade_complete.connect(
-            self.upgrade_complete
-        )
-
-        # Загружаем информацию о серилах в в БД
-        self.s_send_db_task.emit(self.db_manager.get_serials)
-
         self.filter_by_status.addItems(
             ['Все', 'Смотрел', 'Не смотрел'])
         self.filter_by_status.setItemIcon(
@@ -487,14 +515,49 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.set_position()
 
+    def init_services(self):
+        """
+        Инициализирует фоновые обработчики и запускает загрузку списка
+        сериалов из БД. Вызывается после первой отрисовки окна, чтобы тяжелые
+        модули не задерживали его появление
+        """
+        init_services = DIServices.init_services()
+        init_services()
+
+        self.db_manager = DIServices.db_manager()
+        self.db_manager.s_serials_extracted.connect(
+            self.update_list_serial, QtCore.Qt.QueuedConnection
+        )
+        self.db_manager.s_serials_found.connect(
+            self.apply_search_result, QtCore.Qt.QueuedConnection
+        )
+        self.board_notices.load_history(self.db_manager)
+
+        self.upgrades_scheduler = DIServices.upgrades_scheduler()
+        self.upgrades_scheduler.s_upgrade_complete.connect(
+            self.upgrade_complete
+        )
+        self.notice_digest = DIServices.notice_digest()
+        self.tray_icon.a_update.setDisabled(False)
+        self.a_add_new_tv_series.setDisabled(False)
+
+        # Загружаем информацию о серилах в в БД
+        self.s_send_db_task.emit(self.db_manager.get_serials)
+
+        self.s_services_ready.emit()
+
     def init_menu_bar(self):
-        a_add_new_tv_series = QtWidgets.QAction('Добавить новый сериал', self)
-        a_add_new_tv_series.setStatusTip(
+        self.a_add_new_tv_series = QtWidgets.QAction(
+            'Добавить новый сериал', self
+        )
+        self.a_add_new_tv_series.setStatusTip(
             'Добавление нового сериала в список отслеживаемых'
         )
-        a_add_new_tv_series.triggered.connect(
+        self.a_add_new_tv_series.triggered.connect(
             DIServices.add_new_tv_series_windows()
         )
+        # Добавление недоступно, пока не будут созданы фоновые обработчики
+        self.a_add_new_tv_series.setDisabled(True)
 
         a_exit = QtWidgets.QAction('Выйти', self)
         a_exit.setStatusTip(
@@ -514,7 +577,7 @@ class MainWindow(QtWidgets.QMainWindow):
         menubar.setNativeMenuBar(is_native_macos_mode)
 
         action_menu = menubar.addMenu('Действия')
-        action_menu.addAction(a_add_new_tv_series)
+        action_menu.addAction(self.a_add_new_tv_series)
         if not is_native_macos_mode:
             action_menu.addAction(a_exit)
 
@@ -530,11 +593,21 @@ class MainWindow(QtWidgets.QMainWindow):
         """
         Отлавливает события главного окна
         """
+        if event.type() == QtCore.QEvent.Paint and not self._painted:
+            self._painted = True
+            self.s_window_painted.emit()
+
         if event.type() == QtCore.QEvent.WindowActivate:
             self.search_field.setFocus()
 
+            # Пользователь открыл окно, поэтому накопленные уведомления
+            # показываются сразу
+            if self.notice_digest is not None:
+                self.notice_digest.flush()
+
             # Проверяем идет обновление или нет
-            if self.upgrades_scheduler.flag_progress.empty():
+            if (self.upgrades_scheduler is not None and
+                    self.upgrades_scheduler.flag_progress.empty()):
                 NoticePluginsContainer.update_all_counters(
                     UpdateCounterAction.CLEAR
                 )
@@ -557,11 +630,30 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def change_filter_str(self, new_str):
         self.fix_filter_conflict()
+        self.search_serials(new_str)
 
-        filter_string = QtCore.QRegExp(
-            new_str, QtCore.Qt.CaseInsensitive, QtCore.QRegExp.RegExp
-        )
-        self.serial_tree.filter_by_name.setFilterRegExp(filter_string)
+    def search_serials(self, query: str):
+        """
+        Запускает поиск сериалов по названию. Сериалы ищутся в БД, а не среди
+        элементов дерева, поэтому скорость поиска не зависит от количества
+        сериалов в дереве
+        """
+        if not query.strip():
+            self.serial_tree.filter_by_name.set_serial_ids(None)
+        elif self.db_manager is not None:
+            self.s_send_db_task.emit(
+                lambda: self.db_manager.search_serials(query)
+            )
+
+    def apply_search_result(self, query: str, serial_ids: list):
+        """
+        Оставляет в дереве только найденные сериалы
+        """
+        # Пока выполнялся поиск, строка поиска могла измениться
+        if query != self.search_field.text():
+            return
+
+        self.serial_tree.filter_by_name.set_serial_ids(serial_ids)
 
     def closeEvent(self, event):
         event.ignore()
@@ -593,11 +685,23 @@ class MainWindow(QtWidgets.QMainWindow):
         warning = (f'\nЕсть ошибки по {len(urls_errors)} '
                    f'источникам обновлений') if urls_errors else ''
 
+        timing = instrumentation.current
+        if timing is not None:
+            timing.start_stage(STAGE_NOTIFY)
+
+        notices_sent = None
         if status == UpgradeState.OK and serials_with_updates:
             self.s_send_db_task.emit(self.db_manager.get_serials)
-            NoticePluginsContainer.send_notice_everyone(
-                serials_with_updates, warning, UpdateCounterAction.ADD
+            # Уведомления накапливаются в дайджесте, но если обновление
+            # запустил пользователь или окно открыто, то они показываются
+            # сразу
+            notices_sent = self.notice_digest.add(
+                serials_with_updates, warning, UpdateCounterAction.ADD,
+                flush=type_run == 'user' or self.isActiveWindow()
             )
+        elif (status == UpgradeState.OK and type_run == 'user' and
+                self.notice_digest.pending):
+            notices_sent = self.notice_digest.flush()
         elif status == UpgradeState.OK and type_run == 'user':
             self.tray_icon.showMessage(
                 app_name, f'Новых серий не выходило{warning}'
@@ -607,14 +711,52 @@ class MainWindow(QtWidgets.QMainWindow):
                 app_name, "\n".join(error_msgs) + warning
             )
 
+        # Потокобезопасные и асинхронные плагины отправляют уведомления, не
+        # блокируя GUI, обновление завершается после их отправки
+        if notices_sent is None or notices_sent.done():
+            self._finish_upgrade(status, timing)
+        else:
+            notices_sent.add_done_callback(
+                lambda _: self._finish_upgrade(status, timing)
+            )
+
         # todo добавить консоль для вывода ошибок из urls_errors
         self.upgrades_scheduler.clear_downloader()
 
+    @staticmethod
+    def _finish_upgrade(status: UpgradeState, timing):
+        instrumentation.finish(status, timing)
+        profiler.end_cycle()
+
     def update_list_serial(self, all_serials):
         """
         Обновляет в виджете список сериалов
         """
         self.serial_tree.model.clear()
         self.serial_tree.model.setHorizontalHeaderLabels(['Сериалы'])
-        self.serial_tree.add_items(all_serials)
-        self.serial_tree.view.sortByColumn(0, QtCore.Qt.AscendingOrder)
+
+        self._tree_fill_generation += 1
+        self._fill_tree(all_serials, 0, self._tree_fill_generation)
+
+        # Найденные ранее сериалы могли измениться (например, добавился
+        # сериал, подходящий под строку поиска)
+        if self.search_field.text().strip():
+            self.search_serials(self.search_field.text())
+
+    def _fill_tree(self, all_serials: list, start: int, generation: int):
+        """
+        Добавляет сериалы в дерево порциями, отдавая управление циклу событий
+        между порциями, чтобы большой список не блокировал GUI
+        """
+        if generation != self._tree_fill_generation:
+            return
+
+        end = start + self.tree_fill_batch_size
+        self.serial_tree.add_items(all_serials[start:end])
+
+        if end < len(all_serials):
+            QtCore.QTimer.singleShot(
+                0, lambda: self._fill_tree(all_serials, end, generation)
+            )
+        else:
+            self.serial_tree.view.sortByColumn(0, QtCore.Qt.AscendingOrder)
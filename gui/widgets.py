@@ -1,8 +1,12 @@
 """
 Дополнительные виджеты для gui
 """
+import math
 import re
+import time
+from collections import namedtuple
 from os.path import join
+from typing import TYPE_CHECKING
 
 import dependency_injector.containers as cnt
 import dependency_injector.providers as prv
@@ -12,9 +16,18 @@ from PyQt5.QtWidgets import QStyle
 
 from configs import base_dir
 
+if TYPE_CHECKING:
+    from db.managers import DbManager
+
 
 class DIServices(cnt.DeclarativeContainer):
     app = prv.Provider()
+    conf_program = prv.Provider()
+
+
+# Уведомление на доске уведомлений: время создания (идентификатор),
+# документ с текстом и ширина текста
+Notice = namedtuple('Notice', ['created_at', 'document', 'width'])
 
 
 class SearchLineEdit(QtWidgets.QLineEdit):
@@ -54,136 +67,374 @@ class SearchLineEdit(QtWidgets.QLineEdit):
         super(SearchLineEdit, self).resizeEvent(event)
 
 
-class Notification(QtWidgets.QLabel):
+class NotificationsModel(QtCore.QAbstractListModel):
     """
-    Уведомление, которое отображается на доске уведомлений. Содержит текст
-    уведомления и крестик для его удаления
+    Уведомления доски уведомлений от новых к старым. В памяти хранится не
+    больше max_notices новых уведомлений, более старые загружаются из
+    истории страницами по мере прокрутки (см. fetchMore)
     """
-    icon_close = lambda self: QtGui.QIcon(join(base_dir, 'icons/cross.png'))
+    s_page_requested = QtCore.pyqtSignal(object, int, name='page_requested')
+    s_max_width_changed = QtCore.pyqtSignal(int, name='max_width_changed')
+
+    CreatedAtRole = QtCore.Qt.UserRole
+    DocumentRole = QtCore.Qt.UserRole + 1
+
+    def __init__(self, page_size=20, max_notices=100):
+        super(NotificationsModel, self).__init__()
+        self.page_size = page_size
+        self.max_notices = max_notices
+        # Ширина текста самого широкого уведомления
+        self.max_width = 0
+
+        self._notices = []
+        # Пока история не подключена (см. load_history), загружать нечего
+        self._has_more = False
+        self._loading = False
+
+    @staticmethod
+    def _create_notice(created_at: float, message: str) -> Notice:
+        document = QtGui.QTextDocument()
+        document.setHtml(message)
+        return Notice(created_at, document, math.ceil(document.idealWidth()))
+
+    @property
+    def oldest(self) -> float:
+        return self._notices[-1].created_at if self._notices else None
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._notices)
+
+    def data(self, index: QModelIndex, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        notice = self._notices[index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            return notice.document.toPlainText()
+        if role == self.CreatedAtRole:
+            return notice.created_at
+        if role == self.DocumentRole:
+            return notice.document
+        return None
+
+    def load_history(self):
+        """
+        Начинает загрузку уведомлений из истории
+        """
+        self._has_more = True
+        self.fetchMore(QModelIndex())
 
-    def __init__(self, massage, *args, **kwargs):
-        super(Notification, self).__init__(*args, **kwargs)
+    def canFetchMore(self, parent: QModelIndex):
+        return not parent.isValid() and self._has_more and not self._loading
 
-        self.selected_link = None
+    def fetchMore(self, parent: QModelIndex):
+        if not self.canFetchMore(parent):
+            return
 
-        if callable(self.icon_close):
-            self.icon_close = self.icon_close()
+        self._loading = True
+        self.s_page_requested.emit(self.oldest, self.page_size)
 
-        self.setText('<br>{}<br>'.format(massage))
+    def add_page(self, before: float, notices: list):
+        """
+        Добавляет в конец списка страницу уведомлений из истории
+        :param before: время, до которого запрашивались уведомления
+        :param notices: [(время создания, текст уведомления)]
+        """
+        self._loading = False
+        oldest = self.oldest
+        # Пока страница загружалась, старые уведомления были вытеснены
+        # новыми, страница будет запрошена заново
+        if before is not None and before != oldest:
+            return
+
+        self._has_more = len(notices) == self.page_size
+        new_notices = [
+            self._create_notice(created_at, message)
+            for created_at, message in notices
+            if oldest is None or created_at < oldest
+        ]
+        if not new_notices:
+            return
+
+        self.beginInsertRows(
+            QModelIndex(), len(self._notices),
+            len(self._notices) + len(new_notices) - 1
+        )
+        self._notices.extend(new_notices)
+        self.endInsertRows()
+
+        self._update_max_width(new_notices, [])
+
+    def add_notification(self, created_at: float, message: str):
+        notice = self._create_notice(created_at, message)
+        self.beginInsertRows(QModelIndex(), 0, 0)
+        self._notices.insert(0, notice)
+        self.endInsertRows()
+
+        # Вытесненные уведомления остаются в истории и загружаются снова
+        # при прокрутке
+        removed = self._notices[self.max_notices:]
+        if removed:
+            self.beginRemoveRows(
+                QModelIndex(), self.max_notices, len(self._notices) - 1
+            )
+            del self._notices[self.max_notices:]
+            self.endRemoveRows()
+            self._has_more = True
+
+        self._update_max_width([notice], removed)
+
+    def remove_notification(self, created_at: float):
+        for row, notice in enumerate(self._notices):
+            if notice.created_at == created_at:
+                break
+        else:
+            return
 
-        self.link_context_menu = QtWidgets.QMenu()
-        a_copy_link = self.link_context_menu.addAction('Скопировать ссылку')
-        a_copy_link.triggered.connect(self._copy_link)
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._notices[row]
+        self.endRemoveRows()
 
-        # fixme когда уведомлений много крестик съезжает
-        self.button = QtWidgets.QToolButton(self)
-        self.button.setIcon(self.icon_close)
-        self.button.setStyleSheet('border: 0px; padding: 0px;')
-        self.button.setCursor(QtCore.Qt.PointingHandCursor)
+        self._update_max_width([], [notice])
 
-        frame_width = self.style().pixelMetric(QStyle.PM_DefaultFrameWidth)
-        button_size = self.button.sizeHint()
+    def _update_max_width(self, added: list, removed: list):
+        """
+        Обновляет максимальную ширину, не перебирая все уведомления, если
+        самое широкое уведомление не было удалено
+        """
+        max_width = max([self.max_width] + [i.width for i in added])
+        if any(i.width >= self.max_width for i in removed):
+            max_width = max((i.width for i in self._notices), default=0)
 
-        self.linkHovered.connect(self._link_hovered)
-        self.setStyleSheet("""padding-right: {0}px;
-                            padding-left: 2px;
-                            color: #fff;
-                            background-color: #45494d;
-                            border-width: 2px;
-                            border-radius: 5px;
-                            border-color: gray;
-                            """.format(button_size.width() + frame_width + 1))
+        if max_width != self.max_width:
+            self.max_width = max_width
+            self.s_max_width_changed.emit(max_width)
 
-        self.setMinimumSize(
-            max(self.minimumSizeHint().width(),
-                button_size.width() + frame_width * 2 + 2),
-            max(self.minimumSizeHint().height(),
-                button_size.height() + frame_width * 2 + 2)
-        )
 
-    def resizeEvent(self, event):
-        width = self.rect().right()
-        height = self.rect().height()
+class NotificationDelegate(QtWidgets.QStyledItemDelegate):
+    """
+    Рисует уведомление: текст со ссылками на сериалы и крестик для удаления
+    """
+    s_close_clicked = QtCore.pyqtSignal(float, name='close_clicked')
+    s_link_activated = QtCore.pyqtSignal(str, name='link_activated')
+    s_link_hovered = QtCore.pyqtSignal(str, name='link_hovered')
 
-        button_size = self.button.sizeHint()
-        frame_width = self.style().pixelMetric(QStyle.PM_DefaultFrameWidth)
-        self.button.move(width - frame_width - button_size.width(),
-                         height * 5 // 100)
-        super(Notification, self).resizeEvent(event)
+    padding = 4
+    spacing = 6
+    icon_size = 16
 
-    def contextMenuEvent(self, q_context_menu_event):
-        self.link_context_menu.move(
-            self.mapToGlobal(QtCore.QPoint(0, 0)) + q_context_menu_event.pos()
-        )
-        self.link_context_menu.show()
+    def __init__(self, view: QtWidgets.QListView):
+        super(NotificationDelegate, self).__init__(view)
+        self.view = view
+        self.icon_close = QtGui.QIcon(join(base_dir, 'icons/cross.png'))
 
-    def _copy_link(self):
-        clipboard = DIServices.app().clipboard()
-        clipboard.clear(mode=clipboard.Clipboard)
-        clipboard.setText(self.selected_link)
+    @property
+    def extra_width(self) -> int:
+        """
+        Ширина уведомления без текста
+        """
+        return self.padding * 3 + self.icon_size
 
-    def _link_hovered(self, link: str):
+    def _get_rects(self, rect: QtCore.QRect) -> tuple:
         """
-        Обработчик для события "курсор наведен на ссылку". Необходим для работы
-        метода _copy_link.
-        :param link: строка, где название сериала и ссылка на него разделены
-        точкой с заяптой
+        :return: область уведомления, область крестика и начало текста
         """
+        rect = rect.adjusted(0, 0, 0, -self.spacing)
+        close_rect = QtCore.QRect(
+            rect.right() - self.padding - self.icon_size,
+            rect.top() + self.padding, self.icon_size, self.icon_size
+        )
+        text_pos = rect.topLeft() + QtCore.QPoint(self.padding, self.padding)
+        return rect, close_rect, text_pos
+
+    def sizeHint(self, option, index: QModelIndex):
+        document = index.data(NotificationsModel.DocumentRole)
+        size = document.size()
+        return QtCore.QSize(
+            math.ceil(size.width()) + self.extra_width,
+            math.ceil(size.height()) + self.padding * 2 + self.spacing
+        )
+
+    def paint(self, painter: QtGui.QPainter, option, index: QModelIndex):
+        document = index.data(NotificationsModel.DocumentRole)
+        rect, close_rect, text_pos = self._get_rects(option.rect)
+
+        painter.save()
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+        painter.setPen(QtGui.QColor('gray'))
+        painter.setBrush(QtGui.QColor('#45494d'))
+        painter.drawRoundedRect(QtCore.QRectF(rect).adjusted(1, 1, -1, -1),
+                                5, 5)
+        self.icon_close.paint(painter, close_rect)
+
+        painter.translate(text_pos)
+        context = QtGui.QAbstractTextDocumentLayout.PaintContext()
+        context.palette.setColor(QtGui.QPalette.Text, QtGui.QColor('#fff'))
+        document.documentLayout().draw(painter, context)
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index: QModelIndex):
+        if event.type() not in (QtCore.QEvent.MouseMove,
+                                QtCore.QEvent.MouseButtonRelease):
+            return False
+
+        rect, close_rect, text_pos = self._get_rects(option.rect)
+        document = index.data(NotificationsModel.DocumentRole)
+        link = document.documentLayout().anchorAt(
+            QtCore.QPointF(event.pos() - text_pos)
+        )
+        on_close = close_rect.contains(event.pos())
+
+        if event.type() == QtCore.QEvent.MouseMove:
+            self.view.viewport().setCursor(
+                QtCore.Qt.PointingHandCursor if link or on_close else
+                QtCore.Qt.ArrowCursor
+            )
+            if link:
+                self.s_link_hovered.emit(link)
+            return False
+
+        if event.button() != QtCore.Qt.LeftButton:
+            return False
+        if on_close:
+            self.s_close_clicked.emit(
+                index.data(NotificationsModel.CreatedAtRole)
+            )
+            return True
         if link:
-            self.selected_link = link.split(';')[1]
+            self.s_link_activated.emit(link)
+            return True
+        return False
 
 
 class BoardNotices(QtWidgets.QWidget):
     """
-    Доска на которой отображаются уведомления о выходе новых серий
+    Доска на которой отображаются уведомления о выходе новых серий.
+    Уведомления сохраняются в историю в БД и рисуются делегатом, поэтому
+    стоимость отображения не зависит от их количества
     """
     def __init__(self, search_field):
         super(BoardNotices, self).__init__()
         self.search_field = search_field
 
-        self.all_notification = []
+        self.selected_link = None
+        self._db_manager: 'DbManager' = None
+        self._last_created_at = 0
+
+        self.model = NotificationsModel()
+        self.model.s_max_width_changed.connect(self._update_width_area)
+        self.model.rowsInserted.connect(self._update_default_label)
+        self.model.rowsRemoved.connect(self._update_default_label)
+
+        self.view = QtWidgets.QListView()
+        self.view.setModel(self.model)
+        self.view.setMouseTracking(True)
+        self.view.setSelectionMode(QtWidgets.QAbstractItemView.NoSelection)
+        self.view.setVerticalScrollMode(
+            QtWidgets.QAbstractItemView.ScrollPerPixel
+        )
+        self.view.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
+        self.view.setLayoutMode(QtWidgets.QListView.Batched)
+        self.view.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
+        self.view.customContextMenuRequested.connect(self._open_menu)
+        self.view.viewportEntered.connect(self.view.viewport().unsetCursor)
+
+        self.delegate = NotificationDelegate(self.view)
+        self.delegate.s_close_clicked.connect(self.remove_notification)
+        self.delegate.s_link_activated.connect(self._link_activated)
+        self.delegate.s_link_hovered.connect(self._link_hovered)
+        self.view.setItemDelegate(self.delegate)
 
-        self.scroll_layout = QtWidgets.QVBoxLayout()
+        self.link_context_menu = QtWidgets.QMenu()
+        a_copy_link = self.link_context_menu.addAction('Скопировать ссылку')
+        a_copy_link.triggered.connect(self._copy_link)
 
-        self.scroll_widget = QtWidgets.QWidget()
-        self.scroll_widget.setLayout(self.scroll_layout)
+        self.default_label = QtWidgets.QLabel(
+            '{}Уведомлений нет{}'.format(' ' * 14, ' ' * 5)
+        )
+        self.default_label.setAlignment(
+            QtCore.Qt.AlignLeft | QtCore.Qt.AlignTop
+        )
 
-        self.scroll_area = QtWidgets.QScrollArea()
-        self.scroll_area.setWidgetResizable(True)
-        self.scroll_area.setWidget(self.scroll_widget)
+        self.stack = QtWidgets.QStackedWidget()
+        self.stack.addWidget(self.default_label)
+        self.stack.addWidget(self.view)
 
         self.main_layout = QtWidgets.QVBoxLayout()
         margins = self.main_layout.contentsMargins()
         margins.setTop(0)
         margins.setBottom(0)
         self.main_layout.setContentsMargins(margins)
-        self.main_layout.addWidget(self.scroll_area)
+        self.main_layout.addWidget(self.stack)
         self.setLayout(self.main_layout)
 
-        self.default_label = QtWidgets.QLabel(
-            '{}Уведомлений нет{}'.format(' ' * 14, ' ' * 5)
+        self._update_width_area()
+
+    def load_history(self, db_manager: 'DbManager'):
+        """
+        Подключает историю уведомлений и загружает первую страницу.
+        Вызывается после создания DbManager
+        """
+        settings = DIServices.conf_program()['notice_board']
+        self.model.page_size = settings['page_size']
+        self.model.max_notices = settings['max_notices']
+
+        self._db_manager = db_manager
+        self._db_manager.s_notices_extracted.connect(
+            self._add_page, QtCore.Qt.QueuedConnection
         )
-        self.scroll_layout.addWidget(self.default_label)
-        self.scroll_layout.addStretch(0)
-        self.all_notification.append(self.default_label)
+        self.model.s_page_requested.connect(self._request_page)
+        self.model.load_history()
 
-        self._update_width_area()
+    def _send_db_task(self, func):
+        if self._db_manager is not None:
+            self._db_manager.s_send_db_task.emit(func)
+
+    def _request_page(self, before: float, limit: int):
+        self._send_db_task(
+            lambda: self._db_manager.get_notices(before, limit)
+        )
+
+    def _add_page(self, before: float, notices: list):
+        self.model.add_page(before, [
+            (created_at, self.prepare_message(data))
+            for created_at, data in notices
+        ])
+
+        # Если уведомления не заполнили доску, то прокрутка невозможна и
+        # следующая страница загружается сразу
+        if self.view.verticalScrollBar().maximum() == 0:
+            QtCore.QTimer.singleShot(
+                0, lambda: self.model.fetchMore(QModelIndex())
+            )
 
     def add_notification(self, serials_with_updates):
-        if len(self.all_notification) == 1:
-            self.all_notification[0].hide()
+        # Время создания идентифицирует уведомление, поэтому оно должно
+        # быть уникальным
+        created_at = max(time.time(), self._last_created_at + 0.001)
+        self._last_created_at = created_at
 
-        notification = Notification(self.prepare_message(serials_with_updates))
-        notification.linkActivated.connect(self._link_activated)
-        notification.button.clicked.connect(
-            lambda i, widget=notification: self.remove_notification(widget)
+        self.model.add_notification(
+            created_at, self.prepare_message(serials_with_updates)
         )
-        self.scroll_layout.insertWidget(
-            len(self.all_notification), notification
+
+        history_size = DIServices.conf_program()['notice_board'][
+            'history_size'
+        ]
+        self._send_db_task(lambda: self._db_manager.add_notice(
+            created_at, serials_with_updates, history_size
+        ))
+
+    def remove_notification(self, created_at: float):
+        self.model.remove_notification(created_at)
+        self._send_db_task(
+            lambda: self._db_manager.remove_notice(created_at)
         )
-        self.all_notification.append(notification)
 
-        self._update_width_area()
+    def _update_default_label(self):
+        self.stack.setCurrentWidget(
+            self.view if self.model.rowCount() else self.default_label
+        )
 
     def _link_activated(self, link: str):
         """
@@ -193,6 +444,26 @@ class BoardNotices(QtWidgets.QWidget):
         """
         self.search_field.setText(link.split(';')[0])
 
+    def _link_hovered(self, link: str):
+        """
+        Обработчик для события "курсор наведен на ссылку". Необходим для работы
+        метода _copy_link.
+        :param link: строка, где название сериала и ссылка на него разделены
+        точкой с заяптой
+        """
+        self.selected_link = link.split(';')[1]
+
+    def _open_menu(self, position: QtCore.QPoint):
+        if self.selected_link:
+            self.link_context_menu.popup(
+                self.view.viewport().mapToGlobal(position)
+            )
+
+    def _copy_link(self):
+        clipboard = DIServices.app().clipboard()
+        clipboard.clear(mode=clipboard.Clipboard)
+        clipboard.setText(self.selected_link)
+
     def prepare_message(self, data):
         result_message = ''
         msg_pattern = (
@@ -210,42 +481,42 @@ class BoardNotices(QtWidgets.QWidget):
             result_message += '<br>'
         return re.sub('(<br>)*$', '', result_message)
 
-    def remove_notification(self, widget):
-        widget.deleteLater()
-        self.all_notification.remove(widget)
-
-        if len(self.all_notification) == 1:
-            self.all_notification[0].show()
-
-        self._update_width_area()
-
-    def _calculate_width(self, widget):
-        """
-        Вычисляет новое ширину виджета Notification, который размещается
-        в QScrollArea
-        """
-        # todo вычисление требуемой ширины выполняется пока недостаточно точно
-        widget_width = widget.sizeHint().width()
-        sb_width = self.scroll_area.verticalScrollBar().sizeHint().width()
-        margin_width = sum(self.scroll_layout.getContentsMargins())
-        return widget_width + sb_width + margin_width + 5
-
     def _update_width_area(self):
         """
         Обновляет размер области уведомлений (подстраивает под
-        размер сообщений)
+        размер сообщений). Ширина самого широкого уведомления вычисляется
+        моделью при добавлении и удалении уведомлений
         """
-        new_width = [self._calculate_width(i) for i in self.all_notification]
-        self.setMinimumWidth(max(new_width))
+        # todo вычисление требуемой ширины выполняется пока недостаточно точно
+        sb_width = self.view.verticalScrollBar().sizeHint().width()
+        margin_width = sum(self.main_layout.getContentsMargins())
+        content_width = max(
+            self.default_label.sizeHint().width(),
+            self.model.max_width + self.delegate.extra_width
+        )
+        self.setMinimumWidth(content_width + sb_width + margin_width + 5)
 
 
 class SortFilterProxyModel(QtCore.QSortFilterProxyModel):
     """
     По умолчанию у найденного элемента не отображаются дочерние элементы
-    в данной реализации это изменено
+    в данной реализации это изменено. Сериалы можно отфильтровать по id,
+    найденным поиском в БД (см. set_serial_ids)
     """
+    SerialIdRole = QtCore.Qt.UserRole
+
     def __init__(self):
         super(SortFilterProxyModel, self).__init__()
+        # id сериалов, которые нужно показать, None - показываются все
+        self._serial_ids: set = None
+
+    def set_serial_ids(self, serial_ids):
+        """
+        :param serial_ids: id сериалов, которые нужно показать, None -
+        показать все сериалы
+        """
+        self._serial_ids = None if serial_ids is None else set(serial_ids)
+        self.invalidateFilter()
 
     def filterAcceptsRow(self, row_num, source_parent):
         """
@@ -262,7 +533,16 @@ class SortFilterProxyModel(QtCore.QSortFilterProxyModel):
         return False
 
     def filter_accepts_row_itself(self, row_num, parent):
-        return super(SortFilterProxyModel, self).filterAcceptsRow(row_num, parent)
+        if self._serial_ids is None:
+            return super(SortFilterProxyModel, self).filterAcceptsRow(
+                row_num, parent
+            )
+
+        # Сезоны и серии показываются вместе с найденным сериалом
+        if parent.isValid():
+            return False
+        index = self.sourceModel().index(row_num, 0, parent)
+        return index.data(self.SerialIdRole) in self._serial_ids
 
     def filter_accepts_any_parent(self, parent):
         """
@@ -0,0 +1,346 @@
+"""
+Работа приложения без графического интерфейса (например, на сервере без
+дисплея). Цикл загрузка -> парсинг -> обновление БД выполняется на asyncio
+и не использует Qt
+"""
+import asyncio
+import json
+import logging
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join
+
+import dependency_injector.containers as cnt
+import dependency_injector.providers as prv
+
+import configs
+import loggers
+import notice_plugins
+from config_readers import ConfigsProgram
+from configs import resources_dir, log_path
+from db import create_db_session
+from db.storage import DbStorage
+from db.tracked_urls import SerialsUrls
+from db.utils import apply_migrations
+from downloaders.fetcher import AsyncFetcher
+from enums import UpgradeState
+from instrumentation import (
+    instrumentation, STAGE_INIT, STAGE_FETCH, STAGE_PARSE, STAGE_DB,
+    STAGE_NOTIFY
+)
+from metrics_server import start_metrics_server
+from notice_digest import NoticeDigest
+from notice_outbox import OutboxDispatcher
+from notice_plugins import (
+    NoticePluginsContainer, UpdateCounterAction, iter_episodes
+)
+from parsers.services import parse_serial_page
+from profiling import profiler
+
+
+class DIServices(cnt.DeclarativeContainer):
+    # Окна с сообщением об ошибке нет, ошибка только логируется
+    unhandled_exception_message_box = prv.Object(lambda: None)
+
+    conf_program = prv.Singleton(ConfigsProgram, base_dir=resources_dir)
+    serials_urls = prv.Singleton(SerialsUrls)
+    notice_outbox = prv.Singleton(OutboxDispatcher)
+    notice_digest = prv.Singleton(NoticeDigest)
+
+
+class UpgradesChecker:
+    """
+    Выполняет проверку выхода новых серий без использования Qt
+    """
+    def __init__(self, conf_program: ConfigsProgram,
+                 serials_urls: SerialsUrls):
+        self.logger = logging.getLogger('serial-notifier')
+        self.conf_program = conf_program
+        self.serials_urls = serials_urls
+
+        self.fetcher = AsyncFetcher(conf_program)
+        self.storage = DbStorage()
+
+        # Все запросы к БД выполняются в одном потоке, так как сессия
+        # SQLAlchemy не является потокобезопасной
+        self._db_executor = ThreadPoolExecutor(max_workers=1)
+        # Количество заданий для БД, которые ожидают выполнения или
+        # выполняются. Изменяется только в потоке цикла событий
+        self._db_tasks_count = 0
+
+    def _run_db_task(self, func, enqueued_at, *args):
+        started = time.perf_counter() if enqueued_at else 0
+        db_session = create_db_session()
+        self.storage.db_session = db_session
+        try:
+            with profiler.thread_profile():
+                return func(*args)
+        finally:
+            db_session.close()
+            if enqueued_at:
+                instrumentation.db_task_done(
+                    self._db_tasks_count - 1, started - enqueued_at,
+                    time.perf_counter() - started
+                )
+
+    async def run_db_task(self, func, *args):
+        """
+        Выполняет задание для БД в отдельном потоке
+        :param func: метод DbStorage
+        """
+        enqueued_at = (
+            time.perf_counter() if instrumentation.db_tasks_observed else 0
+        )
+        self._db_tasks_count += 1
+        try:
+            return await asyncio.get_event_loop().run_in_executor(
+                self._db_executor, self._run_db_task, func, enqueued_at,
+                *args
+            )
+        finally:
+            self._db_tasks_count -= 1
+
+    @staticmethod
+    def _parse(downloaded_pages: dict):
+        with profiler.thread_profile():
+            return parse_serial_page(downloaded_pages)
+
+    async def check(self, type_run: str) -> tuple:
+        """
+        Выполняет один цикл обновления информации о новых сериях. Запись
+        показателей обновления (instrumentation) завершает вызывающий код
+        :param type_run: как было запущено обновление (daemon или check)
+        :return: статус обновления, сообщения об ошибках, описание проблем
+        возниших при обработке ссылок и сериалы с новыми сериями
+        """
+        self.serials_urls.read()
+        self.conf_program.read()
+        self.fetcher.clear()
+        loggers.reset_duplicate_filter()
+
+        timing = instrumentation.begin(self.conf_program['metrics'], type_run)
+        if timing is not None:
+            timing.start_stage(STAGE_INIT)
+        profiler.begin_cycle(self.conf_program['profiling'])
+
+        if not await self.fetcher.check_internet_access():
+            return (
+                UpgradeState.ERROR, ['Отстуствует соединение с интернетом'],
+                {}, {}
+            )
+
+        await self.fetcher.download_pac_file()
+        if timing is not None:
+            timing.next_stage(STAGE_INIT, STAGE_FETCH)
+
+        status, error_msgs = await self.fetcher.download(
+            self.serials_urls.get_config_data()
+        )
+        urls_errors = dict(self.fetcher.urls_errors)
+        if status in (UpgradeState.CANCELLED, UpgradeState.ERROR):
+            return status, error_msgs, urls_errors, {}
+
+        if timing is not None:
+            timing.next_stage(STAGE_FETCH, STAGE_PARSE)
+
+        serials_data, errors = await asyncio.get_event_loop(
+        ).run_in_executor(None, self._parse, self.fetcher.downloaded_pages)
+        for serial, err_msgs in errors.items():
+            urls_errors.setdefault(serial, list()).extend(err_msgs)
+
+        if timing is not None:
+            timing.next_stage(STAGE_PARSE, STAGE_DB)
+
+        db_status, db_error_msgs, serials_with_updates = (
+            await self.run_db_task(self.storage.upgrade_db, serials_data)
+        )
+        if status < db_status:
+            status = db_status
+
+        if timing is not None:
+            timing.end_stage(STAGE_DB)
+            timing.add_db_inserted(serials_with_updates)
+
+        return (
+            status, error_msgs + db_error_msgs, urls_errors,
+            serials_with_updates
+        )
+
+    def close(self):
+        self._db_executor.shutdown()
+
+
+def init(load_plugins=True):
+    """
+    Инициализирует окружение, необходимое для работы без GUI
+    :param load_plugins: загружать ли плагины уведомлений
+    """
+    notice_plugins.DIServices.override(DIServices)
+    loggers.DIServices.override(DIServices)
+
+    loggers.init_logger(log_path)
+    apply_migrations(configs.base_dir)
+
+    if load_plugins:
+        NoticePluginsContainer.load_notice_plugins(headless=True)
+
+
+async def _daemon_loop(checker: UpgradesChecker):
+    while True:
+        status, error_msgs, urls_errors, serials_with_updates = (
+            await checker.check('daemon')
+        )
+
+        warning = (f'\nЕсть ошибки по {len(urls_errors)} '
+                   f'источникам обновлений') if urls_errors else ''
+
+        if serials_with_updates:
+            timing = instrumentation.current
+            if timing is not None:
+                timing.start_stage(STAGE_NOTIFY)
+
+            try:
+                notices_sent = DIServices.notice_digest().add(
+                    serials_with_updates, warning, UpdateCounterAction.ADD
+                )
+                if notices_sent is not None:
+                    await notices_sent
+            except Exception:
+                checker.logger.exception('Не удалось отправить уведомления')
+
+        instrumentation.finish(status)
+        profiler.end_cycle()
+
+        if status != UpgradeState.OK:
+            checker.logger.warning('\n'.join(error_msgs) + warning)
+
+        await asyncio.sleep(
+            checker.conf_program['general']['refresh_interval'] / 1000
+        )
+
+
+def run_daemon():
+    """
+    Запускает периодическую проверку выхода новых серий без GUI
+    """
+    init()
+
+    checker = UpgradesChecker(
+        DIServices.conf_program(), DIServices.serials_urls()
+    )
+    checker.logger.info('Приложение запущено в режиме без GUI')
+
+    loop = asyncio.get_event_loop()
+    loop.set_exception_handler(loggers.asyncio_unhandled_exception_hook)
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, loop.stop)
+        except NotImplementedError:
+            # Windows не поддерживает обработчики сигналов в цикле событий
+            pass
+    profiler.install_signal_handler(checker.conf_program, loop)
+
+    metrics_server = loop.run_until_complete(
+        start_metrics_server(checker.conf_program['metrics'])
+    )
+    # Отправка уведомлений, оставшихся в очереди после прошлого запуска
+    DIServices.notice_outbox().start()
+    task = loop.create_task(_daemon_loop(checker))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        task.cancel()
+        loop.run_until_complete(asyncio.gather(task, return_exceptions=True))
+        if metrics_server is not None:
+            loop.run_until_complete(metrics_server.stop())
+        # Накопленные в дайджесте уведомления ставятся в очередь до выхода
+        notices_sent = DIServices.notice_digest().flush()
+        if notices_sent is not None:
+            loop.run_until_complete(
+                asyncio.gather(notices_sent, return_exceptions=True)
+            )
+        loop.run_until_complete(DIServices.notice_outbox().stop())
+        loop.run_until_complete(NoticePluginsContainer.close_plugins())
+        checker.close()
+        loop.close()
+
+
+def run_check() -> int:
+    """
+    Выполняет одну проверку выхода новых серий и выводит найденные серии в
+    stdout в формате JSON Lines (по одной серии на строку)
+    :return: код завершения, соответствующий статусу обновления (UpgradeState)
+    """
+    init(load_plugins=False)
+
+    checker = UpgradesChecker(
+        DIServices.conf_program(), DIServices.serials_urls()
+    )
+
+    loop = asyncio.get_event_loop()
+    try:
+        status, error_msgs, urls_errors, serials_with_updates = (
+            loop.run_until_complete(checker.check('check'))
+        )
+        instrumentation.finish(status)
+        profiler.end_cycle()
+    finally:
+        checker.close()
+        loop.close()
+
+    for episode in iter_episodes(serials_with_updates):
+        sys.stdout.write(json.dumps(episode, ensure_ascii=False) + '\n')
+    sys.stdout.flush()
+
+    for msg in error_msgs:
+        checker.logger.warning(msg)
+    for serial, err_msgs in urls_errors.items():
+        checker.logger.warning(f'{serial}: {"; ".join(err_msgs)}')
+
+    return status.value
+
+
+def run_import_sites(path: str = None) -> int:
+    """
+    Добавляет в список отслеживаемых сериалы из файла в формате sites.conf
+    :param path: путь к файлу, по умолчанию sites.conf в resources_dir
+    :return: код завершения
+    """
+    init(load_plugins=False)
+    path = path or join(resources_dir, 'sites.conf')
+
+    try:
+        added = DIServices.serials_urls().import_sites_conf(path)
+    except Exception:
+        logging.getLogger('serial-notifier').exception(
+            f'Не удалось импортировать сериалы из {path}'
+        )
+        return 1
+
+    print(f'Добавлено сериалов: {added}')
+    return 0
+
+
+def run_export_sites(path: str = None) -> int:
+    """
+    Сохраняет отслеживаемые сериалы в файл в формате sites.conf
+    :param path: путь к файлу, по умолчанию sites.conf в resources_dir
+    :return: код завершения
+    """
+    init(load_plugins=False)
+    path = path or join(resources_dir, 'sites.conf')
+
+    try:
+        exported = DIServices.serials_urls().export_sites_conf(path)
+    except Exception:
+        logging.getLogger('serial-notifier').exception(
+            f'Не удалось экспортировать сериалы в {path}'
+        )
+        return 1
+
+    print(f'Сохранено сериалов: {exported}')
+    return 0
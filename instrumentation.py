@@ -0,0 +1,275 @@
+"""
+Замер времени выполнения этапов обновления информации о новых сериях.
+
+Каждое обновление создает запись RefreshTiming, в которую этапы конвейера
+(проверка доступа в интернет и загрузка PAC файла, загрузка страниц, парсинг,
+обновление БД и отправка уведомлений) добавляют свои показатели. После
+завершения обновления запись сохраняется в JSONL файл с ротацией и
+передается подписчикам (add_hook).
+
+Подписчики add_db_task_hook получают показатели выполнения заданий для БД
+(глубину очереди, время ожидания и выполнения задания).
+
+Если сохранение в файл выключено и подписчиков нет, то запись не создается
+(instrumentation.current равен None) и показатели не вычисляются.
+"""
+import json
+import logging
+import time
+from logging.handlers import RotatingFileHandler
+from os.path import join, isabs
+
+from configs import resources_dir
+
+logger = logging.getLogger('serial-notifier')
+
+# Этапы обновления
+STAGE_INIT = 'init'
+STAGE_FETCH = 'fetch'
+STAGE_PARSE = 'parse'
+STAGE_DB = 'db'
+STAGE_NOTIFY = 'notify'
+
+
+class RefreshTiming:
+    """
+    Показатели одного обновления
+    """
+    def __init__(self, type_run: str):
+        self.type_run = type_run
+        self.started_at = time.time()
+        self.status = None
+        self.duration_ms = None
+
+        # Длительность этапов в мс
+        self.stages = {}
+        # Показатели загрузки отдельных страниц
+        self.urls = []
+        # Время парсинга страниц каждого сайта в мс
+        self.parse_sites = {}
+        # Количество страниц каждого сайта, которые не удалось разобрать
+        self.parse_errors = {}
+        self.db_serials_inserted = 0
+        self.db_series_inserted = 0
+        # Время отправки уведомлений каждым плагином в мс
+        self.plugins = {}
+
+        self._start = time.perf_counter()
+        self._stage_starts = {}
+
+    def start_stage(self, name: str):
+        self._stage_starts[name] = time.perf_counter()
+
+    def end_stage(self, name: str):
+        start = self._stage_starts.pop(name, None)
+        if start is not None:
+            self.stages[name] = (time.perf_counter() - start) * 1000
+
+    def next_stage(self, finished: str, started: str):
+        """
+        Завершает этап finished и начинает этап started
+        """
+        self.end_stage(finished)
+        self.start_stage(started)
+
+    def add_url(self, site: str, serial: str, latency: float, size: int,
+                error: bool = False):
+        """
+        :param latency: время загрузки страницы в секундах
+        :param size: размер загруженной страницы в байтах
+        :param error: True, если страницу загрузить не удалось
+        """
+        self.urls.append({
+            'site': site, 'serial': serial,
+            'latency_ms': round(latency * 1000, 3), 'bytes': size,
+            'error': error,
+        })
+
+    def add_parse_time(self, site: str, duration: float):
+        """
+        :param duration: время парсинга страниц сайта в секундах
+        """
+        self.parse_sites[site] = (
+            self.parse_sites.get(site, 0) + duration * 1000
+        )
+
+    def add_parse_error(self, site: str):
+        self.parse_errors[site] = self.parse_errors.get(site, 0) + 1
+
+    def add_db_inserted(self, serials_with_updates: dict):
+        """
+        Подсчитывает количество добавленных в БД сериалов и серий
+        :param serials_with_updates: сериалы с новыми сериями
+        """
+        for serials in serials_with_updates.values():
+            self.db_serials_inserted += len(serials)
+            for url, data in serials.values():
+                self.db_series_inserted += len(data['Серия'])
+
+    def add_plugin_time(self, name: str, duration: float):
+        """
+        :param duration: время отправки уведомления в секундах
+        """
+        self.plugins[name] = self.plugins.get(name, 0) + duration * 1000
+
+    def finish(self, status):
+        # Незавершенные этапы (например, при отмене обновления)
+        for name in list(self._stage_starts):
+            self.end_stage(name)
+
+        self.status = getattr(status, 'name', status)
+        self.duration_ms = (time.perf_counter() - self._start) * 1000
+
+    def to_dict(self) -> dict:
+        return {
+            'started_at': self.started_at,
+            'type_run': self.type_run,
+            'status': self.status,
+            'duration_ms': round(self.duration_ms or 0, 3),
+            'stages': {k: round(v, 3) for k, v in self.stages.items()},
+            'parse_sites': {
+                k: round(v, 3) for k, v in self.parse_sites.items()
+            },
+            'parse_errors': self.parse_errors,
+            'db': {
+                'serials_inserted': self.db_serials_inserted,
+                'series_inserted': self.db_series_inserted,
+            },
+            'plugins': {k: round(v, 3) for k, v in self.plugins.items()},
+            'urls': self.urls,
+        }
+
+
+class RefreshInstrumentation:
+    """
+    Создает записи RefreshTiming и сохраняет их после завершения обновления
+    """
+    def __init__(self):
+        self.current: RefreshTiming = None
+
+        self._hooks = []
+        self._db_task_hooks = []
+        self._write_file = False
+        self._file_settings = None
+        self._metrics_logger = logging.getLogger('serial-notifier.metrics')
+        self._metrics_logger.setLevel(logging.INFO)
+        # Метрики пишутся только в свой файл, а не в общий лог
+        self._metrics_logger.propagate = False
+
+    @property
+    def enabled(self) -> bool:
+        return self._write_file or bool(self._hooks)
+
+    def add_hook(self, callback):
+        """
+        Подписывает на получение показателей завершенных обновлений
+        :param callback: функция, принимающая RefreshTiming
+        """
+        self._hooks.append(callback)
+
+    def remove_hook(self, callback):
+        self._hooks.remove(callback)
+
+    @property
+    def db_tasks_observed(self) -> bool:
+        return bool(self._db_task_hooks)
+
+    def add_db_task_hook(self, callback):
+        """
+        Подписывает на получение показателей выполнения заданий для БД
+        :param callback: функция, принимающая глубину очереди заданий, время
+        ожидания задания в очереди и время его выполнения (в секундах)
+        """
+        self._db_task_hooks.append(callback)
+
+    def remove_db_task_hook(self, callback):
+        self._db_task_hooks.remove(callback)
+
+    def db_task_done(self, queue_depth: int, wait: float, duration: float):
+        """
+        Передает подписчикам показатели выполненного задания для БД. Может
+        вызываться из любого потока
+        :param queue_depth: количество заданий, оставшихся в очереди
+        """
+        for callback in self._db_task_hooks:
+            try:
+                callback(queue_depth, wait, duration)
+            except Exception:
+                logger.exception(
+                    'Ошибка при передаче показателей задания для БД '
+                    'подписчику'
+                )
+
+    def configure(self, metrics_conf: dict):
+        """
+        Применяет настройки из секции metrics конфига программы
+        """
+        self._write_file = metrics_conf['enable']
+        if not self._write_file:
+            return
+
+        path = metrics_conf['path'] or 'metrics.jsonl'
+        if not isabs(path):
+            path = join(resources_dir, path)
+
+        file_settings = (
+            path, metrics_conf['max_size'], metrics_conf['backup_count']
+        )
+        if file_settings == self._file_settings:
+            return
+
+        for handler in self._metrics_logger.handlers[:]:
+            self._metrics_logger.removeHandler(handler)
+            handler.close()
+
+        handler = RotatingFileHandler(
+            path, maxBytes=file_settings[1], backupCount=file_settings[2],
+            encoding='utf-8'
+        )
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self._metrics_logger.addHandler(handler)
+        self._file_settings = file_settings
+
+    def begin(self, metrics_conf: dict, type_run: str) -> RefreshTiming:
+        """
+        Начинает запись показателей нового обновления
+        :param metrics_conf: секция metrics конфига программы
+        :param type_run: как было запущено обновление (timer, user, daemon)
+        :return: запись показателей или None, если замеры выключены
+        """
+        self.configure(metrics_conf)
+        self.current = RefreshTiming(type_run) if self.enabled else None
+        return self.current
+
+    def finish(self, status, timing: RefreshTiming = None):
+        """
+        Завершает запись показателей текущего обновления, сохраняет ее и
+        передает подписчикам
+        :param status: статус обновления
+        :param timing: запись показателей, если она завершается позже, чем
+        могло начаться следующее обновление (по умолчанию текущая)
+        """
+        if timing is None:
+            timing = self.current
+        if timing is self.current:
+            self.current = None
+        if timing is None:
+            return
+
+        timing.finish(status)
+
+        if self._write_file:
+            self._metrics_logger.info(
+                json.dumps(timing.to_dict(), ensure_ascii=False)
+            )
+
+        for callback in self._hooks:
+            try:
+                callback(timing)
+            except Exception:
+                logger.exception(
+                    'Ошибка при передаче показателей обновления подписчику'
+                )
+
+
+instrumentation = RefreshInstrumentation()
@@ -1,5 +1,10 @@
 import sys
+import time
+import atexit
 import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from queue import Queue
 
 import dependency_injector.containers as cnt
 import dependency_injector.providers as prv
@@ -7,6 +12,11 @@ import dependency_injector.providers as prv
 
 UNHANDLED_EXCEPTION_MSG = 'Возникла непредвиденная ошибка:'
 
+# Размер файла с логами, после которого он ротируется, и количество
+# хранимых старых файлов
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+
 
 class DIServices(cnt.DeclarativeContainer):
     unhandled_exception_message_box = prv.Provider()
@@ -47,6 +57,97 @@ def root_logger_cleaner():
         yield
 
 
+class DuplicateFilter(logging.Filter):
+    """
+    Отбрасывает повторяющиеся в рамках одного обновления предупреждения и
+    ошибки (например, одинаковые ошибки загрузки страницы при недоступности
+    сайта) и ограничивает частоту записи остальных. Критические ошибки не
+    отбрасываются
+    """
+    def __init__(self, rate: float = 20, burst: int = 100):
+        """
+        :param rate: количество сообщений в секунду
+        :param burst: количество сообщений, которые можно записать подряд
+        """
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.suppressed = 0
+
+        self._seen = set()
+        self._tokens = burst
+        self._updated_at = time.monotonic()
+        # Фильтр вызывается из разных потоков без блокировки обработчика
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not logging.WARNING <= record.levelno < logging.CRITICAL:
+            return True
+
+        key = (
+            record.levelno, record.pathname, record.lineno,
+            record.getMessage()
+        )
+        with self._lock:
+            return self._filter(key)
+
+    def _filter(self, key: tuple) -> bool:
+        if key in self._seen:
+            self.suppressed += 1
+            return False
+        self._seen.add(key)
+
+        now = time.monotonic()
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+        if self._tokens < 1:
+            self.suppressed += 1
+            return False
+
+        self._tokens -= 1
+        return True
+
+    def reset(self) -> int:
+        """
+        Начинает новый период дедупликации
+        :return: количество отброшенных за прошлый период сообщений
+        """
+        with self._lock:
+            suppressed, self.suppressed = self.suppressed, 0
+            self._seen.clear()
+        return suppressed
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    Передает записи в очередь без форматирования. Сообщение и traceback
+    форматируются в потоке QueueListener, а не в потоке, вызвавшем логгер
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Аргументы подставляются сразу, так как они могут измениться до
+        # записи в файл
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+duplicate_filter = DuplicateFilter()
+
+
+def reset_duplicate_filter():
+    """
+    Вызывается в начале обновления, чтобы повторяющиеся ошибки снова были
+    записаны один раз
+    """
+    suppressed = duplicate_filter.reset()
+    if suppressed:
+        logging.getLogger('serial-notifier').warning(
+            f'Отброшено повторяющихся сообщений: {suppressed}'
+        )
+
+
 def init_logger(path):
     """
     Инициализирует логгер, включает логгирование не перехваченных исключений
@@ -65,15 +166,24 @@ def init_logger(path):
     )
 
     # Создаётся обработчик,который будет писать сообщения в файл
-    file_handler = logging.FileHandler(path, encoding='UTF-8')
+    file_handler = RotatingFileHandler(
+        path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+        encoding='UTF-8'
+    )
     file_handler.setFormatter(file_formatter)
 
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(console_formatter)
-    console_handler.setFormatter(console_formatter)
 
-    # добавляем обработчики в logger
-    log.addHandler(file_handler)
-    log.addHandler(console_handler)
+    # Запись в файл и консоль выполняется в отдельном потоке, чтобы не
+    # блокировать цикл событий и рабочие потоки
+    log_queue = Queue()
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(duplicate_filter)
+    log.addHandler(queue_handler)
+
+    listener = QueueListener(log_queue, file_handler, console_handler)
+    listener.start()
+    atexit.register(listener.stop)
 
     sys.excepthook = unhandled_exception_hook
@@ -0,0 +1,313 @@
+"""
+Локальный HTTP сервер, отдающий показатели работы приложения в текстовом
+формате Prometheus (по адресу /metrics).
+
+Показатели собираются подписчиком instrumentation (PrometheusMetrics) из
+записей RefreshTiming завершенных обновлений и показателей выполнения
+заданий для БД. Сервер работает в уже существующем цикле событий asyncio
+(в GUI это цикл quamash, в котором работает AsyncDownloader) и не создает
+дополнительных потоков.
+"""
+import logging
+import threading
+from math import inf
+
+from enums import UpgradeState
+from instrumentation import instrumentation, RefreshTiming
+
+logger = logging.getLogger('serial-notifier')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Границы интервалов гистограмм в секундах
+FETCH_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+REFRESH_DURATION_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600)
+DB_TASK_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10)
+
+
+def _format_value(value) -> str:
+    if value == inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _escape_label_value(value) -> str:
+    return (
+        str(value).replace('\\', r'\\').replace('\n', r'\n')
+        .replace('"', r'\"')
+    )
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+
+    return '{' + ','.join(
+        f'{name}="{_escape_label_value(value)}"'
+        for name, value in labels.items()
+    ) + '}'
+
+
+class Metric:
+    """
+    Базовый класс показателя. Значения хранятся отдельно для каждого набора
+    значений меток (labels)
+    """
+    type_name = None
+
+    def __init__(self, name: str, description: str, labels: tuple = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labels):
+            raise ValueError(
+                f'Показатель {self.name} принимает метки {self.labels}'
+            )
+        return tuple(str(labels[i]) for i in self.labels)
+
+    def _samples(self):
+        """
+        :return: строки со значениями показателя в формате Prometheus
+        """
+        for key, value in sorted(self._values.items()):
+            labels = dict(zip(self.labels, key))
+            yield f'{self.name}{_format_labels(labels)} {_format_value(value)}'
+
+    def render(self) -> str:
+        with self._lock:
+            samples = list(self._samples())
+
+        return '\n'.join([
+            f'# HELP {self.name} {self.description}',
+            f'# TYPE {self.name} {self.type_name}',
+            *samples
+        ])
+
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def inc(self, value=1, **labels):
+        if value < 0:
+            raise ValueError('Значение счетчика не может уменьшаться')
+
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+
+class Gauge(Metric):
+    type_name = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name: str, description: str, labels: tuple = (),
+                 buckets: tuple = FETCH_LATENCY_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets)) + (inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            # [количество значений в каждом интервале, сумма значений]
+            counts, total = self._values.get(
+                key, ([0] * len(self.buckets), 0)
+            )
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def _samples(self):
+        for key, (counts, total) in sorted(self._values.items()):
+            labels = dict(zip(self.labels, key))
+            for bound, count in zip(self.buckets, counts):
+                bucket_labels = dict(labels, le=_format_value(bound))
+                yield (
+                    f'{self.name}_bucket{_format_labels(bucket_labels)} '
+                    f'{count}'
+                )
+            yield (
+                f'{self.name}_sum{_format_labels(labels)} '
+                f'{_format_value(total)}'
+            )
+            yield f'{self.name}_count{_format_labels(labels)} {counts[-1]}'
+
+
+class PrometheusMetrics:
+    """
+    Показатели работы приложения, заполняемые по данным instrumentation
+    """
+    def __init__(self):
+        self.refresh_total = Counter(
+            'serial_notifier_refresh_total',
+            'Количество обновлений по статусу завершения', ('status',)
+        )
+        self.refresh_duration = Histogram(
+            'serial_notifier_refresh_duration_seconds',
+            'Время выполнения обновления', buckets=REFRESH_DURATION_BUCKETS
+        )
+        self.fetch_latency = Histogram(
+            'serial_notifier_fetch_latency_seconds',
+            'Время загрузки страницы сериала', ('site',)
+        )
+        self.fetch_errors = Counter(
+            'serial_notifier_fetch_errors_total',
+            'Количество страниц, которые не удалось загрузить', ('site',)
+        )
+        self.downloaded_bytes = Counter(
+            'serial_notifier_downloaded_bytes_total',
+            'Размер загруженных страниц в байтах', ('site',)
+        )
+        self.parse_errors = Counter(
+            'serial_notifier_parse_errors_total',
+            'Количество страниц, которые не удалось разобрать', ('site',)
+        )
+        self.new_episodes = Counter(
+            'serial_notifier_new_episodes_total',
+            'Количество найденных новых серий'
+        )
+        self.db_queue_depth = Gauge(
+            'serial_notifier_db_queue_depth',
+            'Количество заданий для БД, ожидающих выполнения'
+        )
+        self.db_task_wait = Histogram(
+            'serial_notifier_db_task_wait_seconds',
+            'Время ожидания задания для БД в очереди', buckets=DB_TASK_BUCKETS
+        )
+        self.db_task_duration = Histogram(
+            'serial_notifier_db_task_duration_seconds',
+            'Время выполнения задания для БД', buckets=DB_TASK_BUCKETS
+        )
+
+        self.metrics = (
+            self.refresh_total, self.refresh_duration, self.fetch_latency,
+            self.fetch_errors, self.downloaded_bytes, self.parse_errors,
+            self.new_episodes, self.db_queue_depth, self.db_task_wait,
+            self.db_task_duration
+        )
+
+        # Счетчики статусов доступны еще до первого обновления
+        for status in UpgradeState:
+            self.refresh_total.inc(0, status=status.name)
+        self.new_episodes.inc(0)
+        self.db_queue_depth.set(0)
+
+    def refresh_complete(self, timing: RefreshTiming):
+        self.refresh_total.inc(status=timing.status)
+        self.refresh_duration.observe(timing.duration_ms / 1000)
+
+        for url in timing.urls:
+            site = url['site']
+            self.fetch_latency.observe(url['latency_ms'] / 1000, site=site)
+            self.downloaded_bytes.inc(url['bytes'], site=site)
+            if url['error']:
+                self.fetch_errors.inc(site=site)
+
+        for site, count in timing.parse_errors.items():
+            self.parse_errors.inc(count, site=site)
+
+        self.new_episodes.inc(timing.db_series_inserted)
+
+    def db_task_done(self, queue_depth: int, wait: float, duration: float):
+        self.db_queue_depth.set(queue_depth)
+        self.db_task_wait.observe(wait)
+        self.db_task_duration.observe(duration)
+
+    def subscribe(self):
+        instrumentation.add_hook(self.refresh_complete)
+        instrumentation.add_db_task_hook(self.db_task_done)
+
+    def unsubscribe(self):
+        instrumentation.remove_hook(self.refresh_complete)
+        instrumentation.remove_db_task_hook(self.db_task_done)
+
+    def render(self) -> str:
+        return '\n'.join(i.render() for i in self.metrics) + '\n'
+
+
+class MetricsServer:
+    """
+    HTTP сервер, работающий в текущем цикле событий asyncio
+    """
+    def __init__(self, metrics: PrometheusMetrics, host: str, port: int):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def handle_metrics(self, request):
+        from aiohttp import web
+
+        return web.Response(
+            body=self.metrics.render().encode('utf-8'),
+            headers={'Content-Type': CONTENT_TYPE}
+        )
+
+    async def start(self):
+        # aiohttp нужен только при включенном сервере
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle_metrics)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+        except Exception:
+            await self._runner.cleanup()
+            self._runner = None
+            raise
+
+        self.metrics.subscribe()
+
+    async def stop(self):
+        if self._runner is None:
+            return
+
+        self.metrics.unsubscribe()
+        await self._runner.cleanup()
+        self._runner = None
+
+
+async def start_metrics_server(metrics_conf: dict) -> MetricsServer:
+    """
+    Запускает сервер с показателями, если он включен в настройках
+    :param metrics_conf: секция metrics конфига программы
+    :return: запущенный сервер или None
+    """
+    if not metrics_conf['prometheus_enable']:
+        return None
+
+    server = MetricsServer(
+        PrometheusMetrics(), metrics_conf['prometheus_host'],
+        metrics_conf['prometheus_port']
+    )
+    try:
+        await server.start()
+    except Exception:
+        logger.exception(
+            f'Не удалось запустить сервер с показателями на '
+            f'{server.host}:{server.port}'
+        )
+        return None
+
+    logger.info(
+        f'Показатели доступны по адресу '
+        f'http://{server.host}:{server.port}/metrics'
+    )
+    return server
@@ -0,0 +1,93 @@
+"""
+Объединение уведомлений нескольких обновлений в одно (дайджест).
+
+При небольшом интервале обновления и большом количестве сериалов каждое
+обновление, нашедшее новые серии, приводит к отдельному уведомлению.
+NoticeDigest накапливает найденные серии в течение заданного времени
+(notice_digest.window) и отправляет их в плагины одним уведомлением без
+повторов.
+"""
+import asyncio
+
+from notice_plugins import (
+    NoticePluginsContainer, DIServices, UpdateCounterAction,
+    has_season_conflict, merge_updates
+)
+
+
+class NoticeDigest:
+    """
+    Накапливает данные о новых сериях и отправляет их через
+    NoticePluginsContainer.send_notice_everyone
+    """
+    def __init__(self):
+        self._data = {}
+        self._warning = ''
+        self._counter_action: UpdateCounterAction = None
+        self._timer: asyncio.TimerHandle = None
+
+    @property
+    def window(self) -> float:
+        return DIServices.conf_program()['notice_digest']['window']
+
+    @property
+    def pending(self) -> bool:
+        return bool(self._data)
+
+    def add(self, data, warning, counter_action: UpdateCounterAction = None,
+            flush=False):
+        """
+        Добавляет в дайджест серии, найденные при обновлении
+        :param data: данные о новых сериях
+        :param warning: предупреждение об ошибках при обновлении
+        :param counter_action: действие совершаемое со счетчиком
+        :param flush: отправить дайджест сразу, не дожидаясь окончания окна
+        :return: future отправки уведомлений (см. send_notice_everyone) или
+        None, если уведомление отложено
+        """
+        sent = []
+        # Разные сезоны одного сериала нельзя показать в одном уведомлении,
+        # поэтому накопленный дайджест отправляется раньше
+        if has_season_conflict(self._data, data):
+            sent.append(self.flush())
+
+        merge_updates(self._data, data)
+        # Предупреждение относится к последнему обновлению
+        self._warning = warning
+        self._counter_action = counter_action or self._counter_action
+
+        window = self.window
+        if flush or window <= 0:
+            sent.append(self.flush())
+        elif self._timer is None:
+            self._timer = asyncio.get_event_loop().call_later(
+                window, self.flush
+            )
+
+        sent = [i for i in sent if i is not None]
+        if not sent:
+            return None
+        return sent[0] if len(sent) == 1 else asyncio.gather(*sent)
+
+    def flush(self):
+        """
+        Отправляет накопленные серии одним уведомлением
+        :return: future отправки уведомлений или None, если дайджест пуст
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if not self._data:
+            return None
+
+        data, warning, counter_action = (
+            self._data, self._warning, self._counter_action
+        )
+        self._data = {}
+        self._warning = ''
+        self._counter_action = None
+
+        return NoticePluginsContainer.send_notice_everyone(
+            data, warning, counter_action
+        )
@@ -0,0 +1,298 @@
+"""
+Фоновая отправка уведомлений потокобезопасными и асинхронными плагинами.
+
+Уведомления сохраняются в таблицу notice_outbox, поэтому они не теряются,
+если плагин не смог их отправить или приложение было закрыто до отправки.
+OutboxDispatcher работает в цикле событий asyncio. Очередь каждого плагина
+разбирает отдельная задача: она отправляет накопившиеся уведомления одним
+вызовом send_notice (пачкой), отмечает доставленные уведомления и
+откладывает отправку не доставленных с экспоненциально растущей задержкой.
+Медленный или недоступный получатель не задерживает обновления и отправку
+уведомлений другими плагинами.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from db.outbox import OutboxStorage
+from notice_plugins import (
+    NoticePluginsContainer, DIServices, NoticeRejected, UpdateCounterAction,
+    has_season_conflict, merge_updates
+)
+
+logger = logging.getLogger('serial-notifier')
+
+# Как часто удаляются старые записи из очереди (в секундах)
+PURGE_INTERVAL = 60 * 60
+
+
+def merge_notices(payloads: list) -> tuple:
+    """
+    Объединяет уведомления в одно. Сериал, у которого в разных уведомлениях
+    разные сезоны, не может быть в одном уведомлении, поэтому объединение
+    прекращается на первом таком уведомлении
+    :param payloads: данные уведомлений в порядке их добавления в очередь
+    :return: количество объединенных уведомлений, данные о новых сериях,
+    предупреждение и действие со счетчиком
+    """
+    data = {}
+    warning = ''
+    counter_action = None
+    merged = 0
+    for payload in payloads:
+        if has_season_conflict(data, payload['data']):
+            break
+
+        merge_updates(data, payload['data'])
+
+        # Предупреждение относится к последнему обновлению
+        warning = payload['warning'] or warning
+        if payload['counter_action']:
+            counter_action = UpdateCounterAction(payload['counter_action'])
+        merged += 1
+
+    return merged, data, warning, counter_action
+
+
+class OutboxDispatcher:
+    """
+    Отправляет уведомления из очереди notice_outbox
+    """
+    def __init__(self):
+        self.storage = OutboxStorage()
+
+        # Запросы к БД выполняются в отдельном потоке, чтобы не блокировать
+        # цикл событий
+        self._db_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='notice-outbox'
+        )
+        self._task: asyncio.Task = None
+        # Задачи, отправляющие уведомления плагинов, и события, которые
+        # будят их при добавлении уведомлений в очередь: название плагина ->
+        # задача/событие
+        self._workers = {}
+        self._wakeups = {}
+        # Показатели обновления, уведомления которого сейчас отправляются
+        self._timing = None
+
+    @property
+    def settings(self) -> dict:
+        return DIServices.conf_program()['notice_outbox']
+
+    @staticmethod
+    def get_plugins() -> dict:
+        return {
+            name: plugin
+            for name, plugin in NoticePluginsContainer.get_plugins().items()
+            if plugin.is_background
+        }
+
+    async def _run_db(self, func, *args):
+        return await asyncio.get_event_loop().run_in_executor(
+            self._db_executor, func, *args
+        )
+
+    def start(self):
+        """
+        Запускает отправку уведомлений, в том числе оставшихся в очереди
+        после прошлого запуска приложения
+        """
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        tasks = list(self._workers.values())
+        if self._task is not None:
+            tasks.append(self._task)
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        self._task = None
+        self._workers.clear()
+        self._wakeups.clear()
+        self._db_executor.shutdown()
+
+    def wakeup(self, name: str):
+        """
+        Запускает отправку уведомлений из очереди плагина
+        :param name: название плагина
+        """
+        if self._task is None:
+            return
+
+        worker = self._workers.get(name)
+        if worker is None or worker.done():
+            self._wakeups[name] = asyncio.Event()
+            self._workers[name] = asyncio.ensure_future(
+                self._run_plugin(name)
+            )
+        self._wakeups[name].set()
+
+    async def enqueue(self, plugins: list, data, warning,
+                      counter_action: UpdateCounterAction = None,
+                      timing=None):
+        """
+        Ставит уведомление в очередь плагинов
+        :param plugins: названия плагинов
+        :param timing: показатели обновления, в которые добавляется время
+        отправки уведомлений
+        """
+        if not plugins:
+            return
+
+        payload = {
+            'data': data,
+            'warning': warning,
+            'counter_action': counter_action and counter_action.value,
+        }
+        try:
+            await self._run_db(self.storage.enqueue, plugins, payload)
+        except Exception:
+            logger.exception(
+                'Не удалось сохранить уведомления в очередь, они будут '
+                'отправлены без сохранения'
+            )
+            await asyncio.gather(*(
+                self._send(name, NoticePluginsContainer.plugins[name],
+                           data, warning, counter_action)
+                for name in plugins
+            ), return_exceptions=True)
+            return
+
+        self._timing = timing
+        for name in plugins:
+            self.wakeup(name)
+
+    async def _run(self):
+        """
+        Запускает отправку уведомлений, оставшихся в очереди после прошлого
+        запуска, и периодически удаляет старые уведомления
+        """
+        try:
+            pending = await self._run_db(self.storage.get_pending_plugins)
+        except Exception:
+            logger.exception('Не удалось получить уведомления из очереди')
+            pending = set()
+
+        # Плагины создаются при первой отправке уведомления, поэтому, пока
+        # очередь пуста, они не загружаются
+        for name in pending:
+            self.wakeup(name)
+
+        while True:
+            try:
+                await self._purge()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Не удалось удалить старые уведомления')
+
+            await asyncio.sleep(PURGE_INTERVAL)
+
+    async def _purge(self):
+        undelivered = await self._run_db(
+            self.storage.purge, self.settings['max_age']
+        )
+        if undelivered:
+            logger.error(
+                f'Из очереди удалены уведомления, которые не удалось '
+                f'доставить: {undelivered}'
+            )
+
+    async def _run_plugin(self, name: str):
+        """
+        Отправляет уведомления плагина по мере их появления в очереди и
+        повторяет отправку не доставленных
+        """
+        wakeup = self._wakeups[name]
+        while True:
+            # Событие сбрасывается до отправки, чтобы не потерять
+            # уведомления, добавленные во время нее
+            wakeup.clear()
+            try:
+                timeout = await self._dispatch_plugin(name)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(
+                    f'Ошибка при отправке уведомлений плагином {name}'
+                )
+                timeout = self.settings['retry_delay']
+
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _dispatch_plugin(self, name: str) -> float:
+        """
+        Отправляет уведомления плагина, время отправки которых наступило
+        :return: время до следующей попытки отправки в секундах или None,
+        если очередь плагина пуста
+        """
+        plugin = self.get_plugins().get(name)
+        if plugin is None:
+            # Плагин выключен, его уведомления остаются в очереди до
+            # удаления по max_age
+            return None
+
+        settings = self.settings
+        while True:
+            rows = await self._run_db(
+                self.storage.get_due, name, settings['batch_size']
+            )
+            if not rows:
+                break
+
+            merged, data, warning, counter_action = merge_notices(
+                [payload for _, _, payload, _ in rows]
+            )
+            ids = [id_ for id_, _, _, _ in rows[:merged]]
+            notice_ids = [notice_id for _, notice_id, _, _ in rows[:merged]]
+
+            try:
+                await self._send(
+                    name, plugin, data, warning, counter_action, notice_ids
+                )
+            except asyncio.CancelledError:
+                raise
+            except NoticeRejected as e:
+                logger.error(
+                    f'Плагин {name} не отправил уведомление, повторов не '
+                    f'будет: {e}'
+                )
+            except Exception as e:
+                attempts = rows[0][3] + 1
+                logger.error(
+                    f'Плагин {name} не отправил уведомление (попытка '
+                    f'{attempts}): {type(e).__name__} {e}'
+                )
+                await self._run_db(
+                    self.storage.fail, ids, f'{type(e).__name__} {e}',
+                    settings['retry_delay'], settings['max_retry_delay']
+                )
+                break
+
+            await self._run_db(self.storage.ack, ids)
+
+        next_attempt_at = await self._run_db(
+            self.storage.get_next_attempt_at, name
+        )
+        if next_attempt_at is None:
+            return None
+        return max(0, next_attempt_at - time.time())
+
+    async def _send(self, name: str, plugin, *args):
+        timing = self._timing
+        started = time.perf_counter()
+        try:
+            await NoticePluginsContainer.send_notice_in_background(
+                plugin, *args
+            )
+        finally:
+            # Время учитывается, только если обновление еще не завершено
+            if timing is not None and timing.status is None:
+                timing.add_plugin_time(name, time.perf_counter() - started)
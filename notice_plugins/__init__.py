@@ -1,15 +1,40 @@
-import glob
 import enum
+import time
+import asyncio
 import logging
-from os.path import join, dirname, basename, isfile
+import importlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 import dependency_injector.containers as cnt
 import dependency_injector.providers as prv
 
 from config_readers import ConfigsProgram
+from instrumentation import instrumentation
+from profiling import profiler
 
 logger = logging.getLogger('serial-notifier')
 
+# Количество потоков для отправки уведомлений потокобезопасными плагинами
+NOTICE_THREAD_COUNT = 4
+
+# Модуль, в котором объявлен плагин, и нужен ли плагину GUI (None - станет
+# известно после импорта модуля, см. BaseNoticePlugin.requires_gui)
+PluginSpec = namedtuple('PluginSpec', ['module', 'requires_gui'])
+
+# Встроенные плагины. Модуль плагина импортируется, только если плагин
+# включен или для него еще нет настроек
+PLUGIN_MANIFEST = {
+    'system_notice': PluginSpec('notice_plugins.system', True),
+    'board_notices': PluginSpec('notice_plugins.system', True),
+    'notice_file': PluginSpec('notice_plugins.file', False),
+    'notice_webhook': PluginSpec('notice_plugins.webhook', False),
+}
+
+# Группа entry points, через которую сторонние пакеты добавляют плагины.
+# Название entry point - название плагина, значение - модуль с плагином
+PLUGIN_ENTRY_POINT_GROUP = 'serial_notifier.notice_plugins'
+
 
 class DIServices(cnt.DeclarativeContainer):
     app = prv.Provider()
@@ -18,6 +43,14 @@ class DIServices(cnt.DeclarativeContainer):
     board_notices = prv.Provider()
 
     conf_program = prv.Provider()
+    notice_outbox = prv.Provider()
+
+
+class NoticeRejected(Exception):
+    """
+    Уведомление отклонено получателем, повторять отправку бессмысленно
+    """
+    pass
 
 
 class UpdateCounterAction(enum.Enum):
@@ -31,6 +64,7 @@ class NoticePluginMount(type):
     def __init__(cls, name, bases, attrs):
         if not hasattr(cls, 'plugins'):
             cls.plugins = {}
+            cls.plugin_classes = {}
         else:
             check = NoticePluginMount.check_requirements(cls)
             if check:
@@ -51,33 +85,96 @@ class NoticePluginMount(type):
         return not bool(missing)
 
     def registration_plugin(cls):
-        config_program = DIServices.conf_program()
-        if not config_program.get(cls.name, None):
-            default_setting = {}
-            default_setting.update(BaseNoticePlugin.default_setting)
-            default_setting.update(cls.default_setting)
-            config_program.write({cls.name: default_setting})
-
-        if config_program[cls.name]['enable'] == 'yes':
-            cls.plugins[cls.name] = cls()
+        # Экземпляр плагина создается при первой отправке уведомления (см.
+        # NoticePluginsContainer.get_plugins)
+        cls.plugin_classes[cls.name] = cls
 
 
 class NoticePluginsContainer(metaclass=NoticePluginMount):
     count = 0
 
+    _executor: ThreadPoolExecutor = None
+    # Включенные плагины, экземпляры которых еще не созданы
+    _enabled = {}
+    _headless = False
+
     @classmethod
     def send_notice_everyone(cls, data, warning,
                              counter_action: UpdateCounterAction = None):
         """
-        Отправляет уведомления во все зарегистрированные плагины
+        Отправляет уведомления во все зарегистрированные плагины. Плагины,
+        работающие с виджетами, вызываются сразу в текущем потоке, а для
+        потокобезопасных и асинхронных плагинов уведомление ставится в
+        очередь (notice_outbox), из которой они отправляют его в фоне
         :param data: данные, которые будут выведены в уведомлении
         :param warning: содержит предупреждение, если при доступе к каким-то
         источникам обновлений возникли проблемы
         :param counter_action: действие совершаемое со счетчиком
-        :return:
+        :return: future, который завершается после постановки уведомлений в
+        очередь
+        """
+        timing = instrumentation.current
+        background = []
+        for name, plugin in cls.get_plugins().items():
+            if plugin.is_background:
+                background.append(name)
+                continue
+
+            started = time.perf_counter() if timing is not None else 0
+            try:
+                plugin.send_notice(data, warning, counter_action)
+            except Exception:
+                logger.exception(f'Плагин {name} не отправил уведомление')
+            if timing is not None:
+                timing.add_plugin_time(name, time.perf_counter() - started)
+
+        return asyncio.ensure_future(DIServices.notice_outbox().enqueue(
+            background, data, warning, counter_action, timing
+        ))
+
+    @classmethod
+    async def send_notice_in_background(cls, plugin, data, warning,
+                                        counter_action=None, notice_ids=None):
+        """
+        Отправляет уведомление потокобезопасным или асинхронным плагином, не
+        блокируя цикл событий
+        :param notice_ids: идентификаторы уведомлений из очереди, объединенных
+        в это уведомление
+        :raise asyncio.TimeoutError: плагин не отправил уведомление за
+        plugin.notice_timeout секунд
+        """
+        args = (data, warning, counter_action, notice_ids)
+        if plugin.is_async:
+            sending = plugin.send_notice(*args)
+        else:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(
+                    NOTICE_THREAD_COUNT, thread_name_prefix='notice-plugin'
+                )
+            sending = asyncio.get_event_loop().run_in_executor(
+                cls._executor, cls._send_notice_in_thread, plugin, *args
+            )
+
+        # Поток с плагином при превышении времени не прерывается, но
+        # результат больше не ждем
+        await asyncio.wait_for(sending, plugin.notice_timeout)
+
+    @staticmethod
+    def _send_notice_in_thread(plugin, *args):
+        with profiler.thread_profile('NoticePlugin'):
+            plugin.send_notice(*args)
+
+    @classmethod
+    async def close_plugins(cls):
+        """
+        Освобождает ресурсы плагинов (например, сетевые соединения) перед
+        завершением работы приложения
         """
         for name, plugin in cls.plugins.items():
-            plugin.send_notice(data, warning, counter_action)
+            try:
+                await plugin.close()
+            except Exception:
+                logger.exception(f'Ошибка при закрытии плагина {name}')
 
     @classmethod
     def update_all_counters(cls, counter_action=UpdateCounterAction.ADD):
@@ -88,32 +185,222 @@ class NoticePluginsContainer(metaclass=NoticePluginMount):
                 pass
 
     @classmethod
-    def load_notice_plugins(cls):
-        plugin_modules = [
-            f'{__name__}.{basename(f)[:-3]}' for f in
-            glob.glob(join(dirname(__file__), "*.py"))
-            if isfile(f) and not f.endswith('__init__.py')
-        ]
+    def load_notice_plugins(cls, headless=False):
+        """
+        Находит встроенные (PLUGIN_MANIFEST) и сторонние (entry points)
+        плагины и запоминает включенные. Модули плагинов без настроек
+        импортируются, чтобы записать их настройки по умолчанию, модули
+        остальных включенных плагинов импортируются при первой отправке
+        уведомления, а отключенных не импортируются
+        :param headless: если True, то плагины, которым нужен GUI, не
+        загружаются
+        """
+        config_program = DIServices.conf_program()
+        new_settings = {}
+        enabled = {}
+
+        for name, spec in cls._find_plugins().items():
+            if headless and spec.requires_gui:
+                continue
+
+            settings = config_program.get(name, None)
+            if not settings:
+                plugin_cls = cls._import_plugin(name, spec)
+                if plugin_cls is None or (headless and
+                                          plugin_cls.requires_gui):
+                    continue
+
+                settings = {}
+                settings.update(BaseNoticePlugin.default_setting)
+                settings.update(plugin_cls.default_setting)
+                new_settings[name] = settings
+
+            if settings['enable'] == 'yes':
+                enabled[name] = spec
 
-        for i in plugin_modules:
-            __import__(i, locals(), globals())
+        # Настройки новых плагинов записываются в файл за один раз
+        if new_settings:
+            config_program.write(new_settings)
+
+        cls._enabled = enabled
+        cls._headless = headless
+
+    @staticmethod
+    def _find_plugins() -> dict:
+        """
+        :return: {название плагина: PluginSpec}
+        """
+        plugins = dict(PLUGIN_MANIFEST)
+
+        try:
+            from importlib.metadata import entry_points
+        except ImportError:
+            # Python < 3.8, сторонние плагины не поддерживаются
+            return plugins
+
+        all_entry_points = entry_points()
+        if hasattr(all_entry_points, 'select'):
+            found = all_entry_points.select(group=PLUGIN_ENTRY_POINT_GROUP)
+        else:
+            found = all_entry_points.get(PLUGIN_ENTRY_POINT_GROUP, [])
+
+        for entry_point in found:
+            plugins.setdefault(entry_point.name, PluginSpec(
+                entry_point.value.split(':')[0].strip(), None
+            ))
+        return plugins
+
+    @classmethod
+    def _import_plugin(cls, name: str, spec: PluginSpec):
+        """
+        Импортирует модуль плагина
+        :return: класс плагина или None, если плагин не удалось загрузить
+        """
+        try:
+            importlib.import_module(spec.module)
+        except Exception:
+            logger.exception(
+                f'Не удалось загрузить модуль {spec.module} плагина {name}'
+            )
+            return None
+
+        plugin_cls = cls.plugin_classes.get(name)
+        if plugin_cls is None:
+            logger.error(f'Модуль {spec.module} не содержит плагин {name}')
+        return plugin_cls
+
+    @classmethod
+    def get_plugins(cls) -> dict:
+        """
+        Возвращает включенные плагины. При первом вызове импортирует модули
+        плагинов и создает их экземпляры
+        :return: {название плагина: плагин}
+        """
+        if not cls._enabled:
+            return cls.plugins
+
+        enabled, cls._enabled = cls._enabled, {}
+        for name, spec in enabled.items():
+            plugin_cls = cls._import_plugin(name, spec)
+            if plugin_cls is None or (cls._headless and
+                                      plugin_cls.requires_gui):
+                continue
+
+            try:
+                cls.plugins[name] = plugin_cls()
+            except Exception:
+                logger.exception(f'Не удалось создать плагин {name}')
+
+        return cls.plugins
+
+
+def iter_episodes(data):
+    """
+    Разворачивает данные о новых сериях в плоский список записей, по одной
+    на каждую серию. Используется для вывода уведомлений в машиночитаемом
+    виде
+    :param data: данные о сериалах с новыми сериями
+    Пример:
+    {'filin': {'Вызов': ('http://filin.tv/vyzov.html', {'Серия': [2, 3], 'Сезон': 1})}}
+    """
+    for site_name, serials in data.items():
+        for serial_name, (url, serial_data) in serials.items():
+            for episode in serial_data['Серия']:
+                yield {
+                    'site': site_name,
+                    'serial': serial_name,
+                    'url': url,
+                    'season': serial_data['Сезон'],
+                    'episode': episode,
+                }
+
+
+def has_season_conflict(data, other) -> bool:
+    """
+    Проверяет, есть ли в other сериалы, у которых в data указан другой сезон.
+    Такие данные нельзя объединить в одно уведомление
+    """
+    return any(
+        serial in data.get(site_name, {}) and
+        data[site_name][serial][1]['Сезон'] != serial_data['Сезон']
+        for site_name, serials in other.items()
+        for serial, (url, serial_data) in serials.items()
+    )
+
+
+def merge_updates(data, other):
+    """
+    Добавляет в data новые серии из other, повторяющиеся серии отбрасываются
+    :param data: данные о новых сериях, в которые добавляются серии
+    :param other: добавляемые данные (не изменяются)
+    """
+    for site_name, serials in other.items():
+        for serial, (url, serial_data) in serials.items():
+            _, target = data.setdefault(site_name, {}).setdefault(
+                serial, (url, {'Серия': [], 'Сезон': serial_data['Сезон']})
+            )
+            target['Серия'] = sorted(
+                set(target['Серия']) | set(serial_data['Серия'])
+            )
 
 
 class BaseNoticePlugin:
     default_setting = {
         'enable': 'yes'
     }
+    # Плагин не работает с виджетами и может отправлять уведомления из
+    # рабочего потока. Плагин с асинхронным send_notice выполняется в цикле
+    # событий asyncio. Такие плагины получают уведомления через очередь
+    # notice_outbox, а ошибка отправки (исключение в send_notice) приводит к
+    # повторной отправке. Исключение NoticeRejected отменяет повторы
+    thread_safe = False
+    # Плагину для работы необходим GUI, в консольных режимах работы
+    # приложения он не загружается
+    requires_gui = False
+    # Максимальное время отправки уведомления в секундах (для потокобезопасных
+    # и асинхронных плагинов)
+    notice_timeout = 30
 
     def __init__(self):
         self.conf_program: ConfigsProgram = DIServices.conf_program()
 
-    def send_notice(self, data, warning, counter_action: UpdateCounterAction=None):
+    def _get_setting(self, option, convert=str):
+        """
+        Возвращает параметр плагина из конфига
+        :param option: название параметра
+        :param convert: функция приведения значения к нужному типу, если
+        значение некорректно, используется значение из default_setting
+        """
+        # В конфиге, созданном старой версией, новых параметров может не быть
+        settings = self.conf_program.get(self.name, {})
+        try:
+            return convert(settings.get(option, self.default_setting[option]))
+        except ValueError:
+            return convert(self.default_setting[option])
+
+    @property
+    def is_async(self) -> bool:
+        return asyncio.iscoroutinefunction(self.send_notice)
+
+    @property
+    def is_background(self) -> bool:
+        """
+        Уведомления отправляются в фоне через очередь notice_outbox
+        """
+        return self.is_async or self.thread_safe
+
+    def send_notice(self, data, warning, counter_action: UpdateCounterAction=None,
+                    notice_ids: list = None):
         """
         :param data: данные, которые нужно отобразить в уведомлении
         :param warning: содержит предупреждение, если при доступе к каким-то
         источникам обновлений возникли проблемы
         :param counter_action: указывает, что нужно сделать: обновить счетчик
         или убрать счетчик. Может иметь значения add или clear.
+        :param notice_ids: идентификаторы уведомлений из очереди
+        notice_outbox, объединенных в это уведомление (только для
+        потокобезопасных и асинхронных плагинов). Не меняются при повторных
+        попытках отправки, по ним получатель может отбросить повторы
         """
         raise NotImplementedError
 
@@ -126,6 +413,12 @@ class BaseNoticePlugin:
         """
         raise NotImplementedError
 
+    async def close(self):
+        """
+        Освобождает ресурсы плагина перед завершением работы приложения
+        """
+        pass
+
     def build_notice(self, data) -> str:
         """
         Собирает из присланных данных строку с уведомлением, которое будет
@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import threading
+from os.path import exists
+
+from . import (
+    NoticePluginsContainer, BaseNoticePlugin, UpdateCounterAction,
+    iter_episodes
+)
+
+
+class NoticeFile(NoticePluginsContainer, BaseNoticePlugin):
+    name = 'notice_file'
+    description = 'Записывает уведомления в указанный файл'
+    default_setting = {
+        'enable': 'no',
+        'path': './serial_notifier.txt',
+        # text - текст уведомления, jsonl - по одной серии на строку в
+        # формате JSON
+        'format': 'text',
+        # Размер файла в мегабайтах, после которого он ротируется, и
+        # количество хранимых старых файлов (0 - без ротации)
+        'max_size': '5',
+        'backup_count': '3'
+    }
+    thread_safe = True
+
+    def __init__(self):
+        super().__init__()
+        self._file = None
+        self._file_path = None
+        # send_notice может вызываться одновременно из нескольких потоков
+        self._lock = threading.Lock()
+
+    def format_notice(self, data) -> str:
+        if self._get_setting('format') == 'jsonl':
+            now = time.strftime('%Y-%m-%dT%H:%M:%S')
+            return ''.join(
+                json.dumps(dict(episode, time=now), ensure_ascii=False) + '\n'
+                for episode in iter_episodes(data)
+            )
+
+        return (
+            f'{time.strftime("(%Y-%m-%d) (%H:%M:%S)")} '
+            f'{self.build_notice(data)}\n\n\n'
+        )
+
+    def send_notice(self, data, warning,
+                    counter_action: UpdateCounterAction = None,
+                    notice_ids: list = None):
+        # Уведомления записываются сразу, потому что очередь notice_outbox
+        # считает их доставленными после возврата из send_notice. Накопившиеся
+        # в очереди уведомления и так передаются одним вызовом (пачкой)
+        notice = self.format_notice(data)
+        with self._lock:
+            try:
+                self._write(notice)
+            except OSError:
+                # Очередь повторит отправку, файл будет открыт заново
+                self._close_file()
+                raise
+
+    async def close(self):
+        with self._lock:
+            self._close_file()
+
+    def _write(self, content: str):
+        path = self._get_setting('path')
+        if self._file is None or self._file_path != path:
+            self._open_file(path)
+
+        data = content.encode('utf-8')
+        max_size = int(self._get_setting('max_size', float) * 1024 * 1024)
+        backup_count = self._get_setting('backup_count', int)
+        position = self._file.tell()
+        if (max_size and backup_count and position and
+                position + len(data) > max_size):
+            self._rotate(backup_count)
+
+        self._file.write(data)
+        self._file.flush()
+
+    def _open_file(self, path: str):
+        self._close_file()
+        self._file_path = path
+        self._file = open(path, 'ab')
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _rotate(self, backup_count: int):
+        """
+        Переименовывает файл в <path>.1, а старые файлы в <path>.2 и т.д.
+        """
+        self._close_file()
+
+        for i in range(backup_count - 1, 0, -1):
+            source = f'{self._file_path}.{i}'
+            if exists(source):
+                os.replace(source, f'{self._file_path}.{i + 1}')
+        os.replace(self._file_path, f'{self._file_path}.1')
+
+        self._open_file(self._file_path)
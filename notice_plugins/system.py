@@ -1,5 +1,5 @@
 import sys
-import time
+from collections import OrderedDict
 
 from PyQt5 import QtWidgets, QtGui, QtCore
 
@@ -9,11 +9,21 @@ from . import (
     NoticePluginsContainer, DIServices, BaseNoticePlugin, UpdateCounterAction
 )
 
+# Количество иконок со счетчиком, которые хранятся в кэше (по 64 значения
+# счетчика для иконки в трее и иконки приложения)
+BADGE_CACHE_SIZE = 128
+
 
 class DesktopNotice(NoticePluginsContainer, BaseNoticePlugin):
     name = 'system_notice'
     description = ('Показывает стандартные системные уведомления и изменяет '
                    'состояния счетчика новых уведомлений на иконке приложения')
+    requires_gui = True
+    # Радиус кружка со счетчиком на иконке
+    badge_radius = {
+        'tray': 35,
+        'task_bar': 170
+    }
 
     def __init__(self):
         super().__init__()
@@ -36,6 +46,8 @@ class DesktopNotice(NoticePluginsContainer, BaseNoticePlugin):
         self.tray_icon: SystemTrayIcon = DIServices.tray_icon()
 
         self.clean_icon = self.tray_icon.icons['normal']
+        # Иконки со счетчиком: (target, count, device pixel ratio) -> QIcon
+        self._badge_cache = OrderedDict()
 
         for target, fonts in font_size.items():
             size = fonts.get(sys.platform, None)
@@ -65,45 +77,78 @@ class DesktopNotice(NoticePluginsContainer, BaseNoticePlugin):
             return
 
         self.count += 1
-        count = str(self.count)
 
-        self.app.setWindowIcon(
-            self._draw_counter(self.app.icon, self.font_task_bar, count, 170)
-        )
+        self.app.setWindowIcon(self._get_badge_icon('task_bar', self.count))
 
         # Сохраняем картинку со счетчиком, чтобы после обновления
         # восстановить её
-        self.tray_icon.icons['normal'] = self._draw_counter(
-                self.tray_icon.icons['normal'], self.font_tray, count, 35
-            )
+        self.tray_icon.icons['normal'] = self._get_badge_icon(
+            'tray', self.count
+        )
         self.tray_icon.setIcon(self.tray_icon.icons['normal'])
 
+    def _get_badge_icon(self, target: str, count: int) -> QtGui.QIcon:
+        """
+        Возвращает иконку со счетчиком из кэша, при отсутствии рисует
+        счетчик на иконке без счетчика
+        :param target: tray - иконка в трее, task_bar - иконка приложения
+        :param count: количество новых уведомлений
+        """
+        key = (target, count, self.app.devicePixelRatio())
+        icon = self._badge_cache.get(key)
+        if icon is not None:
+            self._badge_cache.move_to_end(key)
+            return icon
+
+        clean_icon = self.clean_icon if target == 'tray' else self.app.icon
+        icon = self._draw_counter(
+            clean_icon, getattr(self, f'font_{target}'), str(count),
+            self.badge_radius[target], key[2]
+        )
+
+        self._badge_cache[key] = icon
+        if len(self._badge_cache) > BADGE_CACHE_SIZE:
+            self._badge_cache.popitem(last=False)
+        return icon
+
     def _draw_counter(self, icon: QtGui.QIcon, font: QtGui.QFont, count: str,
-                      radius: int):
+                      radius: int, ratio: float = 1):
         """
         Рисует на иконке приложения количество новых уведомлений
         :param icon: иконка на которой будет рисоваться счетчик
         :param font: шрифт используемый для рисования счетчика
         :param count: количество новых уведомлений
         :param radius: радиус кружка в котором будет размещатьс счечик
+        :param ratio: device pixel ratio экрана, картинка рисуется в
+        соответствующем разрешении
         :return новая иконка
         """
         icon_size = icon.availableSizes()[0]
-        pixmap = icon.pixmap(icon_size)
+        physical_size = icon_size * ratio
+        pixmap = icon.pixmap(physical_size)
+        if pixmap.size() != physical_size:
+            # Иконки из файлов не увеличиваются больше своего размера, без
+            # масштабирования логический размер картинки был бы меньше
+            pixmap = pixmap.scaled(
+                physical_size, QtCore.Qt.KeepAspectRatio,
+                QtCore.Qt.SmoothTransformation
+            )
+        pixmap.setDevicePixelRatio(ratio)
 
         painter_app_icon = QtGui.QPainter(pixmap)
         painter_app_icon.setRenderHint(QtGui.QPainter.Antialiasing)
         painter_app_icon.drawPixmap(
-            pixmap.width() - (radius + 3), 1,
-            self._draw_circle(font, count, radius)
+            icon_size.width() - (radius + 3), 1,
+            self._draw_circle(font, count, radius, ratio)
         )
 
         painter_app_icon.end()
 
         return QtGui.QIcon(pixmap)
 
-    def _draw_circle(self, font, text, radius):
-        circle = QtGui.QPixmap(radius, radius)
+    def _draw_circle(self, font, text, radius, ratio=1):
+        circle = QtGui.QPixmap(int(radius * ratio), int(radius * ratio))
+        circle.setDevicePixelRatio(ratio)
         # Избавляет от шумов на изображении
         circle.fill(QtGui.QColor(0, 0, 0, 0))
 
@@ -119,7 +164,7 @@ class DesktopNotice(NoticePluginsContainer, BaseNoticePlugin):
         text_option.setAlignment(QtCore.Qt.AlignCenter)
 
         painter_circle.drawText(
-            QtCore.QRectF(circle.rect()),
+            QtCore.QRectF(0, 0, radius, radius),
             text,
             text_option)
         painter_circle.end()
@@ -127,30 +172,11 @@ class DesktopNotice(NoticePluginsContainer, BaseNoticePlugin):
         return circle
 
 
-class NoticeFile(NoticePluginsContainer, BaseNoticePlugin):
-    name = 'notice_file'
-    description = 'Записывает уведомления в указанный файл'
-    default_setting = {
-        'enable': 'no',
-        'path': './serial_notifier.txt'
-    }
-
-    def __init__(self):
-        super().__init__()
-
-    def send_notice(self, data, warning,
-                    counter_action: UpdateCounterAction = None):
-        with open(self.conf_program['general']['path'], 'a') as out:
-            out.write(
-                f'{time.strftime("(%Y-%m-%d) (%H:%M:%S)")} '
-                f'{self.build_notice(data)}\n\n\n'
-            )
-
-
 class BoardNotices(NoticePluginsContainer, BaseNoticePlugin):
     name = 'board_notices'
     description = ('Отображает уведомления о новых сериалах в специальном '
                    'виджете главного окна приложения')
+    requires_gui = True
 
     def __init__(self):
         super().__init__()
@@ -0,0 +1,223 @@
+import re
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+
+import aiohttp
+
+from . import (
+    NoticePluginsContainer, BaseNoticePlugin, UpdateCounterAction,
+    NoticeRejected, iter_episodes
+)
+
+# Количество пачек уведомлений, для которых запоминаются адреса, уже
+# принявшие их (см. NoticeWebhook.send_notice)
+DONE_URLS_CACHE_SIZE = 128
+
+
+class WebhookError(NoticeRejected):
+    """
+    Ответ сервера, после которого повторять запрос бессмысленно
+    """
+    pass
+
+
+class NoticeWebhook(NoticePluginsContainer, BaseNoticePlugin):
+    name = 'notice_webhook'
+    description = ('Отправляет новые серии POST запросом в формате JSON на '
+                   'указанные адреса')
+    default_setting = {
+        'enable': 'no',
+        # Адреса через запятую или с новой строки
+        'urls': '',
+        # Время ожидания ответа в секундах
+        'timeout': '10',
+        # Количество повторных попыток и задержка перед первой из них в
+        # секундах (каждая следующая задержка в 2 раза больше)
+        'retries': '3',
+        'retry_delay': '1',
+        # Количество одновременно отправляемых запросов
+        'concurrency': '4'
+    }
+
+    def __init__(self):
+        super().__init__()
+        # Сессия создается в цикле событий при первой отправке и
+        # переиспользует соединения между обновлениями
+        self._session: aiohttp.ClientSession = None
+        self._semaphore: asyncio.Semaphore = None
+        # Idempotency-Key -> адреса, которые уже приняли или отклонили
+        # уведомления, при повторной отправке на них запросы не отправляются
+        self._done_urls = OrderedDict()
+
+    @property
+    def urls(self) -> list:
+        return [
+            i for i in re.split(r'[\s,]+', self._get_setting('urls')) if i
+        ]
+
+    @property
+    def retries(self) -> int:
+        return self._get_setting('retries', lambda i: max(0, int(i)))
+
+    @property
+    def concurrency(self) -> int:
+        # При 0 запросы ждали бы семафор бесконечно
+        return self._get_setting('concurrency', lambda i: max(1, int(i)))
+
+    @property
+    def notice_timeout(self) -> float:
+        # Время на все попытки отправки с задержками между ними
+        retries = self.retries
+        return (
+            self._get_setting('timeout', float) * (retries + 1) +
+            self._get_setting('retry_delay', float) * (2 ** retries - 1)
+        )
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            concurrency = self.concurrency
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=concurrency)
+            )
+            self._semaphore = asyncio.Semaphore(concurrency)
+        return self._session
+
+    @staticmethod
+    def get_idempotency_key(notice_ids: list) -> str:
+        """
+        Ключ запроса (заголовок Idempotency-Key), одинаковый при повторных
+        отправках одних и тех же уведомлений
+        """
+        return hashlib.sha1('\n'.join(notice_ids).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def build_payload(data, warning, notice_ids: list = None) -> dict:
+        episodes = list(iter_episodes(data))
+        for episode in episodes:
+            # Серия может быть отправлена повторно (например, в составе
+            # другой пачки уведомлений), по id получатель может отбросить
+            # уже полученные серии
+            episode['id'] = (
+                f'{episode["site"]}:{episode["serial"]}:'
+                f'{episode["season"]}:{episode["episode"]}'
+            )
+
+        return {
+            'sent_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'notice_ids': notice_ids or [],
+            'episodes': episodes,
+            'warning': warning.strip(),
+        }
+
+    async def send_notice(self, data, warning,
+                          counter_action: UpdateCounterAction = None,
+                          notice_ids: list = None):
+        urls = self.urls
+        if not urls:
+            return
+
+        # Все серии одного обновления отправляются одним запросом
+        payload = self.build_payload(data, warning, notice_ids)
+        headers = {}
+        done = set()
+        if notice_ids:
+            key = self.get_idempotency_key(notice_ids)
+            headers['Idempotency-Key'] = key
+            done = self._get_done_urls(key)
+
+        urls = [i for i in urls if i not in done]
+        session = self._get_session()
+        results = await asyncio.gather(
+            *(self._deliver(session, url, payload, headers, done)
+              for url in urls),
+            return_exceptions=True
+        )
+
+        # Отправка повторяется, если хотя бы один адрес может принять
+        # уведомление позже
+        retry = any(
+            isinstance(e, Exception) and not isinstance(e, WebhookError)
+            for e in results
+        )
+        if notice_ids and not retry:
+            self._done_urls.pop(key, None)
+
+        errors = [
+            f'{url}: {type(e).__name__} {e}' for url, e in zip(urls, results)
+            if isinstance(e, Exception)
+        ]
+        if not errors:
+            return
+        if not retry:
+            raise WebhookError('; '.join(errors))
+        raise ConnectionError('; '.join(errors))
+
+    def _get_done_urls(self, key: str) -> set:
+        """
+        :param key: Idempotency-Key уведомлений
+        :return: адреса, которые уже приняли или отклонили уведомления
+        """
+        done = self._done_urls.setdefault(key, set())
+        self._done_urls.move_to_end(key)
+        if len(self._done_urls) > DONE_URLS_CACHE_SIZE:
+            self._done_urls.popitem(last=False)
+        return done
+
+    async def _deliver(self, session: aiohttp.ClientSession, url: str,
+                       payload: dict, headers: dict, done: set):
+        """
+        Отправляет уведомления на адрес и добавляет его в done, если
+        отправку на него повторять не нужно
+        """
+        try:
+            await self._post(session, url, payload, headers)
+        except WebhookError:
+            done.add(url)
+            raise
+        done.add(url)
+
+    async def _post(self, session: aiohttp.ClientSession, url: str,
+                    payload: dict, headers: dict):
+        timeout = self._get_setting('timeout', float)
+        retries = self.retries
+        delay = self._get_setting('retry_delay', float)
+
+        for attempt in range(retries + 1):
+            try:
+                async with self._semaphore:
+                    await self._request(
+                        session, url, payload, headers, timeout
+                    )
+                return
+            except (asyncio.CancelledError, WebhookError):
+                raise
+            except Exception:
+                if attempt == retries:
+                    raise
+
+            await asyncio.sleep(delay * 2 ** attempt)
+
+    @staticmethod
+    async def _request(session: aiohttp.ClientSession, url: str,
+                       payload: dict, headers: dict, timeout: float):
+        async with session.post(
+            url, json=payload, headers=headers,
+            timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as response:
+            await response.read()
+            # Повторяются только запросы, завершившиеся ошибкой сервера или
+            # превышением лимита запросов
+            if response.status >= 500 or response.status == 429:
+                raise aiohttp.ClientResponseError(
+                    response.request_info, response.history,
+                    status=response.status, message=response.reason
+                )
+            if response.status >= 400:
+                raise WebhookError(f'{response.status} {response.reason}')
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
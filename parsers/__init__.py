@@ -1 +0,0 @@
-from .parser import AsyncHtmlParser
\ No newline at end of file
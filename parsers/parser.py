@@ -2,6 +2,7 @@ from PyQt5 import QtCore
 from PyQt5.QtCore import Qt
 
 from parsers.services import parse_serial_page
+from profiling import profiler
 
 
 class AsyncHtmlParser(QtCore.QThread):
@@ -26,7 +27,8 @@ class AsyncHtmlParser(QtCore.QThread):
         self.start()
 
     def run(self):
-        serials_data, errors = parse_serial_page(self.data)
+        with profiler.thread_profile('AsyncHtmlParser'):
+            serials_data, errors = parse_serial_page(self.data)
         self.s_data_ready.emit(serials_data, errors)
 
         self.data.clear()
@@ -1,26 +1,29 @@
 """
 Реализация парсинга скаченых html страниц
-Парсеры страниц сайта должны выдает словари вида:
+Парсеры страниц сайта принимают разобранный lxml документ и должны выдает
+словари вида:
 {'Серия': [21], 'Сезон': 1}
 {'Серия': [12, 13], 'Сезон': 3}
 """
 import re
+import time
+import codecs
 import logging
+from functools import lru_cache
 from typing import Iterable, Union
 
 import lxml.html
 
 from enums import SupportedSites
+from instrumentation import instrumentation
 
 
-def filin(page):
+def filin(parser):
     """
     Извлекает c filin.tv текущую информацию о сезоне и сериях
     с переданного url
     P.S не отслеживает, если обновится целый сезон или несколько
     """
-    parser = lxml.html.fromstring(page)
-
     # Ищем сезон в заголовке названия сериала
     season = parser.cssselect('div.block div.mainf noindex a')[0].text
     season = re.findall('\(.{0,}-{0,1},{0,1}((\d+) сезон)', season, re.I)
@@ -56,9 +59,7 @@ def filin(page):
     return {'Серия': series, 'Сезон': int(season)}
 
 
-def seasonvar(page):
-    parser = lxml.html.fromstring(page)
-
+def seasonvar(parser):
     for i in parser.cssselect('div.svtabr_wrap.show.seasonlist h2'):
         try:  # Только у последнего сезона есть тег span
             data = i.cssselect('a')[0].text + i.cssselect('a span')[0].text
@@ -85,8 +86,7 @@ def seasonvar(page):
             return {'Серия': series, 'Сезон': season}
 
 
-def filmix(page):
-    parser = lxml.html.fromstring(page)
+def filmix(parser):
     data = parser.cssselect('.added-info')[0].text
     series = re.findall('([\d-]+) серия', data, re.IGNORECASE)
     season = re.findall('([\d-]+) сезон', data, re.IGNORECASE)
@@ -111,27 +111,77 @@ parsers = {
     SupportedSites.FILMIX.value: filmix
 }
 
+# Последовательности байтов, после получения которых (в указанном порядке)
+# на странице уже есть все данные нужные парсеру. Используются при потоковой
+# загрузке страниц, чтобы не скачивать страницу целиком. Для seasonvar
+# маркера нет, так как парсеру нужен весь список сезонов
+end_markers = {
+    SupportedSites.FILIN.value: (b'class="ssc"', b'</strong>'),
+    SupportedSites.FILMIX.value: (b'class="added-info"', b'<'),
+}
+
+
+@lru_cache(maxsize=None)
+def _get_html_parser(encoding: str) -> lxml.html.HTMLParser:
+    """
+    Возвращает lxml парсер, декодирующий страницы из указанной кодировки.
+    Если кодировка не указана или неизвестна, то lxml определит её сам
+    по мета тегам страницы
+    """
+    if encoding:
+        try:
+            codecs.lookup(encoding)
+        except LookupError:
+            logging.getLogger('serial-notifier').error(
+                f'Неизвестная кодировка "{encoding}", будет использовано '
+                f'автоопределение кодировки'
+            )
+            encoding = ''
+
+    return lxml.html.HTMLParser(encoding=encoding or None)
+
+
+def build_document(html_page: bytes, encoding: str = ''):
+    """
+    Разбирает сырую html страницу. Декодирование выполняется силами lxml,
+    без промежуточного преобразования страницы в str
+    :param html_page: содержимое страницы
+    :param encoding: кодировка страницы
+    """
+    return lxml.html.document_fromstring(
+        html_page, parser=_get_html_parser(encoding)
+    )
+
 
 def parse_serial_page(serial_raw_data: dict) -> Iterable[Union[dict, dict]]:
     """
     Вытаскивает с html страниц данные о последней вышешей серии
     :param serial_raw_data HTML страницы с информацией о сериалах
+    Пример:
+    {'filin': [['Вызов', 'http://filin.tv/vyzov.html', b'<html>...', 'cp1251']]}
     """
     result = {}
     errors = {}
     logger = logging.getLogger('serial-notifier')
+    timing = instrumentation.current
 
     for site_name, data in serial_raw_data.items():
+        started = time.perf_counter() if timing is not None else 0
         result[site_name] = {}
-        for serial_name, url, html_page in data:
+        for serial_name, url, html_page, encoding in data:
             try:
-                res = parsers[site_name](html_page)
+                res = parsers[site_name](build_document(html_page, encoding))
             except Exception:
                 message = f'Ошибка парсинга. {site_name}: {serial_name}'
                 errors[f'{site_name}_{serial_name}'] = [message]
                 logger.exception(message)
+                if timing is not None:
+                    timing.add_parse_error(site_name)
             else:
                 if res:
                     result[site_name][serial_name] = (url, res)
 
+        if timing is not None:
+            timing.add_parse_time(site_name, time.perf_counter() - started)
+
     return result, errors
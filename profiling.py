@@ -0,0 +1,279 @@
+"""
+Профилирование обновлений информации о новых сериях.
+
+Профилирование N следующих обновлений включается параметром cycles секции
+profiling конфига программы (при его изменении) или сигналом SIGUSR1
+(количество обновлений задается параметром signal_cycles).
+
+Во время профилируемого обновления:
+- для главного потока и рабочих потоков (AsyncHtmlParser, DbManager, Worker,
+  потоки БД и парсинга в режиме без GUI) собирается профиль cProfile. Потоки
+  подключаются к профилированию через profiler.thread_profile();
+- отдельный поток периодически снимает стеки этих потоков
+  (sys._current_frames), по которым строится flamegraph.
+
+После завершения последнего обновления в дирректорию с настройками
+сохраняются файлы profile-<время>.pstats (объединенный профиль всех потоков)
+и profile-<время>.collapsed (стеки в формате "поток;функция;функция
+количество", который принимают flamegraph.pl и speedscope).
+"""
+import cProfile
+import logging
+import pstats
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from os.path import join, basename
+
+from configs import resources_dir
+
+logger = logging.getLogger('serial-notifier')
+
+
+class StackSampler(threading.Thread):
+    """
+    Периодически снимает стеки отслеживаемых потоков
+    """
+    def __init__(self, interval: float):
+        """
+        :param interval: интервал между снятием стеков в секундах
+        """
+        super().__init__(name='profiling-sampler', daemon=True)
+        self.interval = interval
+        self.stacks = Counter()
+
+        # Идентификатор потока -> имя потока
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._paused = True
+
+    def add_thread(self, thread: threading.Thread, name: str = None):
+        with self._lock:
+            self._threads[thread.ident] = name or thread.name
+
+    def remove_thread(self, thread: threading.Thread):
+        with self._lock:
+            self._threads.pop(thread.ident, None)
+
+    def pause(self):
+        self._paused = True
+
+    def resume(self):
+        self._paused = False
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    @staticmethod
+    def _format_frame(frame) -> str:
+        code = frame.f_code
+        return (
+            f'{code.co_name} ({basename(code.co_filename)}:'
+            f'{code.co_firstlineno})'
+        )
+
+    def _sample(self):
+        with self._lock:
+            threads = dict(self._threads)
+
+        for ident, frame in sys._current_frames().items():
+            name = threads.get(ident)
+            if name is None:
+                continue
+
+            stack = []
+            while frame is not None:
+                stack.append(self._format_frame(frame))
+                frame = frame.f_back
+            stack.append(name)
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            if not self._paused:
+                self._sample()
+
+
+class RefreshProfiler:
+    """
+    Профилирует заданное количество следующих обновлений
+    """
+    def __init__(self):
+        # Количество обновлений, которые еще нужно профилировать
+        self.cycles_left = 0
+        self.cycle_active = False
+
+        self._conf_cycles = 0
+        self._main_profile: cProfile.Profile = None
+        self._profiles = []
+        self._sampler: StackSampler = None
+        self._lock = threading.Lock()
+
+    def request(self, cycles: int):
+        """
+        Включает профилирование следующих обновлений
+        :param cycles: количество профилируемых обновлений
+        """
+        if cycles <= 0:
+            return
+
+        self.cycles_left = max(self.cycles_left, cycles)
+        logger.info(f'Будут профилироваться следующие обновления: {cycles}')
+
+    def install_signal_handler(self, conf_program, loop=None):
+        """
+        Включает профилирование обновлений по сигналу SIGUSR1
+        :param conf_program: конфиг программы
+        :param loop: цикл событий asyncio, в котором обрабатывается сигнал
+        """
+        if not hasattr(signal, 'SIGUSR1'):
+            # Windows не поддерживает SIGUSR1
+            return
+
+        def handler(*args):
+            self.request(conf_program['profiling']['signal_cycles'])
+
+        try:
+            loop.add_signal_handler(signal.SIGUSR1, handler)
+        except (AttributeError, NotImplementedError):
+            # Цикл событий не передан или не поддерживает обработчики
+            # сигналов (quamash)
+            signal.signal(signal.SIGUSR1, handler)
+
+    def begin_cycle(self, profiling_conf: dict):
+        """
+        Начинает профилирование обновления, если оно включено. Вызывается
+        из главного потока
+        :param profiling_conf: секция profiling конфига программы
+        """
+        # Параметр cycles включает профилирование при запуске программы и при
+        # каждом его изменении
+        if profiling_conf['cycles'] != self._conf_cycles:
+            self._conf_cycles = profiling_conf['cycles']
+            self.request(self._conf_cycles)
+
+        if self.cycles_left <= 0 or self.cycle_active:
+            return
+
+        if self._sampler is None:
+            self._sampler = StackSampler(
+                profiling_conf['sampling_interval'] / 1000
+            )
+            self._sampler.start()
+
+        self._main_profile = self._create_profile()
+        self._sampler.add_thread(threading.current_thread())
+        self._sampler.resume()
+        self.cycle_active = True
+
+    def end_cycle(self):
+        """
+        Завершает профилирование обновления. После последнего профилируемого
+        обновления сохраняет результаты
+        """
+        if not self.cycle_active:
+            return
+
+        self.cycle_active = False
+        self._sampler.pause()
+        if self._main_profile is not None:
+            self._main_profile.disable()
+            self._add_profile(self._main_profile)
+            self._main_profile = None
+
+        self.cycles_left -= 1
+        if self.cycles_left <= 0:
+            self._save()
+
+    @contextmanager
+    def thread_profile(self, name: str = None):
+        """
+        Профилирует код, выполняемый в рабочем потоке во время
+        профилируемого обновления
+        :param name: имя потока в стеках, по умолчанию имя из threading (для
+        QThread оно не информативно: Dummy-N)
+        """
+        sampler = self._sampler
+        if not self.cycle_active or sampler is None:
+            yield
+            return
+
+        thread = threading.current_thread()
+        sampler.add_thread(thread, name)
+        profile = self._create_profile()
+        try:
+            yield
+        finally:
+            # Поток пула может простаивать до следующего задания
+            sampler.remove_thread(thread)
+            if profile is not None:
+                profile.disable()
+                self._add_profile(profile)
+
+    @staticmethod
+    def _create_profile():
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Начиная с python 3.12 одновременно может работать только один
+            # профилировщик, данные потока будут только в стеках
+            logger.debug(
+                f'Не удалось включить cProfile в потоке '
+                f'{threading.current_thread().name}'
+            )
+            return None
+        return profile
+
+    def _add_profile(self, profile: cProfile.Profile):
+        with self._lock:
+            self._profiles.append(profile)
+
+    def _save(self):
+        with self._lock:
+            profiles, self._profiles = self._profiles, []
+
+        self._sampler.stop()
+        stacks, self._sampler = self._sampler.stacks, None
+
+        name = join(
+            resources_dir, time.strftime('profile-%Y%m%d-%H%M%S')
+        )
+        saved = []
+
+        stats = None
+        for profile in profiles:
+            profile.create_stats()
+            if not profile.stats:
+                continue
+
+            if stats is None:
+                stats = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+
+        try:
+            if stats is not None:
+                stats.dump_stats(f'{name}.pstats')
+                saved.append(f'{name}.pstats')
+
+            if stacks:
+                with open(f'{name}.collapsed', 'w', encoding='utf-8') as out:
+                    for stack, count in stacks.most_common():
+                        out.write(f'{stack} {count}\n')
+                saved.append(f'{name}.collapsed')
+        except Exception:
+            logger.exception('Не удалось сохранить результаты профилирования')
+            return
+
+        logger.info(
+            f'Результаты профилирования сохранены: {", ".join(saved)}'
+        )
+
+
+profiler = RefreshProfiler()
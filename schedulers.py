@@ -6,10 +6,16 @@ import dependency_injector.providers as prv
 from PyQt5 import QtCore
 from PyQt5.QtCore import Qt, pyqtSignal
 
-from config_readers import SerialsUrls, ConfigsProgram
+import loggers
+from config_readers import ConfigsProgram
+from db.tracked_urls import SerialsUrls
 from enums import UpgradeState
-from downloaders import downloader, ThreadDownloader
-from parsers import AsyncHtmlParser
+from downloaders import get_downloader
+from instrumentation import (
+    instrumentation, STAGE_INIT, STAGE_FETCH, STAGE_PARSE, STAGE_DB
+)
+from parsers.parser import AsyncHtmlParser
+from profiling import profiler
 
 
 class DIServices(cnt.DeclarativeContainer):
@@ -44,9 +50,8 @@ class UpgradesScheduler(QtCore.QTimer):
         self.error_msgs: list = []
         self.urls_errors: dict = {}
 
-        self.downloader = downloader.get(
-            self.conf_program['downloader']['target_downloader'],
-            ThreadDownloader
+        self.downloader = get_downloader(
+            self.conf_program['downloader']['target_downloader']
         )()
         self.logger.info(
             f'Для скачивания данных используется '
@@ -82,6 +87,14 @@ class UpgradesScheduler(QtCore.QTimer):
 
             self.urls.read()
             self.conf_program.read()
+            loggers.reset_duplicate_filter()
+
+            timing = instrumentation.begin(
+                self.conf_program['metrics'], type_run
+            )
+            if timing is not None:
+                timing.start_stage(STAGE_INIT)
+            profiler.begin_cycle(self.conf_program['profiling'])
 
             self.downloader.start_download()
 
@@ -100,6 +113,11 @@ class UpgradesScheduler(QtCore.QTimer):
         self.error_msgs = error_msgs
         self.urls_errors = urls_errors
         self.downloader_state = status
+
+        timing = instrumentation.current
+        if timing is not None:
+            timing.next_stage(STAGE_FETCH, STAGE_PARSE)
+
         if status in (UpgradeState.CANCELLED, UpgradeState.ERROR):
             self.upgrade_db_complete(status, [], {})
         else:
@@ -118,6 +136,10 @@ class UpgradesScheduler(QtCore.QTimer):
         for serial, err_msgs in errors.items():
             self.urls_errors.setdefault(serial, list()).extend(err_msgs)
 
+        timing = instrumentation.current
+        if timing is not None:
+            timing.next_stage(STAGE_PARSE, STAGE_DB)
+
         self.db_manager.s_send_db_task.emit(
             lambda: self.db_manager.upgrade_db(serials_data)
         )
@@ -133,6 +155,11 @@ class UpgradesScheduler(QtCore.QTimer):
         if status < self.downloader_state:
             status = self.downloader_state
 
+        timing = instrumentation.current
+        if timing is not None:
+            timing.end_stage(STAGE_DB)
+            timing.add_db_inserted(serials_with_updates)
+
         type_run = self.flag_progress.get()
         self.error_msgs.extend(error_msgs)
         self.s_upgrade_complete.emit(
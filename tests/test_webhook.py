@@ -0,0 +1,217 @@
+"""
+Тесты плагина notice_webhook. Уведомления отправляются на локальный сервер
+aiohttp, который запоминает полученные запросы и отвечает заданными кодами.
+
+Запуск:
+    python -m unittest discover tests
+"""
+import asyncio
+import time
+import unittest
+from collections import defaultdict
+
+import dependency_injector.providers as prv
+from aiohttp import web
+
+import notice_plugins
+from notice_plugins.webhook import NoticeWebhook, WebhookError
+
+DATA = {
+    'filin': {
+        'Вызов': ('http://filin.tv/vyzov.html', {'Серия': [2, 3], 'Сезон': 1})
+    },
+    'seasonvar': {
+        'Мост': (
+            'http://seasonvar.ru/most.html', {'Серия': [7], 'Сезон': 2}
+        )
+    },
+}
+
+
+class Receiver:
+    """
+    Локальный сервер, принимающий уведомления
+    """
+    def __init__(self, delay: float = 0):
+        # Время обработки одного запроса в секундах
+        self.delay = delay
+        # Коды ответов для каждого пути, после того как они закончатся
+        # сервер отвечает 200
+        self.statuses = defaultdict(list)
+        # Путь -> список (время получения, Idempotency-Key, тело запроса)
+        self.requests = defaultdict(list)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+        self._runner: web.AppRunner = None
+        self.url = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/{name}', self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.url = f'http://{host}:{port}'
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            self.requests[request.path].append((
+                time.monotonic(), request.headers.get('Idempotency-Key'),
+                await request.json()
+            ))
+            if self.delay:
+                await asyncio.sleep(self.delay)
+
+            statuses = self.statuses[request.path]
+            return web.Response(status=statuses.pop(0) if statuses else 200)
+        finally:
+            self.in_flight -= 1
+
+
+class NoticeWebhookTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.receiver = Receiver()
+        self.plugin = None
+
+    def tearDown(self):
+        if self.plugin is not None:
+            self.loop.run_until_complete(self.plugin.close())
+        self.loop.run_until_complete(self.receiver.stop())
+        notice_plugins.DIServices.conf_program.reset_override()
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def create_plugin(self, paths, **settings) -> NoticeWebhook:
+        """
+        :param paths: пути на локальном сервере, на которые отправляются
+        уведомления
+        :param settings: настройки плагина
+        """
+        self.loop.run_until_complete(self.receiver.start())
+        settings.setdefault('retry_delay', '0.05')
+        settings['urls'] = ','.join(self.receiver.url + i for i in paths)
+        notice_plugins.DIServices.conf_program.override(
+            prv.Object({NoticeWebhook.name: settings})
+        )
+        self.plugin = NoticeWebhook()
+        return self.plugin
+
+    def send_notice(self, notice_ids=None):
+        self.loop.run_until_complete(
+            self.plugin.send_notice(DATA, '', notice_ids=notice_ids)
+        )
+
+    def test_one_post_per_endpoint(self):
+        self.create_plugin(['/first', '/second'])
+        self.send_notice()
+
+        self.assertEqual(
+            sorted(self.receiver.requests), ['/first', '/second']
+        )
+        for requests in self.receiver.requests.values():
+            self.assertEqual(len(requests), 1)
+            _, _, payload = requests[0]
+            self.assertEqual(
+                [(i['serial'], i['season'], i['episode'])
+                 for i in payload['episodes']],
+                [('Вызов', 1, 2), ('Вызов', 1, 3), ('Мост', 2, 7)]
+            )
+            self.assertEqual(
+                payload['episodes'][0]['id'], 'filin:Вызов:1:2'
+            )
+
+    def test_server_errors_are_retried_with_backoff(self):
+        self.create_plugin(['/hook'], retries='3', retry_delay='0.05')
+        self.receiver.statuses['/hook'] = [503, 429, 500]
+        self.send_notice()
+
+        received = [i for i, _, _ in self.receiver.requests['/hook']]
+        self.assertEqual(len(received), 4)
+        for attempt, (previous, current) in enumerate(
+                zip(received, received[1:])):
+            # Допуск на разрешение часов цикла событий
+            self.assertGreaterEqual(
+                current - previous, 0.05 * 2 ** attempt * 0.9
+            )
+
+    def test_notice_ids(self):
+        self.create_plugin(['/hook'])
+        self.receiver.statuses['/hook'] = [503]
+        self.send_notice(['first', 'second'])
+
+        requests = self.receiver.requests['/hook']
+        self.assertEqual(len(requests), 2)
+        # Повторный запрос отправляется с тем же ключом
+        self.assertEqual(
+            {key for _, key, _ in requests},
+            {NoticeWebhook.get_idempotency_key(['first', 'second'])}
+        )
+        for _, _, payload in requests:
+            self.assertEqual(payload['notice_ids'], ['first', 'second'])
+
+    def test_only_failed_endpoints_are_retried(self):
+        self.create_plugin(['/ok', '/flaky', '/rejected'], retries='0')
+        self.receiver.statuses['/flaky'] = [503]
+        self.receiver.statuses['/rejected'] = [400]
+
+        with self.assertRaises(ConnectionError):
+            self.send_notice(['first'])
+        # Повторная отправка тех же уведомлений (как это делает очередь
+        # notice_outbox)
+        self.send_notice(['first'])
+
+        self.assertEqual(len(self.receiver.requests['/ok']), 1)
+        self.assertEqual(len(self.receiver.requests['/flaky']), 2)
+        self.assertEqual(len(self.receiver.requests['/rejected']), 1)
+
+    def test_server_errors_after_all_retries(self):
+        self.create_plugin(['/hook'], retries='2')
+        self.receiver.statuses['/hook'] = [500] * 3
+
+        # Ошибка сервера не отменяет повторную отправку через очередь
+        with self.assertRaises(ConnectionError):
+            self.send_notice()
+        self.assertEqual(len(self.receiver.requests['/hook']), 3)
+
+    def test_client_errors_are_not_retried(self):
+        self.create_plugin(['/hook'], retries='3')
+        self.receiver.statuses['/hook'] = [404]
+
+        with self.assertRaises(WebhookError):
+            self.send_notice()
+        self.assertEqual(len(self.receiver.requests['/hook']), 1)
+
+    def test_invalid_concurrency(self):
+        self.create_plugin(['/first', '/second'], concurrency='0')
+        self.assertEqual(self.plugin.concurrency, 1)
+        self.send_notice()
+        self.assertEqual(sorted(self.receiver.requests), ['/first', '/second'])
+
+        self.plugin.conf_program[NoticeWebhook.name]['concurrency'] = 'many'
+        self.assertEqual(
+            self.plugin.concurrency,
+            int(NoticeWebhook.default_setting['concurrency'])
+        )
+
+    def test_concurrency_limit(self):
+        self.receiver.delay = 0.1
+        paths = [f'/hook{i}' for i in range(6)]
+        self.create_plugin(paths, concurrency='2')
+        self.send_notice()
+
+        self.assertEqual(sorted(self.receiver.requests), sorted(paths))
+        self.assertEqual(self.receiver.max_in_flight, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,10 +8,12 @@ import stat
 import sys
 from os.path import join, split, exists, dirname, abspath, realpath
 
+from update_head_revision import update_head_revision
+
 EXCLUDE = [
-    '.idea', '.git', 'tools', 'venv', '.gitignore', 'poetry.lock',
-    'pyproject.toml', 'README.md', 'setting.conf', 'sites.conf', 'log.txt',
-    'data-notifier.db'
+    '.idea', '.git', 'tools', 'benchmarks', 'venv', '.gitignore',
+    'poetry.lock', 'pyproject.toml', 'README.md', 'setting.conf', 'sites.conf',
+    'log.txt', 'data-notifier.db'
 ]
 MACOS_PACKAGE_DIRS = ['Contents/MacOS', 'Contents/Resources']
 BASE_DIR = dirname(abspath(__file__))
@@ -130,6 +132,10 @@ if exists(TARGET_PACKAGE_PATH):
     else:
         exit(0)
 
+# Фиксируем ревизию последней миграции, чтобы при запуске приложения
+# не загружать alembic, если БД актуальна
+print(f'Ревизия последней миграции: {update_head_revision()}')
+
 # Создаем каркас MacOS пакета
 os.mkdir(TARGET_PACKAGE_PATH)
 for i in MACOS_PACKAGE_DIRS:
@@ -0,0 +1,41 @@
+"""
+Записывает в db/revision.py ревизию последней миграции alembic. Скрипт нужно
+запускать после добавления новой миграции.
+"""
+import re
+from os.path import join, dirname, abspath, split
+
+from alembic.script import ScriptDirectory
+
+APP_ROOT_DIR = split(dirname(abspath(__file__)))[0]
+REVISION_FILE_PATH = join(APP_ROOT_DIR, 'db', 'revision.py')
+
+
+def get_head_revision() -> str:
+    script = ScriptDirectory(join(APP_ROOT_DIR, 'alembic'))
+    return script.get_current_head()
+
+
+def update_head_revision() -> str:
+    """
+    Обновляет HEAD_REVISION в db/revision.py
+    :return: ревизия последней миграции
+    """
+    head = get_head_revision()
+
+    with open(REVISION_FILE_PATH, encoding='utf-8') as f:
+        content = f.read()
+
+    content = re.sub(
+        r"^HEAD_REVISION = .*$", f"HEAD_REVISION = '{head}'", content,
+        flags=re.M
+    )
+
+    with open(REVISION_FILE_PATH, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+    return head
+
+
+if __name__ == '__main__':
+    print(f'HEAD_REVISION = {update_head_revision()}')